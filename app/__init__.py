@@ -1,13 +1,17 @@
 # app/__init__.py
 from flask import Flask
 from flask_login import LoginManager
-from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
 import os
 from .admin_routes import admin_bp
+from .models import db
 
 # Initialize extensions
-db = SQLAlchemy()
 login_manager = LoginManager()
+migrate = Migrate()
+
+# Versioned schema migrations (flask db upgrade / flask db migrate)
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
 
 def create_app(config_name='development'):
     app = Flask(__name__)
@@ -25,6 +29,7 @@ def create_app(config_name='development'):
 
     # Initialize extensions
     db.init_app(app)
+    migrate.init_app(app, db, directory=MIGRATIONS_DIR)
     login_manager.init_app(app)
     
     login_manager.login_view = 'login'
@@ -45,4 +50,13 @@ def create_app(config_name='development'):
     configure_admin_routes(app)
     configure_routes(app)
 
+    # Register CLI commands (flask model ...)
+    from .cli import register_commands
+    register_commands(app)
+
+    # Opt-in: pay the TensorFlow import and model load now rather than on the first prediction
+    if app.config['INFERENCE_WARMUP']:
+        from .inference import warm_up
+        warm_up(app)
+
     return app
\ No newline at end of file
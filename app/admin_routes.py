@@ -1,10 +1,16 @@
 # routes.py (or admin_routes.py if organized separately)
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
 from .models import Admin  # Import the Admin model
 from werkzeug.security import check_password_hash
-from .models import Admin, db,User,Patient,UserLogin
+from .models import Admin, db,User,Patient,PredictionJob,UserLogin,VolumeStudy
 from functools import wraps
-from .operations import change_admin_password
+from flask import current_app
+from .inference import check_for_model_update, get_registry, model_info
+from .operations import change_admin_password, generate_patient_statistics
+from datetime import datetime
+from .analytics import LOGINS, cached_analytics, mark_stale_days, parse_range
+from .stat_counters import USERS, aggregate_patient_counts, counter_value, increment_counters, merge_counts
+from .storage import BlobStore, PROFILE_PREFIX, release_files
 from sqlalchemy.exc import SQLAlchemyError
 
 # Define the blueprint
@@ -23,11 +29,73 @@ def admin_required(f):
 @admin_bp.route('/dashboard')
 @admin_required
 def dashboard():
-    total_patients = Patient.query.count()
-    total_users = User.query.count()
+    # Totals come from the maintained counters, not from counting the tables
+    prediction_stats = generate_patient_statistics()
+    total_patients = prediction_stats['total_patients']
+    total_users = counter_value(USERS)
     total_logs =  UserLogin.query.order_by(UserLogin.timestamp.desc()).limit(5).all()
 
-    return render_template('admin/dashboard.html', total_patients=total_patients,total_users = total_users,system_logs = total_logs)
+    registry = get_registry()
+    shadow_version = registry.shadow_version()
+    model_registry = {
+        'active': registry.active_version(),
+        'shadow': registry.shadow_stats(shadow_version) if shadow_version else None,
+    }
+
+    return render_template('admin/dashboard.html', total_patients=total_patients,total_users = total_users,system_logs = total_logs,
+                           model_registry=model_registry, prediction_stats=prediction_stats)
+
+@admin_bp.route('/statistics')
+@admin_required
+def statistics():
+    """Patient statistics aggregated from the stored predictions, as JSON.
+
+    Query parameters (all optional): tumor_type, model_version,
+    min_confidence / max_confidence (percent), date_from / date_to (YYYY-MM-DD).
+    """
+    try:
+        filters = {
+            'tumor_type': request.args.get('tumor_type'),
+            'model_version': request.args.get('model_version'),
+            'min_confidence': request.args.get('min_confidence', type=float),
+            'max_confidence': request.args.get('max_confidence', type=float),
+            'date_from': _date_arg('date_from'),
+            'date_to': _date_arg('date_to'),
+        }
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD.'}), 400
+    try:
+        return jsonify(generate_patient_statistics(**filters))
+    except SQLAlchemyError as e:
+        current_app.logger.error(f"Error in statistics: {str(e)}")
+        return jsonify({'error': 'Error loading statistics.'}), 500
+
+@admin_bp.route('/api/analytics')
+@admin_required
+def analytics_api():
+    """Chart series from the daily rollups, as JSON.
+
+    Query parameters (all optional): from / to (YYYY-MM-DD, default: the last
+    30 days), bucket ('day' or 'week'). Returns predictions per bucket and
+    tumor type, the users with the most predictions, and login success rates.
+    """
+    try:
+        date_from, date_to, bucket = parse_range(request.args, current_app.config['ANALYTICS_MAX_RANGE_DAYS'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        response = jsonify(cached_analytics(date_from, date_to, bucket))
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error in analytics_api: {str(e)}")
+        return jsonify({'error': 'Error loading analytics.'}), 500
+    response.cache_control.private = True
+    response.cache_control.max_age = int(current_app.config['ANALYTICS_CACHE_TTL'])
+    return response
+
+def _date_arg(name):
+    value = request.args.get(name)
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
 
 @admin_bp.route('/login', methods=['GET', 'POST'])
 def login():
@@ -101,7 +169,26 @@ def activate_user(user_id):
 @admin_required
 def delete_user(user_id):
     user = User.query.get_or_404(user_id)
+    release_files([path for path, in db.session.query(Patient.image_path).filter_by(user_id=user.id)])
+    release_files([path for path, in db.session.query(VolumeStudy.volume_path).join(Patient)
+                   .filter(Patient.user_id == user.id)])
+    if user.profile_image:
+        release_files([BlobStore(current_app.config['UPLOAD_FOLDERS']).file_path(user.profile_image, PROFILE_PREFIX)])
+    deltas = merge_counts(aggregate_patient_counts([Patient.user_id == user.id], sign=-1), {USERS: (-1, 0.0)})
+    mark_stale_days(day for day, in db.session.query(Patient.diagnosis_date).filter_by(user_id=user.id).distinct())
+    login_day = db.func.date(UserLogin.timestamp)
+    mark_stale_days((day for day, in db.session.query(login_day).filter(UserLogin.user_id == user.id).distinct()),
+                    LOGINS)
+    # The user's records go with the account, in the same transaction; deleted
+    # here rather than left to ON DELETE CASCADE, which SQLite only enforces
+    # with foreign keys turned on
+    patient_ids = db.session.query(Patient.id).filter_by(user_id=user.id)
+    VolumeStudy.query.filter(VolumeStudy.patient_id.in_(patient_ids.scalar_subquery())).delete(synchronize_session=False)
+    for model in (Patient, PredictionJob, UserLogin):
+        model.query.filter_by(user_id=user.id).delete(synchronize_session=False)
     db.session.delete(user)
+    # Applied once the records are gone: the minimum confidences are re-read
+    increment_counters(deltas)
     db.session.commit()
     flash(f"User {user.username} has been deleted.")
     return redirect(url_for('admin.list_users'))
@@ -219,6 +306,60 @@ def unlock_user(user_id):
     return redirect(url_for('admin.manage_logins'))
 
 
+
+@admin_bp.route('/models')
+@admin_required
+def list_models():
+    """Registered model versions, the served one and the shadow candidate's statistics."""
+    registry = get_registry()
+    shadow_version = registry.shadow_version()
+    return render_template('admin/models.html',
+                           versions=registry.versions(),
+                           active_version=registry.active_version(),
+                           shadow_version=shadow_version,
+                           shadow_stats=registry.shadow_stats(shadow_version) if shadow_version else None,
+                           serving=model_info())
+
+@admin_bp.route('/models/<version>/promote', methods=['POST'])
+@admin_required
+def promote_model(version):
+    """Serve a registered version; every worker swaps to it without a restart."""
+    try:
+        get_registry().promote(version)
+        check_for_model_update(current_app._get_current_object())
+        flash(f"Model {version} promoted. Workers switch within "
+              f"{current_app.config['MODEL_REGISTRY_CHECK_INTERVAL']:g} seconds.", "success")
+    except (ValueError, OSError) as e:
+        current_app.logger.error(f"Error in promote_model: {str(e)}")
+        flash(f"Could not promote model {version}.", "error")
+    return redirect(url_for('admin.list_models'))
+
+@admin_bp.route('/models/<version>/shadow', methods=['POST'])
+@admin_required
+def shadow_model(version):
+    """Score a sample of live traffic with a version in the background."""
+    try:
+        get_registry().set_shadow(version)
+        check_for_model_update(current_app._get_current_object())
+        flash(f"Model {version} is now evaluated in shadow mode.", "success")
+    except (ValueError, OSError) as e:
+        current_app.logger.error(f"Error in shadow_model: {str(e)}")
+        flash(f"Could not start shadow evaluation of {version}.", "error")
+    return redirect(url_for('admin.list_models'))
+
+@admin_bp.route('/models/shadow/stop', methods=['POST'])
+@admin_required
+def stop_shadow():
+    """End shadow evaluation."""
+    try:
+        get_registry().set_shadow(None)
+        check_for_model_update(current_app._get_current_object())
+        flash("Shadow evaluation stopped.", "success")
+    except OSError as e:
+        current_app.logger.error(f"Error in stop_shadow: {str(e)}")
+        flash("Could not stop shadow evaluation.", "error")
+    return redirect(url_for('admin.list_models'))
+
     
 def configure_admin_routes(app):
     app.register_blueprint(admin_bp)
@@ -0,0 +1,407 @@
+# Admin Analytics
+
+"""
+Time-bucketed Analytics over Daily Rollups
+
+The charts show predictions per day or week by tumor type, the prediction
+volume per user and the login success rate over arbitrary date ranges.
+Computing them from the raw rows would scan every patient record and login
+attempt in the range; they are summed from two rollup tables instead, with
+one row per day (and user and tumor type for predictions), so a two-year
+range reads a few thousand small rows.
+
+Refresh (`refresh_rollups`):
+- A day is always recomputed as a whole from its source rows, so a refresh
+  can be repeated without double counting
+- New source rows are found through a watermark, the highest id already
+  rolled up; the days of the rows above it are recomputed. The last
+  ANALYTICS_ROLLUP_OVERLAP ids below the watermark are re-read too, since a
+  transaction can commit after another one that received a higher id
+- Writers that delete or re-score existing patient records, or delete
+  login attempts, mark the days they changed stale (`mark_stale_days`) in
+  their own transaction
+- The watermarks and stale days are locked before the sources are read, so
+  a change committed meanwhile is either seen or left marked for the next
+  refresh
+- The rollups are built outside requests: at startup by run.py, or by
+  `flask stats rollup`. Once built, the API refreshes them at most every
+  ANALYTICS_REFRESH_INTERVAL seconds per worker, and caches each response
+  for ANALYTICS_CACHE_TTL seconds
+
+Prediction days are diagnosis dates; login days are UTC dates.
+
+Key Functionality:
+- refresh_rollups / rebuild_rollups: incremental refresh, full rebuild
+- mark_stale_days: for writers changing existing patient records or logins
+- parse_range / analytics: chart series for a date range, by day or ISO week
+- cached_analytics: the same behind a short-TTL cache
+
+"""
+
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from .models import db, LoginRollup, Patient, PredictionRollup, RollupStaleDay, RollupWatermark, User, UserLogin
+
+# Watermark (and rollup) names
+PREDICTIONS = 'predictions'
+LOGINS = 'logins'
+
+BUCKETS = ('day', 'week')
+
+# Users listed in the per-user volume
+TOP_USERS = 50
+
+# Days per recompute statement (bounds the IN list)
+DAY_CHUNK = 500
+
+# Tumor type of records without a prediction, in the rollup and in the series
+UNKNOWN = 'unknown'
+
+_cache_lock = threading.Lock()
+
+
+def mark_stale_days(days, rollup=PREDICTIONS):
+    """
+    Mark days whose rollup must be recomputed, in the caller's transaction
+
+    Args:
+        days (iterable): Diagnosis dates of deleted or re-scored patient records,
+            or (for LOGINS) UTC dates of deleted login attempts
+        rollup (str): PREDICTIONS or LOGINS
+    """
+    now = datetime.utcnow()
+    for day in sorted(set(_as_date(day) for day in days)):
+        marker = RollupStaleDay.query.filter_by(rollup=rollup, day=day)
+        # UPDATE first: it waits for a refresh holding the row, instead of skipping a marker it is deleting
+        if marker.update({'marked_at': now}, synchronize_session=False):
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.add(RollupStaleDay(rollup=rollup, day=day, marked_at=now))
+        except IntegrityError:
+            marker.update({'marked_at': now}, synchronize_session=False)
+
+
+def _as_date(value):
+    # DATE() of a timestamp is a string on SQLite and a date on MySQL
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _watermark(name):
+    watermark = RollupWatermark.query.filter_by(name=name).with_for_update().first()
+    if watermark is None:
+        watermark = RollupWatermark(name=name, last_id=0)
+        db.session.add(watermark)
+    return watermark
+
+
+def _recompute_predictions(days):
+    for start in range(0, len(days), DAY_CHUNK):
+        chunk = days[start:start + DAY_CHUNK]
+        PredictionRollup.query.filter(PredictionRollup.day.in_(chunk)).delete(synchronize_session=False)
+        counts = defaultdict(int)
+        for day, user_id, tumor_type, count in db.session.query(
+            Patient.diagnosis_date, Patient.user_id, Patient.tumor_type, db.func.count(Patient.id)
+        ).filter(Patient.diagnosis_date.in_(chunk)).group_by(
+            Patient.diagnosis_date, Patient.user_id, Patient.tumor_type
+        ):
+            counts[day, user_id, tumor_type or UNKNOWN] += count
+        db.session.bulk_insert_mappings(PredictionRollup, [
+            {'day': day, 'user_id': user_id, 'tumor_type': tumor_type, 'count': count}
+            for (day, user_id, tumor_type), count in counts.items()
+        ])
+
+
+def _recompute_logins(first_day, last_day):
+    LoginRollup.query.filter(LoginRollup.day.between(first_day, last_day)).delete(synchronize_session=False)
+    login_day = db.func.date(UserLogin.timestamp)
+    counts = defaultdict(lambda: [0, 0])
+    for day, success, count in db.session.query(login_day, UserLogin.success, db.func.count(UserLogin.id)).filter(
+        UserLogin.timestamp >= datetime.combine(first_day, datetime.min.time()),
+        UserLogin.timestamp < datetime.combine(last_day + timedelta(days=1), datetime.min.time())
+    ).group_by(login_day, UserLogin.success):
+        counts[_as_date(day)][0 if success else 1] += count
+    db.session.bulk_insert_mappings(LoginRollup, [
+        {'day': day, 'successes': successes, 'failures': failures}
+        for day, (successes, failures) in counts.items()
+    ])
+
+
+def _refresh_predictions(watermark, stale_days, overlap):
+    max_id = db.session.query(db.func.max(Patient.id)).scalar() or 0
+    days = set(stale_days)
+    if max_id > watermark.last_id:
+        days.update(day for day, in db.session.query(Patient.diagnosis_date).filter(
+            Patient.id > watermark.last_id - overlap).distinct())
+    _recompute_predictions(sorted(days))
+    watermark.last_id = max(watermark.last_id, max_id)
+    watermark.refreshed_at = datetime.utcnow()
+    return {'days': len(days), 'last_id': watermark.last_id}
+
+
+def _refresh_logins(watermark, stale_days, overlap):
+    max_id = db.session.query(db.func.max(UserLogin.id)).scalar() or 0
+    days = set(stale_days)
+    if max_id > watermark.last_id:
+        first, last = db.session.query(db.func.min(UserLogin.timestamp), db.func.max(UserLogin.timestamp)).filter(
+            UserLogin.id > watermark.last_id - overlap).one()
+        if first is not None:
+            days.update(first.date() + timedelta(days=i) for i in range((last.date() - first.date()).days + 1))
+    # One range query per run of consecutive days: timestamps are indexed, their dates are not
+    runs = []
+    for day in sorted(days):
+        if runs and day == runs[-1][1] + timedelta(days=1):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    for first_day, last_day in runs:
+        _recompute_logins(first_day, last_day)
+    watermark.last_id = max(watermark.last_id, max_id)
+    watermark.refreshed_at = datetime.utcnow()
+    return {'days': len(days), 'last_id': watermark.last_id}
+
+
+def refresh_rollups(overlap=None):
+    """
+    Fold new and changed source rows into the rollups, and commit
+
+    Args:
+        overlap (int): Ids below the watermark re-read for late commits
+            (default: ANALYTICS_ROLLUP_OVERLAP)
+
+    Returns:
+        dict: Per rollup, the number of recomputed days and the new watermark
+    """
+    if overlap is None:
+        overlap = current_app.config['ANALYTICS_ROLLUP_OVERLAP']
+    # Locks before any read: concurrent refreshes and writers marking stale days wait for this one
+    predictions = _watermark(PREDICTIONS)
+    logins = _watermark(LOGINS)
+    stale = RollupStaleDay.query.with_for_update().all()
+
+    report = {
+        PREDICTIONS: _refresh_predictions(predictions, [row.day for row in stale if row.rollup == PREDICTIONS],
+                                          overlap),
+        LOGINS: _refresh_logins(logins, [row.day for row in stale if row.rollup == LOGINS], overlap),
+    }
+    for row in stale:
+        db.session.delete(row)
+    db.session.commit()
+    return report
+
+
+def rebuild_rollups():
+    """
+    Recompute both rollups from scratch (after a restore or manual SQL on the sources)
+
+    Returns:
+        dict: Report of the refresh that rebuilt them
+    """
+    _watermark(PREDICTIONS).last_id = 0
+    _watermark(LOGINS).last_id = 0
+    PredictionRollup.query.delete(synchronize_session=False)
+    LoginRollup.query.delete(synchronize_session=False)
+    return refresh_rollups(overlap=0)
+
+
+def rollups_built():
+    """True once a refresh has run: requests only refresh rollups that exist, never build them."""
+    return db.session.query(RollupWatermark.refreshed_at).filter_by(name=PREDICTIONS).scalar() is not None
+
+
+def parse_range(args, max_days):
+    """
+    Read the date range and bucket of an analytics request
+
+    Args:
+        args: Query parameters `from`, `to` (YYYY-MM-DD, default: the 30 days up to today, UTC)
+            and `bucket` ('day' or 'week', default 'day')
+        max_days (int): Longest range accepted
+
+    Returns:
+        tuple: (date_from, date_to, bucket)
+
+    Raises:
+        ValueError: On a malformed date, an empty or too long range, or an unknown bucket
+    """
+    try:
+        date_to = date.fromisoformat(args['to']) if args.get('to') else datetime.utcnow().date()
+        date_from = date.fromisoformat(args['from']) if args.get('from') else date_to - timedelta(days=29)
+    except ValueError:
+        raise ValueError('Dates must be YYYY-MM-DD.')
+    bucket = args.get('bucket') or 'day'
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}.")
+    if date_from > date_to:
+        raise ValueError("'from' must not be after 'to'.")
+    if (date_to - date_from).days + 1 > max_days:
+        raise ValueError(f"Ranges are limited to {max_days} days.")
+    return date_from, date_to, bucket
+
+
+def _bucket_start(day, bucket):
+    return day - timedelta(days=day.weekday()) if bucket == 'week' else day
+
+
+def _labels(date_from, date_to, bucket):
+    step = timedelta(days=7 if bucket == 'week' else 1)
+    day = _bucket_start(date_from, bucket)
+    labels = []
+    while day <= date_to:
+        labels.append(day.isoformat())
+        day += step
+    return labels
+
+
+def analytics(date_from, date_to, bucket='day'):
+    """
+    Chart series for a date range, summed from the rollups
+
+    Args:
+        date_from (date): First day
+        date_to (date): Last day
+        bucket (str): 'day', or 'week' (ISO weeks, labelled by their Monday)
+
+    Returns:
+        dict: range; predictions (bucket labels, a series per tumor type, total);
+            the users with the most predictions; the login successes, failures
+            and success rate per bucket
+    """
+    labels = _labels(date_from, date_to, bucket)
+    position = {label: i for i, label in enumerate(labels)}
+
+    def slot(day):
+        return position[_bucket_start(day, bucket).isoformat()]
+
+    series = {}
+    for day, tumor_type, count in db.session.query(
+        PredictionRollup.day, PredictionRollup.tumor_type, db.func.sum(PredictionRollup.count)
+    ).filter(PredictionRollup.day.between(date_from, date_to)).group_by(
+        PredictionRollup.day, PredictionRollup.tumor_type
+    ):
+        series.setdefault(tumor_type, [0] * len(labels))[slot(day)] += int(count)
+
+    result = {
+        'range': {'from': date_from.isoformat(), 'to': date_to.isoformat(), 'bucket': bucket},
+        'predictions': {'buckets': labels, 'series': series,
+                        'total': sum(sum(values) for values in series.values())},
+    }
+
+    volume = db.func.sum(PredictionRollup.count)
+    result['users'] = [
+        {'user_id': uid, 'username': username, 'predictions': int(count)}
+        for uid, username, count in db.session.query(PredictionRollup.user_id, User.username, volume)
+        .join(User, User.id == PredictionRollup.user_id)
+        .filter(PredictionRollup.day.between(date_from, date_to))
+        .group_by(PredictionRollup.user_id, User.username)
+        .order_by(volume.desc()).limit(TOP_USERS)
+    ]
+
+    successes = [0] * len(labels)
+    failures = [0] * len(labels)
+    for row in LoginRollup.query.filter(LoginRollup.day.between(date_from, date_to)):
+        successes[slot(row.day)] += row.successes
+        failures[slot(row.day)] += row.failures
+    result['logins'] = {
+        'buckets': labels,
+        'successes': successes,
+        'failures': failures,
+        'success_rate': [round(ok / (ok + failed), 4) if ok + failed else None
+                         for ok, failed in zip(successes, failures)],
+    }
+    return result
+
+
+class AnalyticsCache:
+    """
+    Analytics responses kept for a few seconds, and the per-worker refresh schedule
+
+    Attributes:
+    - ttl: Seconds a response is served from the cache
+    - refresh_interval: Minimum seconds between two rollup refreshes of this worker
+    """
+
+    def __init__(self, ttl, refresh_interval, max_entries=256):
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._next_refresh = 0.0
+
+    def get(self, key):
+        """Cached response for a key, or None if absent or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            return entry[1]
+
+    def put(self, key, value):
+        """Cache a response for `ttl` seconds, evicting the oldest entries beyond `max_entries`."""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def refresh_due(self):
+        """True at most once per `refresh_interval`: the caller then refreshes the rollups."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next_refresh:
+                return False
+            self._next_refresh = now + self.refresh_interval
+            return True
+
+    def clear(self):
+        """Drop every cached response and refresh on the next miss."""
+        with self._lock:
+            self._entries.clear()
+            self._next_refresh = 0.0
+
+
+def get_analytics_cache(app=None):
+    """
+    Return the analytics cache of an application, creating it on first use
+
+    Args:
+        app: Flask application; defaults to the current app
+
+    Returns:
+        AnalyticsCache: Cache with ANALYTICS_CACHE_TTL and ANALYTICS_REFRESH_INTERVAL
+    """
+    app = app or current_app._get_current_object()
+    cache = app.extensions.get('analytics_cache')
+    if cache is None:
+        with _cache_lock:
+            cache = app.extensions.setdefault('analytics_cache', AnalyticsCache(
+                app.config['ANALYTICS_CACHE_TTL'], app.config['ANALYTICS_REFRESH_INTERVAL']))
+    return cache
+
+
+def cached_analytics(date_from, date_to, bucket='day'):
+    """
+    `analytics` behind the short-TTL cache, refreshing built rollups first when due
+
+    Returns:
+        dict: Output of `analytics`
+    """
+    cache = get_analytics_cache()
+    key = (date_from, date_to, bucket)
+    result = cache.get(key)
+    if result is None:
+        if cache.refresh_due() and rollups_built():
+            refresh_rollups()
+        result = analytics(date_from, date_to, bucket)
+        cache.put(key, result)
+    return result
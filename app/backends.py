@@ -0,0 +1,215 @@
+# Inference Backends for the Tumor Classifier
+
+"""
+Pluggable Model Runtimes
+
+The same classifier can be served from the original Keras `.h5` file or
+from TFLite / ONNX exports of it. Every backend exposes the same
+`predict(batch)` contract, so the rest of the application does not care
+which runtime is active.
+
+Available Backends:
+- keras: Full TensorFlow/Keras runtime (default)
+- tflite: TFLite interpreter (`tflite_runtime` if installed, else `tf.lite`)
+- onnx: ONNX Runtime CPU session (requires the `onnxruntime` package)
+
+The runtime is selected with INFERENCE_BACKEND in app/config.py; each
+backend reads its artifact from MODEL_PATH, TFLITE_MODEL_PATH or
+ONNX_MODEL_PATH respectively. Thread pool sizes come from the runtime
+profile (see app/runtime.py).
+
+"""
+
+import threading
+
+import numpy as np
+
+# Spatial input size the classifier was trained on
+INPUT_SHAPE = (150, 150, 3)
+
+
+class InferenceBackend:
+    """
+    Common interface of all model runtimes
+
+    Attributes:
+    - name: Backend identifier used in configuration
+    - model_path: Artifact the backend was loaded from
+    - intra_op_threads: Threads used inside one op (0 = runtime default)
+    - inter_op_threads: Ops run concurrently (0 = runtime default)
+    """
+    name = None
+
+    def __init__(self, model_path, intra_op_threads=0, inter_op_threads=0):
+        self.model_path = model_path
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+
+    def predict(self, batch):
+        """
+        Run a forward pass
+
+        Args:
+            batch (np.ndarray): Float32 images of shape (N, 150, 150, 3) in [0, 1]
+
+        Returns:
+            np.ndarray: Class probabilities of shape (N, 4)
+        """
+        raise NotImplementedError
+
+
+class KerasBackend(InferenceBackend):
+    """
+    Serve the original Keras model through a compiled forward function
+
+    `model.predict` builds a data adapter, callback list and step loop on
+    every call, which dominates the cost of a 1-image batch. Instead the
+    model is wrapped in a `tf.function` with a fixed (None, 150, 150, 3)
+    float32 signature, traced once when the backend loads and reused for
+    every request and every batch size.
+
+    TensorFlow's thread pools are process-wide and can only be sized before
+    the runtime initializes, i.e. before the first model in the process loads.
+    """
+    name = 'keras'
+
+    def __init__(self, model_path, intra_op_threads=0, inter_op_threads=0):
+        super().__init__(model_path, intra_op_threads, inter_op_threads)
+        import tensorflow as tf
+        try:
+            if intra_op_threads:
+                tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+            if inter_op_threads:
+                tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+        except RuntimeError:
+            print("Warning: TensorFlow runtime already initialized; thread settings ignored")
+        self.model = tf.keras.models.load_model(model_path)
+        self._forward = tf.function(
+            lambda images: self.model(images, training=False),
+            input_signature=[tf.TensorSpec((None,) + INPUT_SHAPE, tf.float32)],
+        )
+        self._forward.get_concrete_function()  # trace now, not on the first request
+        self._to_tensor = tf.convert_to_tensor
+
+    def predict(self, batch):
+        return self._forward(self._to_tensor(batch, dtype='float32')).numpy()
+
+
+class TFLiteBackend(InferenceBackend):
+    """
+    Serve a TFLite export of the model
+
+    The interpreter is not thread-safe, so calls are serialized; the input
+    tensor is resized when the batch size changes. Fully integer-quantized
+    models (int8/uint8 input or output tensors) are fed and read through
+    their quantization parameters, so callers always exchange float32.
+    """
+    name = 'tflite'
+
+    def __init__(self, model_path, intra_op_threads=0, inter_op_threads=0):
+        super().__init__(model_path, intra_op_threads, inter_op_threads)
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+        self.interpreter = Interpreter(model_path=model_path, num_threads=intra_op_threads or None)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self._input['shape'][0])
+        self._lock = threading.Lock()
+
+    def predict(self, batch):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        with self._lock:
+            if len(batch) != self._batch_size:
+                self.interpreter.resize_tensor_input(self._input['index'], batch.shape)
+                self.interpreter.allocate_tensors()
+                self._input = self.interpreter.get_input_details()[0]
+                self._output = self.interpreter.get_output_details()[0]
+                self._batch_size = len(batch)
+            self.interpreter.set_tensor(self._input['index'], self._quantize(batch, self._input))
+            self.interpreter.invoke()
+            return self._dequantize(self.interpreter.get_tensor(self._output['index']), self._output)
+
+    @staticmethod
+    def _quantize(values, details):
+        dtype = details['dtype']
+        if dtype == np.float32:
+            return values
+        scale, zero_point = details['quantization']
+        info = np.iinfo(dtype)
+        return np.clip(np.round(values / scale + zero_point), info.min, info.max).astype(dtype)
+
+    @staticmethod
+    def _dequantize(values, details):
+        if details['dtype'] == np.float32:
+            return values.copy()
+        scale, zero_point = details['quantization']
+        return (values.astype(np.float32) - zero_point) * scale
+
+
+class OnnxBackend(InferenceBackend):
+    """Serve an ONNX export of the model with ONNX Runtime on CPU."""
+    name = 'onnx'
+
+    def __init__(self, model_path, intra_op_threads=0, inter_op_threads=0):
+        super().__init__(model_path, intra_op_threads, inter_op_threads)
+        try:
+            import onnxruntime
+        except ImportError:
+            raise RuntimeError("The 'onnx' inference backend requires the onnxruntime package")
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        self.session = onnxruntime.InferenceSession(model_path, sess_options=options,
+                                                    providers=['CPUExecutionProvider'])
+        self._input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        return self.session.run(None, {self._input_name: batch})[0]
+
+
+BACKENDS = {backend.name: backend for backend in (KerasBackend, TFLiteBackend, OnnxBackend)}
+
+# Config key holding the artifact path of each backend
+MODEL_PATH_KEYS = {
+    'keras': 'MODEL_PATH',
+    'tflite': 'TFLITE_MODEL_PATH',
+    'onnx': 'ONNX_MODEL_PATH',
+}
+
+
+def load_backend(name, model_path, intra_op_threads=0, inter_op_threads=0):
+    """
+    Instantiate a backend by name
+
+    Args:
+        name (str): One of `BACKENDS`
+        model_path (str): Artifact to load
+        intra_op_threads (int): Threads used inside one op (0 = runtime default)
+        inter_op_threads (int): Ops run concurrently (0 = runtime default)
+
+    Returns:
+        InferenceBackend: The loaded backend
+    """
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown inference backend '{name}'; choose one of {sorted(BACKENDS)}")
+    return backend_class(model_path, intra_op_threads, inter_op_threads)
+
+
+def backend_model_path(config, name=None):
+    """
+    Artifact path of a backend according to the app config
+
+    Args:
+        config: Flask config mapping
+        name (str, optional): Backend name; defaults to INFERENCE_BACKEND
+
+    Returns:
+        str: Path of the model artifact
+    """
+    return config[MODEL_PATH_KEYS[name or config['INFERENCE_BACKEND']]]
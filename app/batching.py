@@ -0,0 +1,207 @@
+# Dynamic Micro-Batching for Model Inference
+
+"""
+In-process Micro-Batching Scheduler
+
+Collects concurrent single-image prediction requests into one batch so the
+model runs a single forward pass for many requests instead of one pass per
+request.
+
+Key Functionality:
+- Bounded batch size and bounded wait window per batch
+- Per-request futures so each caller receives only its own result row
+- Queue depth, batch-size histogram and queue wait statistics for tuning
+- Graceful close that finishes every queued request (used on model hot-swap)
+
+"""
+
+import threading
+import time
+import queue
+from collections import Counter, deque
+from concurrent.futures import Future
+
+import numpy as np
+
+# Queued by `close` to tell the worker thread to drain and exit
+_STOP = object()
+
+
+class _PendingRequest:
+    """A single queued input together with the future its caller waits on."""
+
+    __slots__ = ('array', 'future', 'enqueued_at')
+
+    def __init__(self, array):
+        self.array = array
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    Groups concurrent inference requests into batches
+
+    A single background thread owns the model call. It blocks for the first
+    queued request, then keeps collecting until either `max_batch_size`
+    requests are queued or `max_wait_ms` has elapsed since the first one
+    arrived, and runs `predict_fn` once on the stacked inputs.
+
+    Attributes:
+    - predict_fn: Callable taking an (N, ...) array and returning (N, ...) rows
+    - max_batch_size: Upper bound on rows per forward pass
+    - max_wait_ms: Longest time the first request of a batch waits for company
+    """
+
+    def __init__(self, predict_fn, max_batch_size=8, max_wait_ms=5, stats_window=1000):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._wait_times = deque(maxlen=stats_window)
+        self._requests = 0
+        self._batches = 0
+        self._errors = 0
+
+        # Guards the switch to inline execution once the worker has stopped
+        self._submit_lock = threading.Lock()
+        self._closing = False
+        self._stopped = False
+
+        self._worker = threading.Thread(target=self._run, name='inference-batcher', daemon=True)
+        self._worker.start()
+
+    def submit(self, array):
+        """
+        Queue one input row for the next batch
+
+        Args:
+            array (np.ndarray): A single model input without the batch axis
+
+        Returns:
+            Future: Resolves to the model output row for this input
+        """
+        request = _PendingRequest(array)
+        with self._submit_lock:
+            if not self._stopped:
+                self._queue.put(request)
+                return request.future
+        # Closed: a caller that picked this batcher just before a swap still gets an answer
+        self._execute([request])
+        return request.future
+
+    def predict(self, array, timeout=None):
+        """
+        Queue one input row and block until its output row is ready
+
+        Args:
+            array (np.ndarray): A single model input without the batch axis
+            timeout (float, optional): Seconds to wait for the result
+
+        Returns:
+            np.ndarray: The model output row for this input
+        """
+        return self.submit(array).result(timeout=timeout)
+
+    def close(self):
+        """
+        Stop the worker thread after every already queued request is answered
+
+        Requests submitted afterwards run inline in the caller's thread.
+        """
+        self._queue.put(_STOP)
+
+    def _collect(self):
+        """Block for the first request, then gather more until full or timed out."""
+        first = self._queue.get()
+        if first is _STOP:
+            self._closing = True
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    request = self._queue.get_nowait()
+                else:
+                    request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is _STOP:
+                self._closing = True
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while not self._closing:
+            batch = self._collect()
+            if batch:
+                self._execute(batch)
+
+        with self._submit_lock:
+            self._stopped = True
+        leftovers = []
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is not _STOP:
+                leftovers.append(request)
+        for start in range(0, len(leftovers), self.max_batch_size):
+            self._execute(leftovers[start:start + self.max_batch_size])
+
+    def _execute(self, batch):
+        started = time.perf_counter()
+        try:
+            outputs = self.predict_fn(np.stack([request.array for request in batch]))
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            self._record(batch, started, failed=True)
+            return
+
+        for request, row in zip(batch, outputs):
+            request.future.set_result(row)
+        self._record(batch, started)
+
+    def _record(self, batch, started, failed=False):
+        with self._stats_lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._batch_sizes[len(batch)] += 1
+            if failed:
+                self._errors += 1
+            for request in batch:
+                self._wait_times.append((started - request.enqueued_at) * 1000.0)
+
+    def stats(self):
+        """
+        Snapshot of scheduler metrics
+
+        Returns:
+            dict: Queue depth, batch-size histogram and queue wait percentiles (ms)
+        """
+        with self._stats_lock:
+            waits = np.array(self._wait_times) if self._wait_times else None
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'queue_depth': self._queue.qsize(),
+                'requests': self._requests,
+                'batches': self._batches,
+                'errors': self._errors,
+                'mean_batch_size': round(self._requests / self._batches, 2) if self._batches else 0.0,
+                'batch_size_histogram': {str(size): count for size, count in sorted(self._batch_sizes.items())},
+                'wait_ms': {
+                    'p50': round(float(np.percentile(waits, 50)), 3),
+                    'p95': round(float(np.percentile(waits, 95)), 3),
+                    'p99': round(float(np.percentile(waits, 99)), 3),
+                    'max': round(float(waits.max()), 3),
+                } if waits is not None else None,
+            }
@@ -0,0 +1,447 @@
+# Inference Benchmark Suite
+
+"""
+Latency and Throughput Benchmarks for the Prediction Path
+
+Measures the stages of a prediction in isolation so tuning changes can be
+compared with numbers instead of guesswork.
+
+Stages:
+- decode: JPEG/PNG bytes to a decoded PIL image (draft-mode for large JPEGs)
+- resize_normalize: decoded image to the (150, 150, 3) float32 model input
+- forward: one backend forward pass over a preprocessed batch
+- end_to_end: bytes to class probabilities (decode_batch + forward)
+
+Every stage reports p50/p95/p99 latency per call and images/sec. The
+forward and end-to-end stages are swept over batch sizes; TensorFlow
+thread settings can only be applied before the runtime starts, so each
+thread setting is measured in a fresh process. Results are JSON, tagged
+with the model version and git commit, so runs can be diffed.
+
+The runtime sweep drives the serving path (`predict_image_bytes`: micro-
+batcher plus backend, cache disabled) from several concurrent worker
+processes per runtime profile, to find the workers x threads combination
+with the best throughput on the current host.
+
+Usage:
+    flask bench run --images DIR --batch-size 1 --batch-size 8 --threads 1:1 --threads 4:2 -o out.json
+    flask bench diff old.json new.json
+    flask bench sweep --workers 1 --workers 2 --workers 4 --threads 1 --threads 2 --threads 4
+
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+from .backends import MODEL_PATH_KEYS, load_backend
+from .model_tools import find_images
+from .prediction_cache import model_version
+from .preprocessing import decode_batch, fit_into, new_batch, open_image
+
+
+def synthetic_images(count, size=(512, 512), seed=0):
+    """
+    Generate JPEG scans with MRI-like smooth structure plus noise
+
+    Args:
+        count (int): Number of images
+        size (tuple): Width and height in pixels
+        seed (int): Random seed, so runs are comparable
+
+    Returns:
+        list: JPEG-encoded bytes
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    y, x = np.mgrid[0:height, 0:width]
+    images = []
+    for _ in range(count):
+        cx, cy, radius = rng.uniform(0.3, 0.7) * width, rng.uniform(0.3, 0.7) * height, rng.uniform(0.2, 0.4) * width
+        disc = np.clip(1.0 - np.hypot(x - cx, y - cy) / radius, 0, 1) * 200
+        pixels = np.clip(disc + rng.normal(0, 12, (height, width)), 0, 255).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels, 'L').convert('RGB').save(buffer, 'JPEG', quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def load_image_set(directory, limit=None):
+    """
+    Read the raw bytes of the images under a directory
+
+    Args:
+        directory (str): Image directory (searched recursively)
+        limit (int, optional): Maximum number of images
+
+    Returns:
+        list: Raw image bytes
+    """
+    payloads = []
+    for path in find_images(directory, limit):
+        with open(path, 'rb') as f:
+            payloads.append(f.read())
+    return payloads
+
+
+def summarize(latencies_ms, images_per_call=1):
+    """
+    Latency percentiles and throughput of a list of per-call timings
+
+    Args:
+        latencies_ms (list): Per-call latency in milliseconds
+        images_per_call (int): Images processed by each call
+
+    Returns:
+        dict: calls, p50/p95/p99/mean latency (ms) and images/sec
+    """
+    latencies = np.asarray(latencies_ms)
+    return {
+        'calls': int(len(latencies)),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+        'mean_ms': round(float(latencies.mean()), 3),
+        'images_per_sec': round(images_per_call * len(latencies) / (latencies.sum() / 1000.0), 2),
+    }
+
+
+def _timed(call, inputs, repeats):
+    latencies = []
+    for _ in range(repeats):
+        for item in inputs:
+            started = time.perf_counter()
+            call(item)
+            latencies.append((time.perf_counter() - started) * 1000.0)
+    return latencies
+
+
+def _decode(data):
+    img = open_image(data)
+    img.load()
+    return img
+
+
+def bench_preprocessing(payloads, repeats=3):
+    """
+    Time the decode and resize/normalize stages separately
+
+    Args:
+        payloads (list): Raw image bytes
+        repeats (int): Passes over the image set
+
+    Returns:
+        dict: `summarize` results for 'decode' and 'resize_normalize'
+    """
+    decoded = [_decode(data) for data in payloads]
+    out = new_batch(1)[0]
+    return {
+        'decode': summarize(_timed(_decode, payloads, repeats)),
+        'resize_normalize': summarize(_timed(lambda img: fit_into(img, out), decoded, repeats)),
+    }
+
+
+def bench_inference(backend, payloads, batch_sizes, repeats=3):
+    """
+    Time the forward pass and the end-to-end path for several batch sizes
+
+    Args:
+        backend (InferenceBackend): Loaded backend
+        payloads (list): Raw image bytes
+        batch_sizes (iterable): Batch sizes to sweep
+        repeats (int): Passes over the image set
+
+    Returns:
+        dict: 'forward' and 'end_to_end' results keyed by batch size
+    """
+    inputs = decode_batch(payloads)
+    results = {'forward': {}, 'end_to_end': {}}
+    for batch_size in batch_sizes:
+        batches = [inputs[i:i + batch_size] for i in range(0, len(inputs) - batch_size + 1, batch_size)]
+        raw_batches = [payloads[i:i + batch_size] for i in range(0, len(payloads) - batch_size + 1, batch_size)]
+        if not batches:
+            continue
+        backend.predict(batches[0])  # warm-up (and retrace/reallocate for a new batch size)
+        results['forward'][str(batch_size)] = summarize(
+            _timed(backend.predict, batches, repeats), batch_size)
+        results['end_to_end'][str(batch_size)] = summarize(
+            _timed(lambda raw: backend.predict(decode_batch(raw)), raw_batches, repeats),
+            batch_size)
+    return results
+
+
+def run_single(backend_name, model_path, payloads, batch_sizes, intra_op, inter_op, repeats=3):
+    """
+    Benchmark every stage under one thread setting in the current process
+
+    Args:
+        backend_name (str): Inference backend
+        model_path (str): Artifact of the backend
+        payloads (list): Raw image bytes
+        batch_sizes (iterable): Batch sizes for the forward and end-to-end stages
+        intra_op (int): TensorFlow intra-op threads (0 = default)
+        inter_op (int): TensorFlow inter-op threads (0 = default)
+        repeats (int): Passes over the image set
+
+    Returns:
+        dict: Thread setting plus the results of every stage
+    """
+    backend = load_backend(backend_name, model_path, intra_op, inter_op)
+    stages = bench_preprocessing(payloads, repeats)
+    stages.update(bench_inference(backend, payloads, batch_sizes, repeats))
+    return {'threads': {'intra_op': intra_op, 'inter_op': inter_op}, 'stages': stages}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(backend_name, model_path, images_dir=None, synthetic=64, batch_sizes=(1, 8),
+              thread_settings=((0, 0),), repeats=3, limit=None):
+    """
+    Run the full sweep, one fresh process per thread setting
+
+    Args:
+        backend_name (str): Inference backend
+        model_path (str): Artifact of the backend
+        images_dir (str, optional): Image set to use; synthetic images otherwise
+        synthetic (int): Number of synthetic images when no directory is given
+        batch_sizes (iterable): Batch sizes to sweep
+        thread_settings (iterable): (intra_op, inter_op) pairs to sweep
+        repeats (int): Passes over the image set per stage
+        limit (int, optional): Maximum images read from `images_dir`
+
+    Returns:
+        dict: Run metadata and one result per thread setting
+    """
+    runs = []
+    for intra_op, inter_op in thread_settings:
+        command = [sys.executable, '-m', 'app.benchmark', 'stages', '--backend', backend_name, '--model', model_path,
+                   '--batch-sizes', ','.join(map(str, batch_sizes)), '--intra-op', str(intra_op),
+                   '--inter-op', str(inter_op), '--repeats', str(repeats)]
+        if images_dir:
+            command += ['--images', images_dir] + (['--limit', str(limit)] if limit else [])
+        else:
+            command += ['--synthetic', str(synthetic)]
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    meta = _run_metadata(backend_name, model_path, images_dir, synthetic)
+    meta.update({'batch_sizes': list(batch_sizes), 'repeats': repeats})
+    return {'meta': meta, 'runs': runs}
+
+
+def _run_metadata(backend_name, model_path, images_dir, synthetic):
+    return {
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'git_commit': _git_commit(),
+        'backend': backend_name,
+        'model_path': model_path,
+        'model_version': model_version(model_path),
+        'images': images_dir or f'synthetic:{synthetic}',
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def drive_predict_path(payloads, seconds, concurrency=1):
+    """
+    Closed-loop load on `predict_image_bytes` in this process, as one serving worker
+
+    The app is built from the environment (so the INFERENCE_* runtime
+    profile applies) with the prediction cache disabled. After loading the
+    model the worker prints 'ready' and waits for a line on stdin, so all
+    workers of a sweep step start together.
+
+    Args:
+        payloads (list): Raw image bytes, cycled through
+        seconds (float): Measurement duration
+        concurrency (int): Request threads in this worker
+
+    Returns:
+        dict: Completed predictions, raw latencies (ms) and the applied runtime profile
+    """
+    from . import create_app
+    from .inference import get_batcher, runtime_profile
+    from .route import predict_image_bytes
+
+    app = create_app('production')
+    with app.app_context():
+        get_batcher().predict(np.zeros((150, 150, 3), dtype=np.float32))
+    print('ready', flush=True)
+    sys.stdin.readline()
+
+    deadline = time.perf_counter() + seconds
+    latencies = [[] for _ in range(concurrency)]
+
+    def client(index):
+        with app.app_context():
+            position = index
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                predict_image_bytes(payloads[position % len(payloads)])
+                latencies[index].append((time.perf_counter() - started) * 1000.0)
+                position += concurrency
+
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    merged = [latency for chunk in latencies for latency in chunk]
+    return {'completed': len(merged), 'latencies_ms': merged, 'runtime': runtime_profile()}
+
+
+def sweep_runtime_profiles(backend_name, model_path, worker_counts, thread_counts, images_dir=None,
+                           synthetic=64, seconds=10.0, concurrency=1, pin_cores=True, limit=None):
+    """
+    Measure serving throughput for every workers x intra-op threads combination
+
+    Each combination starts that many worker processes side by side, each
+    configured through the INFERENCE_* environment exactly as a deployed
+    worker would be, and drives them at once for `seconds`.
+
+    Args:
+        backend_name (str): Inference backend
+        model_path (str): Artifact of the backend
+        worker_counts (iterable): Worker processes per host to try
+        thread_counts (iterable): Intra-op threads per worker to try
+        images_dir (str, optional): Image set to use; synthetic images otherwise
+        synthetic (int): Number of synthetic images when no directory is given
+        seconds (float): Measurement duration per combination
+        concurrency (int): Request threads per worker
+        pin_cores (bool): Give every worker its own core slice (INFERENCE_CPU_AFFINITY=auto)
+        limit (int, optional): Maximum images read from `images_dir`
+
+    Returns:
+        dict: Run metadata, one result per combination and the best combination
+    """
+    results = []
+    for workers in worker_counts:
+        for threads in thread_counts:
+            processes = []
+            for index in range(workers):
+                env = dict(os.environ, INFERENCE_BACKEND=backend_name,
+                           INFERENCE_INTRA_OP_THREADS=str(threads), INFERENCE_INTER_OP_THREADS='1',
+                           INFERENCE_CPU_AFFINITY='auto' if pin_cores else '',
+                           INFERENCE_WORKERS_PER_HOST=str(workers), INFERENCE_WORKER_INDEX=str(index),
+                           INFERENCE_WARMUP='0', PREDICTION_CACHE_SIZE='0', PREDICTION_JOB_WORKERS='0')
+                env.pop('PREDICTION_CACHE_DIR', None)
+                env[MODEL_PATH_KEYS[backend_name]] = model_path
+                command = [sys.executable, '-m', 'app.benchmark', 'load', '--seconds', str(seconds),
+                           '--concurrency', str(concurrency)]
+                if images_dir:
+                    command += ['--images', images_dir] + (['--limit', str(limit)] if limit else [])
+                else:
+                    command += ['--synthetic', str(synthetic)]
+                processes.append(subprocess.Popen(command, env=env, text=True,
+                                                  stdin=subprocess.PIPE, stdout=subprocess.PIPE))
+
+            for process in processes:
+                while process.stdout.readline().strip() != 'ready':
+                    if process.poll() is not None:
+                        raise RuntimeError(f"Benchmark worker exited with code {process.returncode}")
+            for process in processes:
+                process.stdin.write('go\n')
+                process.stdin.flush()
+            outputs = [json.loads(process.communicate()[0].strip().splitlines()[-1]) for process in processes]
+
+            latencies = [latency for output in outputs for latency in output['latencies_ms']]
+            if not latencies:
+                raise RuntimeError(f"No predictions completed with {workers} worker(s) x {threads} thread(s)")
+            summary = summarize(latencies)
+            summary['images_per_sec'] = round(sum(output['completed'] for output in outputs) / seconds, 2)
+            results.append({
+                'workers': workers,
+                'intra_op_threads': threads,
+                'pinned_cores': [output['runtime']['cpu_affinity'] for output in outputs],
+                'end_to_end': summary,
+            })
+
+    meta = _run_metadata(backend_name, model_path, images_dir, synthetic)
+    meta.update({'seconds': seconds, 'concurrency_per_worker': concurrency, 'pin_cores': pin_cores})
+    best = max(results, key=lambda result: result['end_to_end']['images_per_sec'], default=None)
+    return {'meta': meta, 'results': results, 'best': best}
+
+
+def diff_results(old, new, metric='p50_ms'):
+    """
+    Relative change of one metric for every stage present in both runs
+
+    Args:
+        old (dict): Earlier `run_suite` output
+        new (dict): Later `run_suite` output
+        metric (str): Field of the stage summaries to compare
+
+    Returns:
+        list: Rows with thread setting, stage, batch size, old/new values and % change
+    """
+    def flatten(result):
+        rows = {}
+        for run in result['runs']:
+            threads = f"{run['threads']['intra_op']}:{run['threads']['inter_op']}"
+            for stage, value in run['stages'].items():
+                if metric in value:
+                    rows[(threads, stage, None)] = value[metric]
+                else:
+                    for batch_size, summary in value.items():
+                        rows[(threads, stage, batch_size)] = summary[metric]
+        return rows
+
+    before, after = flatten(old), flatten(new)
+    return [
+        {'threads': key[0], 'stage': key[1], 'batch_size': key[2], 'old': before[key], 'new': after[key],
+         'change_pct': round((after[key] - before[key]) / before[key] * 100.0, 1) if before[key] else None}
+        for key in sorted(before.keys() & after.keys(), key=lambda k: (k[0], k[1], k[2] or ''))
+    ]
+
+
+def _main(argv=None):
+    # Child-process entry points used by run_suite ('stages') and
+    # sweep_runtime_profiles ('load'); the result is printed as JSON on stdout
+    parser = argparse.ArgumentParser(description='Benchmark worker process.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    stages = commands.add_parser('stages', help='Time every stage under one thread setting.')
+    stages.add_argument('--backend', default='keras')
+    stages.add_argument('--model', required=True)
+    stages.add_argument('--batch-sizes', default='1,8')
+    stages.add_argument('--intra-op', type=int, default=0)
+    stages.add_argument('--inter-op', type=int, default=0)
+    stages.add_argument('--repeats', type=int, default=3)
+    load = commands.add_parser('load', help='Drive predict_image_bytes as one serving worker.')
+    load.add_argument('--seconds', type=float, default=10.0)
+    load.add_argument('--concurrency', type=int, default=1)
+    for command in (stages, load):
+        command.add_argument('--images')
+        command.add_argument('--limit', type=int)
+        command.add_argument('--synthetic', type=int, default=64)
+    args = parser.parse_args(argv)
+
+    payloads = load_image_set(args.images, args.limit) if args.images else synthetic_images(args.synthetic)
+    if args.command == 'stages':
+        batch_sizes = [int(size) for size in args.batch_sizes.split(',')]
+        result = run_single(args.backend, args.model, payloads, batch_sizes,
+                            args.intra_op, args.inter_op, args.repeats)
+    else:
+        result = drive_predict_path(payloads, args.seconds, args.concurrency)
+    print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    _main()
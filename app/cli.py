@@ -0,0 +1,412 @@
+# Command-line Tools for the Tumor Classification Application
+
+"""
+Flask CLI Commands
+
+Registered on the application in `create_app`, so with FLASK_APP=run.py
+they run as `flask <group> <command>` with the app's configuration and
+database available.
+
+Command Groups:
+- model: Export, quantize and verify serving artifacts; manage the model registry
+- jobs: Run asynchronous prediction workers
+- bench: Latency / throughput benchmarks of the prediction path
+- storage: Content-addressed upload storage maintenance
+- patients: Bulk operations on patient records
+- schema: Checks of the database schema (migrations themselves are `flask db ...`)
+- stats: Maintenance of the dashboard / statistics counters and analytics rollups
+
+"""
+
+import json
+import sys
+
+import click
+from flask.cli import AppGroup
+
+model_cli = AppGroup('model', help='Export and verify model artifacts.')
+jobs_cli = AppGroup('jobs', help='Asynchronous prediction jobs.')
+bench_cli = AppGroup('bench', help='Benchmark the prediction path.')
+storage_cli = AppGroup('storage', help='Content-addressed upload storage.')
+patients_cli = AppGroup('patients', help='Bulk operations on patient records.')
+schema_cli = AppGroup('schema', help='Database schema checks.')
+stats_cli = AppGroup('stats', help='Dashboard and statistics counters, analytics rollups.')
+
+
+def _echo_json(data):
+    click.echo(json.dumps(data, indent=2))
+
+
+@model_cli.command('export')
+@click.option('--format', 'formats', multiple=True, type=click.Choice(['tflite', 'onnx']),
+              default=('tflite', 'onnx'), show_default=True, help='Artifacts to produce.')
+def export_model(formats):
+    """Convert MODEL_PATH into the TFLite / ONNX artifacts configured for serving."""
+    from flask import current_app
+    from .model_tools import export_tflite, export_onnx
+
+    config = current_app.config
+    if 'tflite' in formats:
+        click.echo(f"Wrote {export_tflite(config['MODEL_PATH'], config['TFLITE_MODEL_PATH'])}")
+    if 'onnx' in formats:
+        click.echo(f"Wrote {export_onnx(config['MODEL_PATH'], config['ONNX_MODEL_PATH'])}")
+
+
+def _configured_backends(names):
+    from flask import current_app
+    from .backends import backend_model_path
+
+    return {name: backend_model_path(current_app.config, name) for name in names}
+
+
+@model_cli.command('parity')
+@click.argument('samples_dir', type=click.Path(exists=True, file_okay=False))
+@click.option('--backend', 'names', multiple=True, default=('keras', 'tflite', 'onnx'), show_default=True)
+@click.option('--limit', default=200, show_default=True, help='Maximum number of sample images.')
+@click.option('--tolerance', default=0.01, show_default=True, help='Allowed top-1 probability difference.')
+def parity(samples_dir, names, limit, tolerance):
+    """Check that every backend agrees with Keras on the images in SAMPLES_DIR."""
+    from .model_tools import find_images, load_samples, parity_check
+
+    paths = find_images(samples_dir, limit)
+    if not paths:
+        sys.exit(f"No images found in {samples_dir}")
+    report = parity_check(_configured_backends(('keras',) + tuple(n for n in names if n != 'keras')),
+                          load_samples(paths), confidence_tolerance=tolerance)
+    _echo_json(report)
+    if not report['passed']:
+        sys.exit(1)
+
+
+@model_cli.command('compare')
+@click.option('--backend', 'names', multiple=True, default=('keras', 'tflite', 'onnx'), show_default=True)
+@click.option('--batch-size', default=1, show_default=True)
+@click.option('--iterations', default=50, show_default=True)
+def compare(names, batch_size, iterations):
+    """Report load time, latency and peak RSS of each backend."""
+    from .model_tools import compare_backends
+
+    _echo_json(compare_backends(_configured_backends(names), batch_size, iterations))
+
+
+@model_cli.command('bench-forward')
+@click.option('--batch-size', 'batch_sizes', multiple=True, type=int, default=(1, 4, 8), show_default=True)
+@click.option('--iterations', default=100, show_default=True)
+def bench_forward(batch_sizes, iterations):
+    """Compare model.predict with the compiled forward function on CPU."""
+    from flask import current_app
+    from .model_tools import benchmark_forward
+
+    _echo_json(benchmark_forward(current_app.config['MODEL_PATH'], batch_sizes, iterations))
+
+
+@model_cli.command('quantize')
+@click.option('--mode', type=click.Choice(['int8', 'float16']), default='int8', show_default=True)
+@click.option('--data-dir', default=None, help='Dataset root with Training/ and Testing/ (default: TRAINING_DATA_DIR).')
+@click.option('--output', default=None, help='Published .tflite path (default: model/brains_<mode>.tflite).')
+@click.option('--max-drop', type=float, default=None,
+              help='Allowed per-class accuracy loss (default: QUANTIZATION_MAX_ACCURACY_DROP).')
+@click.option('--calibration-samples', default=200, show_default=True)
+@click.option('--per-class-limit', type=int, default=None, help='Cap on test images per class.')
+def quantize(mode, data_dir, output, max_drop, calibration_samples, per_class_limit):
+    """Quantize MODEL_PATH and publish it only if it passes the accuracy gate."""
+    import os
+    from flask import current_app
+    from .quantization import quantize_and_publish
+
+    config = current_app.config
+    output = output or os.path.join(os.path.dirname(config['MODEL_PATH']), f"brains_{mode}.tflite")
+    report = quantize_and_publish(
+        config['MODEL_PATH'], output,
+        data_dir or config['TRAINING_DATA_DIR'],
+        mode=mode,
+        max_drop=config['QUANTIZATION_MAX_ACCURACY_DROP'] if max_drop is None else max_drop,
+        calibration_samples=calibration_samples,
+        per_class_limit=per_class_limit,
+    )
+    _echo_json(report)
+    if not report['published']:
+        sys.exit("Quantized model rejected: accuracy drop exceeds the configured threshold")
+
+
+@model_cli.command('register')
+@click.argument('artifact', type=click.Path(exists=True, dir_okay=False))
+@click.option('--backend', type=click.Choice(['keras', 'tflite', 'onnx']), default='keras', show_default=True)
+@click.option('--notes', default='', help='Description stored with the version.')
+@click.option('--promote', is_flag=True, help='Serve the new version right away.')
+def register_model(artifact, backend, notes, promote):
+    """Add ARTIFACT to the model registry as a new version."""
+    from .inference import get_registry
+
+    registry = get_registry()
+    metadata = registry.register(artifact, backend, notes)
+    if promote:
+        registry.promote(metadata['version'])
+    _echo_json(metadata)
+
+
+@model_cli.command('promote')
+@click.argument('version')
+def promote_model(version):
+    """Serve VERSION from the registry; running workers swap to it."""
+    from .inference import get_registry
+
+    try:
+        get_registry().promote(version)
+    except ValueError as e:
+        sys.exit(str(e))
+    click.echo(f"Promoted {version}")
+
+
+@model_cli.command('versions')
+def list_versions():
+    """List registered versions with the active and shadow pointers."""
+    from .inference import get_registry
+
+    registry = get_registry()
+    _echo_json({'active': registry.active_version(), 'shadow': registry.shadow_version(),
+                'versions': registry.versions()})
+
+
+@jobs_cli.command('worker')
+@click.option('--workers', type=int, default=None,
+              help='Worker threads in this process (default: PREDICTION_JOB_WORKERS).')
+def jobs_worker(workers):
+    """Claim and run queued prediction jobs until interrupted."""
+    import time
+    from flask import current_app
+    from .jobs import JobWorkerPool
+
+    app = current_app._get_current_object()
+    pool = JobWorkerPool(app, workers or app.config['PREDICTION_JOB_WORKERS'] or 1)
+    pool.start()
+    click.echo(f"Started {pool.size} prediction job worker(s)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        click.echo("Stopping after current jobs...")
+        pool.stop()
+
+
+def _thread_setting(value):
+    intra_op, _, inter_op = value.partition(':')
+    return int(intra_op), int(inter_op or 0)
+
+
+@bench_cli.command('run')
+@click.option('--backend', default=None, help='Inference backend (default: INFERENCE_BACKEND).')
+@click.option('--images', type=click.Path(exists=True, file_okay=False), default=None,
+              help='Image set to benchmark (default: synthetic images).')
+@click.option('--limit', type=int, default=None, help='Maximum images read from --images.')
+@click.option('--synthetic', default=64, show_default=True, help='Synthetic images when --images is not given.')
+@click.option('--batch-size', 'batch_sizes', multiple=True, type=int, default=(1, 8), show_default=True)
+@click.option('--threads', 'thread_settings', multiple=True, default=('0:0',), show_default=True,
+              help='TensorFlow INTRA:INTER op threads (0 = default); repeat to sweep.')
+@click.option('--repeats', default=3, show_default=True, help='Passes over the image set per stage.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), default=None, help='Also write the JSON here.')
+def bench_run(backend, images, limit, synthetic, batch_sizes, thread_settings, repeats, output):
+    """Measure decode, resize/normalize, forward and end-to-end latency."""
+    from flask import current_app
+    from .backends import backend_model_path
+    from .benchmark import run_suite
+
+    backend = backend or current_app.config['INFERENCE_BACKEND']
+    results = run_suite(backend, backend_model_path(current_app.config, backend), images, synthetic,
+                        batch_sizes, [_thread_setting(value) for value in thread_settings], repeats, limit)
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+    _echo_json(results)
+
+
+@bench_cli.command('diff')
+@click.argument('old', type=click.File())
+@click.argument('new', type=click.File())
+@click.option('--metric', default='p50_ms', show_default=True,
+              type=click.Choice(['p50_ms', 'p95_ms', 'p99_ms', 'mean_ms', 'images_per_sec']))
+def bench_diff(old, new, metric):
+    """Compare two `flask bench run` results stage by stage."""
+    from .benchmark import diff_results
+
+    _echo_json(diff_results(json.load(old), json.load(new), metric))
+
+
+@bench_cli.command('sweep')
+@click.option('--backend', default=None, help='Inference backend (default: INFERENCE_BACKEND).')
+@click.option('--workers', 'worker_counts', multiple=True, type=int, default=(1, 2, 4), show_default=True,
+              help='Worker processes per host; repeat to sweep.')
+@click.option('--threads', 'thread_counts', multiple=True, type=int, default=(1, 2, 4), show_default=True,
+              help='Intra-op threads per worker; repeat to sweep.')
+@click.option('--images', type=click.Path(exists=True, file_okay=False), default=None,
+              help='Image set to predict (default: synthetic images).')
+@click.option('--limit', type=int, default=None, help='Maximum images read from --images.')
+@click.option('--synthetic', default=64, show_default=True, help='Synthetic images when --images is not given.')
+@click.option('--seconds', default=10.0, show_default=True, help='Measurement time per combination.')
+@click.option('--concurrency', default=1, show_default=True, help='Request threads per worker.')
+@click.option('--pin/--no-pin', 'pin_cores', default=True, show_default=True,
+              help='Pin each worker to its own slice of the cores.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), default=None, help='Also write the JSON here.')
+def bench_sweep(backend, worker_counts, thread_counts, images, limit, synthetic, seconds, concurrency,
+                pin_cores, output):
+    """Find the workers x threads runtime profile with the best throughput."""
+    from flask import current_app
+    from .backends import backend_model_path
+    from .benchmark import sweep_runtime_profiles
+
+    backend = backend or current_app.config['INFERENCE_BACKEND']
+    results = sweep_runtime_profiles(backend, backend_model_path(current_app.config, backend), worker_counts,
+                                     thread_counts, images, synthetic, seconds, concurrency, pin_cores, limit)
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+    _echo_json(results)
+
+
+@bench_cli.command('preprocess')
+@click.option('--images', type=click.Path(exists=True, file_okay=False), default=None,
+              help='Image set to compare (default: synthetic images).')
+@click.option('--limit', type=int, default=200, show_default=True, help='Maximum images read from --images.')
+@click.option('--synthetic', default=64, show_default=True, help='Synthetic images when --images is not given.')
+@click.option('--model/--no-model', 'with_model', default=False, show_default=True,
+              help='Also compare the predictions of both paths with the serving backend.')
+def bench_preprocess(images, limit, synthetic, with_model):
+    """Compare the fast decode path with the full-resolution reference."""
+    from .benchmark import load_image_set, synthetic_images
+    from .inference import predict_batch
+    from .preprocessing import compare_with_reference
+
+    payloads = load_image_set(images, limit) if images else synthetic_images(synthetic)
+    if not payloads:
+        sys.exit(f"No images found in {images}")
+    _echo_json(compare_with_reference(payloads, predict_batch if with_model else None))
+
+
+@storage_cli.command('migrate')
+@click.option('--batch-size', default=500, show_default=True, help='Rows rewritten per transaction.')
+@click.option('--workers', default=8, show_default=True, help='Threads copying files.')
+def storage_migrate(batch_size, workers):
+    """Move uploads stored under client file names into the content-addressed store."""
+    from flask import current_app
+    from .storage import BlobStore, migrate_uploads
+
+    config = current_app.config
+    _echo_json(migrate_uploads(BlobStore(config['UPLOAD_FOLDER']), BlobStore(config['UPLOAD_FOLDERS']),
+                               batch_size, workers))
+
+
+@storage_cli.command('gc')
+@click.option('--grace', type=float, default=None,
+              help='Seconds a file must have been unreferenced (default: UPLOAD_STORAGE_GC_GRACE).')
+@click.option('--limit', default=1000, show_default=True, help='Maximum files removed.')
+def storage_gc(grace, limit):
+    """Remove stored uploads that no record references any more."""
+    from flask import current_app
+    from .storage import collect_garbage
+
+    if grace is None:
+        grace = current_app.config['UPLOAD_STORAGE_GC_GRACE']
+    _echo_json(collect_garbage(grace, limit))
+
+
+@storage_cli.command('thumbnails')
+@click.option('--format', 'fmt', type=click.Choice(['webp', 'jpeg']), default=None,
+              help='Derivative format (default: WebP when supported).')
+@click.option('--workers', default=4, show_default=True, help='Threads generating derivatives.')
+def storage_thumbnails(fmt, workers):
+    """Generate the missing thumbnails and previews of every patient scan."""
+    from concurrent.futures import ThreadPoolExecutor
+    from .models import db, Patient
+    from .thumbnails import generate_derivatives
+
+    paths = [path for path, in db.session.query(Patient.image_path).distinct() if path]
+
+    def generate(path):
+        try:
+            generate_derivatives(path, fmt=fmt)
+            return None
+        except Exception as e:
+            return f"{path}: {e}"
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        errors = [error for error in pool.map(generate, paths) if error]
+    _echo_json({'images': len(paths), 'failed': len(errors), 'errors': errors[:20]})
+
+
+@patients_cli.command('rescore')
+@click.option('--chunk-size', default=256, show_default=True, help='Rows decoded and updated per transaction.')
+@click.option('--batch-size', default=32, show_default=True, help='Images per forward pass.')
+@click.option('--workers', type=int, default=None, help='Decoding processes (default: CPU count).')
+@click.option('--checkpoint', 'checkpoint_path', type=click.Path(dir_okay=False), default=None,
+              help='Progress file (default: instance/rescore-<model version>.json).')
+@click.option('--restart', is_flag=True, help='Ignore an existing checkpoint and start from the first record.')
+@click.option('--dry-run', is_flag=True, help='Report changed predictions without writing them.')
+@click.option('--limit', type=int, default=None, help='Maximum records scored in this run.')
+def patients_rescore(chunk_size, batch_size, workers, checkpoint_path, restart, dry_run, limit):
+    """Re-score every stored patient scan with the served model and store the new predictions."""
+    import os
+    from flask import current_app
+    from .inference import get_serving_model
+    from .rescoring import rescore_patients
+
+    model = get_serving_model()
+    if checkpoint_path is None:
+        os.makedirs(current_app.instance_path, exist_ok=True)
+        checkpoint_path = os.path.join(current_app.instance_path, f"rescore-{model.version[:16]}.json")
+    if restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    try:
+        report = rescore_patients(model.backend.predict, model.version, chunk_size, batch_size, workers,
+                                  checkpoint_path, dry_run, limit)
+    except ValueError as e:
+        sys.exit(f"{e}; use --restart or another --checkpoint")
+    report['checkpoint'] = None if dry_run else checkpoint_path
+    _echo_json(report)
+
+
+@schema_cli.command('explain')
+def schema_explain():
+    """Check with EXPLAIN that the hot queries use their indexes."""
+    from .query_plans import explain_hot_queries
+
+    report = explain_hot_queries()
+    _echo_json(report)
+    if not report['passed']:
+        sys.exit(1)
+
+
+@stats_cli.command('reconcile')
+@click.option('--dry-run', is_flag=True, help='Only report drift; exit with status 1 if there is any.')
+def stats_reconcile(dry_run):
+    """Recompute the statistics counters from the tables and repair drift."""
+    from .stat_counters import reconcile_counters
+
+    report = reconcile_counters(dry_run)
+    _echo_json(report)
+    if dry_run and report['drifted']:
+        sys.exit(1)
+
+
+@stats_cli.command('rollup')
+@click.option('--rebuild', is_flag=True, help='Recompute every day instead of the new and changed ones.')
+def stats_rollup(rebuild):
+    """Refresh the daily rollups behind the analytics API."""
+    from .analytics import rebuild_rollups, refresh_rollups
+
+    _echo_json(rebuild_rollups() if rebuild else refresh_rollups())
+
+
+def register_commands(app):
+    """
+    Attach the CLI command groups to the application
+
+    Args:
+        app: The Flask application instance
+    """
+    app.cli.add_command(model_cli)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(bench_cli)
+    app.cli.add_command(storage_cli)
+    app.cli.add_command(patients_cli)
+    app.cli.add_command(schema_cli)
+    app.cli.add_command(stats_cli)
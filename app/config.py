@@ -6,7 +6,128 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     UPLOAD_FOLDER = os.path.join('app', 'static', 'uploads')
     UPLOAD_FOLDERS = os.path.join('app', 'static', 'profiles')
-    MODEL_PATH = os.path.join(BASE_DIR, 'model', 'brains.h5')
+    MODEL_PATH = os.getenv('MODEL_PATH', os.path.join(BASE_DIR, 'model', 'brains.h5'))
+
+    # Runtime used to serve the classifier: 'keras', 'tflite' or 'onnx'.
+    # The TFLite/ONNX artifacts are produced from MODEL_PATH by `flask model export`.
+    INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'keras')
+    TFLITE_MODEL_PATH = os.getenv('TFLITE_MODEL_PATH', os.path.join(BASE_DIR, 'model', 'brains.tflite'))
+    ONNX_MODEL_PATH = os.getenv('ONNX_MODEL_PATH', os.path.join(BASE_DIR, 'model', 'brains.onnx'))
+
+    # Post-training quantization (`flask model quantize`). The dataset uses the notebook's
+    # Training/ and Testing/ class-per-folder layout; a quantized model is only published
+    # if no class loses more than QUANTIZATION_MAX_ACCURACY_DROP accuracy (0.01 == 1 point).
+    # Serve a published variant by pointing TFLITE_MODEL_PATH at it with INFERENCE_BACKEND=tflite.
+    TRAINING_DATA_DIR = os.getenv('TRAINING_DATA_DIR', os.path.join(BASE_DIR, 'model', 'tumor'))
+    QUANTIZATION_MAX_ACCURACY_DROP = float(os.getenv('QUANTIZATION_MAX_ACCURACY_DROP', 0.01))
+
+    # Model registry (app/registry.py, `flask model register/promote`, /admin/models). Once a
+    # version is promoted it is served instead of MODEL_PATH; workers re-read the registry
+    # pointers every MODEL_REGISTRY_CHECK_INTERVAL seconds and hot-swap. A SHADOW candidate
+    # scores MODEL_SHADOW_SAMPLE_RATE of the predictions in the background.
+    MODEL_REGISTRY_DIR = os.getenv('MODEL_REGISTRY_DIR', os.path.join(BASE_DIR, 'model', 'registry'))
+    MODEL_REGISTRY_CHECK_INTERVAL = float(os.getenv('MODEL_REGISTRY_CHECK_INTERVAL', 2))
+    MODEL_SHADOW_SAMPLE_RATE = float(os.getenv('MODEL_SHADOW_SAMPLE_RATE', 0.1))
+
+    # Load the model and run a dummy forward pass at worker boot instead of on first request
+    INFERENCE_WARMUP = os.getenv('INFERENCE_WARMUP', '0') == '1'
+
+    # Inference runtime profile, applied once per worker before the model loads (app/runtime.py).
+    # Thread counts of 0 keep the runtime default (all cores). INFERENCE_CPU_AFFINITY is empty
+    # (no pinning), a core list such as '0-3,8', or 'auto' to split the cores between
+    # INFERENCE_WORKERS_PER_HOST workers (slot from INFERENCE_WORKER_INDEX or claimed per host);
+    # pinning applies to every thread of the worker process.
+    # INFERENCE_ONEDNN ('0'/'1') sets TF_ENABLE_ONEDNN_OPTS; empty leaves TensorFlow's default.
+    # Find good values for a host with `flask bench sweep`.
+    INFERENCE_INTRA_OP_THREADS = int(os.getenv('INFERENCE_INTRA_OP_THREADS', 0))
+    INFERENCE_INTER_OP_THREADS = int(os.getenv('INFERENCE_INTER_OP_THREADS', 0))
+    INFERENCE_CPU_AFFINITY = os.getenv('INFERENCE_CPU_AFFINITY', '')
+    INFERENCE_WORKERS_PER_HOST = int(os.getenv('INFERENCE_WORKERS_PER_HOST', 1))
+    INFERENCE_ONEDNN = os.getenv('INFERENCE_ONEDNN', '')
+
+    # Micro-batching of concurrent /predict requests into one forward pass
+    INFERENCE_MAX_BATCH_SIZE = int(os.getenv('INFERENCE_MAX_BATCH_SIZE', 8))
+    INFERENCE_MAX_WAIT_MS = float(os.getenv('INFERENCE_MAX_WAIT_MS', 5))
+
+    # Cache of model outputs keyed by image hash + model version.
+    # Size 0 disables the in-memory tier; a directory enables the on-disk tier.
+    PREDICTION_CACHE_SIZE = int(os.getenv('PREDICTION_CACHE_SIZE', 1024))
+    PREDICTION_CACHE_DIR = os.getenv('PREDICTION_CACHE_DIR')
+
+    # Asynchronous /predict (form field mode=async): jobs are stored in the prediction_job table
+    # and run by PREDICTION_JOB_WORKERS threads per web process (0 = none; run
+    # `flask jobs worker --workers N` as a dedicated process instead). PREDICTION_ASYNC makes
+    # the predict page use this mode.
+    PREDICTION_ASYNC = os.getenv('PREDICTION_ASYNC', '0') == '1'
+    PREDICTION_JOB_WORKERS = int(os.getenv('PREDICTION_JOB_WORKERS', 1))
+    PREDICTION_JOB_TIMEOUT = int(os.getenv('PREDICTION_JOB_TIMEOUT', 300))
+    PREDICTION_JOB_EVENTS_TIMEOUT = int(os.getenv('PREDICTION_JOB_EVENTS_TIMEOUT', 60))
+
+    # Upload limits: MAX_CONTENT_LENGTH caps a whole request body (Flask answers 413 before
+    # parsing it); every file is then read in chunks and rejected as soon as it exceeds
+    # UPLOAD_MAX_BYTES, is not a JPEG/PNG, or its header declares more than UPLOAD_MAX_PIXELS
+    # pixels (decompression bombs), before anything is decoded or stored (app/uploads.py)
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 512 * 1024 * 1024))
+    UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', 20 * 1024 * 1024))
+    UPLOAD_MAX_PIXELS = int(os.getenv('UPLOAD_MAX_PIXELS', 40000000))
+
+    # Volumetric scans on /predict/volume (app/volumes.py): NIfTI volumes or zipped DICOM series
+    # (DICOM needs pydicom) of up to VOLUME_MAX_BYTES, streamed to disk and memory-mapped; a .nii.gz
+    # is decompressed to a temporary file of at most VOLUME_MAX_DECOMPRESSED_BYTES. Axial
+    # slices with less than VOLUME_MIN_FOREGROUND non-black pixels are skipped, the rest are
+    # classified VOLUME_BATCH_SIZE at a time; the study is labelled with a tumor class when at
+    # least VOLUME_TUMOR_SLICE_FRACTION of the scored slices show one.
+    VOLUME_MAX_BYTES = int(os.getenv('VOLUME_MAX_BYTES', 512 * 1024 * 1024))
+    VOLUME_MAX_DECOMPRESSED_BYTES = int(os.getenv('VOLUME_MAX_DECOMPRESSED_BYTES', 2 * 1024 * 1024 * 1024))
+    VOLUME_BATCH_SIZE = int(os.getenv('VOLUME_BATCH_SIZE', 16))
+    VOLUME_MIN_FOREGROUND = float(os.getenv('VOLUME_MIN_FOREGROUND', 0.05))
+    VOLUME_TUMOR_SLICE_FRACTION = float(os.getenv('VOLUME_TUMOR_SLICE_FRACTION', 0.1))
+
+    # Uploads are stored once per distinct content, by SHA-256, in sharded directories below
+    # UPLOAD_FOLDER / UPLOAD_FOLDERS (app/storage.py). `flask storage gc` removes files that no
+    # record has referenced for UPLOAD_STORAGE_GC_GRACE seconds; `flask storage migrate` moves
+    # uploads saved by earlier versions into the store.
+    UPLOAD_STORAGE_GC_GRACE = int(os.getenv('UPLOAD_STORAGE_GC_GRACE', 3600))
+
+    # Grad-CAM overlays generated in the background after each prediction, stored next to the
+    # upload and served by /patients/<id>/explanation (keras backend only). At most
+    # EXPLANATION_MAX_PENDING overlays are queued per process; beyond that requests stay
+    # pending until a poll finds room.
+    EXPLANATIONS_ENABLED = os.getenv('EXPLANATIONS_ENABLED', '1') == '1'
+    EXPLANATION_OVERLAY_ALPHA = float(os.getenv('EXPLANATION_OVERLAY_ALPHA', 0.4))
+    EXPLANATION_MAX_SIZE = int(os.getenv('EXPLANATION_MAX_SIZE', 512))
+    EXPLANATION_MAX_PENDING = int(os.getenv('EXPLANATION_MAX_PENDING', 64))
+
+    # Thumbnails ('thumb', 'preview') of patient scans used by the patients list, stored next to
+    # the upload and served by /patients/<id>/image/<size>. Generated in the background right
+    # after each upload when enabled, otherwise on first request; backfill with
+    # `flask storage thumbnails`. At most THUMBNAILS_MAX_PENDING uploads are queued per process;
+    # later ones get their thumbnails on first request.
+    THUMBNAILS_AT_UPLOAD = os.getenv('THUMBNAILS_AT_UPLOAD', '1') == '1'
+    THUMBNAILS_MAX_PENDING = int(os.getenv('THUMBNAILS_MAX_PENDING', 64))
+
+    # Upper bound on images accepted by one /predict/batch request (one forward pass)
+    PREDICT_BATCH_MAX_FILES = int(os.getenv('PREDICT_BATCH_MAX_FILES', 64))
+
+    # Treatment protocols are cached in every worker (app/treatment_catalog.py); the version
+    # stamp that invalidates the cache is read at most every TREATMENT_CACHE_CHECK_INTERVAL
+    # seconds. Browsers may reuse /treatments/<tumor_type> for TREATMENT_CACHE_MAX_AGE seconds,
+    # then revalidate with its ETag.
+    TREATMENT_CACHE_CHECK_INTERVAL = float(os.getenv('TREATMENT_CACHE_CHECK_INTERVAL', 5))
+    TREATMENT_CACHE_MAX_AGE = int(os.getenv('TREATMENT_CACHE_MAX_AGE', 60))
+
+    # Rows per page of /patients and /patients/page (keyset pagination); clients may ask
+    # for fewer, never more than PATIENTS_MAX_PAGE_SIZE
+    PATIENTS_PAGE_SIZE = int(os.getenv('PATIENTS_PAGE_SIZE', 50))
+    PATIENTS_MAX_PAGE_SIZE = int(os.getenv('PATIENTS_MAX_PAGE_SIZE', 200))
+
+    # Analytics API (app/analytics.py): each worker refreshes the daily rollups at most every
+    # ANALYTICS_REFRESH_INTERVAL seconds and serves a response for ANALYTICS_CACHE_TTL seconds.
+    # A refresh re-reads the last ANALYTICS_ROLLUP_OVERLAP source ids to catch late commits.
+    ANALYTICS_REFRESH_INTERVAL = float(os.getenv('ANALYTICS_REFRESH_INTERVAL', 30))
+    ANALYTICS_CACHE_TTL = float(os.getenv('ANALYTICS_CACHE_TTL', 30))
+    ANALYTICS_ROLLUP_OVERLAP = int(os.getenv('ANALYTICS_ROLLUP_OVERLAP', 1000))
+    ANALYTICS_MAX_RANGE_DAYS = int(os.getenv('ANALYTICS_MAX_RANGE_DAYS', 1830))
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -20,6 +141,7 @@ class TestingConfig(Config):
         f"mysql+pymysql://{os.getenv('MYSQL_USER')}:{os.getenv('MYSQL_PASSWORD')}@{os.getenv('MYSQL_HOST')}/{os.getenv('MYSQL_DB')}"
     )
     WTF_CSRF_ENABLED = False
+    PREDICTION_JOB_WORKERS = 0
 
 class ProductionConfig(Config):
     DEBUG = False
@@ -0,0 +1,292 @@
+# Grad-CAM Explanations for Tumor Predictions
+
+"""
+Asynchronous Saliency Heatmaps
+
+Shows clinicians which part of a scan drove the prediction, without adding
+the cost of a backward pass to `/predict`: the heatmap is computed on a
+background thread after the prediction has been returned.
+
+Key Functionality:
+- Grad-CAM from the last Conv2D layer of the Keras classifier, for the
+  class stored with the record (the served model's top class if unknown)
+- Heatmap overlay (JPEG) stored next to the upload, named after the image
+  hash, model version and class, so identical scans share one overlay and a
+  new model version produces new ones
+- Deduplicated background generation; state is re-derived from the files,
+  so any worker can serve or (re)start an explanation
+- Bounded queue of pending overlays (EXPLANATION_MAX_PENDING), holding
+  upload paths rather than bytes
+
+Explanations need the gradients of the Keras model, so they are only
+available while the served backend is 'keras'.
+
+"""
+
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from .backends import INPUT_SHAPE
+from .prediction_cache import image_digest
+from .preprocessing import decode_image
+from .storage import stored_digest
+
+EXPLANATION_DONE = 'done'
+EXPLANATION_PENDING = 'pending'
+EXPLANATION_FAILED = 'failed'
+EXPLANATION_UNAVAILABLE = 'unavailable'
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def explanation_path(image_path, digest, version, target=None):
+    """
+    Where the overlay of an image under a model version is stored
+
+    Args:
+        image_path (str): The upload
+        digest (str): `image_digest` of the upload
+        version (str): Model version the heatmap is computed with
+        target (int, optional): Class index explained; None for the top class
+
+    Returns:
+        str: Overlay path in the upload's directory
+    """
+    suffix = '' if target is None else f"-{target}"
+    return os.path.join(os.path.dirname(image_path), f"gradcam-{digest[:16]}-{version[:12]}{suffix}.jpg")
+
+
+def last_conv_layer(model):
+    """
+    The Conv2D layer closest to the classifier head
+
+    Args:
+        model: Keras model
+
+    Returns:
+        The layer, whose feature maps Grad-CAM weighs
+    """
+    import tensorflow as tf
+
+    for layer in reversed(model.layers):
+        if isinstance(layer, tf.keras.layers.Conv2D):
+            return layer
+    raise ValueError("Model has no Conv2D layer to explain")
+
+
+class GradCam:
+    """
+    Grad-CAM heatmaps of a Keras classifier
+
+    The gradient model (feature maps + predictions) and the heatmap
+    computation are compiled once per model into a fixed-signature
+    `tf.function`; the target class is an input, so any class reuses it.
+    """
+
+    def __init__(self, model):
+        import tensorflow as tf
+
+        layer = last_conv_layer(model)
+        grad_model = tf.keras.Model(model.inputs, [layer.output, model.output])
+
+        @tf.function(input_signature=[tf.TensorSpec((1,) + INPUT_SHAPE, tf.float32), tf.TensorSpec((), tf.int32)])
+        def compute(images, target):
+            with tf.GradientTape() as tape:
+                features, predictions = grad_model(images, training=False)
+                # A negative target explains the top class
+                target = tf.where(target < 0, tf.argmax(predictions[0], output_type=tf.int32), target)
+                score = predictions[:, target]
+            gradients = tape.gradient(score, features)
+            weights = tf.reduce_mean(gradients, axis=(1, 2))
+            cam = tf.nn.relu(tf.reduce_sum(features * weights[:, tf.newaxis, tf.newaxis, :], axis=-1))[0]
+            return cam / (tf.reduce_max(cam) + 1e-8), target
+
+        self._compute = compute
+        self.layer_name = layer.name
+
+    def heatmap(self, array, target=None):
+        """
+        Heatmap of one preprocessed image for a class
+
+        Args:
+            array (np.ndarray): Model input of shape (150, 150, 3)
+            target (int, optional): Class index to explain; None for the predicted class
+
+        Returns:
+            tuple: (heatmap in [0, 1] at the feature-map resolution, explained class index)
+        """
+        cam, target = self._compute(array[np.newaxis].astype(np.float32, copy=False),
+                                    np.int32(-1 if target is None else target))
+        return cam.numpy(), int(target.numpy())
+
+
+def colorize(heatmap):
+    """
+    Map a [0, 1] heatmap to RGB with a blue-to-red ('jet'-like) palette
+
+    Args:
+        heatmap (np.ndarray): 2-D array of values in [0, 1]
+
+    Returns:
+        np.ndarray: uint8 array of shape heatmap.shape + (3,)
+    """
+    x = np.clip(heatmap, 0.0, 1.0)[..., np.newaxis]
+    rgb = np.clip(1.5 - np.abs(4.0 * x - np.array([3.0, 2.0, 1.0])), 0.0, 1.0)
+    return (rgb * 255).astype(np.uint8)
+
+
+def render_overlay(data, heatmap, alpha=0.4, max_size=512):
+    """
+    Blend a heatmap over the original scan
+
+    Args:
+        data (bytes): Raw bytes of the uploaded image
+        heatmap (np.ndarray): 2-D heatmap in [0, 1]
+        alpha (float): Opacity of the heatmap
+        max_size (int): Longest side of the overlay in pixels
+
+    Returns:
+        PIL.Image.Image: RGB overlay
+    """
+    img = Image.open(io.BytesIO(data))
+    img.draft('RGB', (max_size, max_size))
+    img = img.convert('RGB')
+    img.thumbnail((max_size, max_size))
+    heat = Image.fromarray((np.clip(heatmap, 0.0, 1.0) * 255).astype(np.uint8)).resize(img.size, Image.BILINEAR)
+    colored = Image.fromarray(colorize(np.asarray(heat, dtype=np.float32) / 255.0))
+    return Image.blend(img, colored, alpha)
+
+
+class ExplanationService:
+    """
+    Generates overlays on a background thread, one at a time
+
+    Failures are remembered, so a broken overlay is not retried on every
+    poll; only the `max_failures` most recently seen are kept. At most
+    `max_pending` overlays wait for the thread; further requests are
+    answered as pending without being queued, and polling queues them once
+    there is room.
+
+    Attributes:
+    - app: Application whose config and served model are used
+    """
+
+    def __init__(self, app, workers=1, max_failures=1024, max_pending=64):
+        self.app = app
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='gradcam')
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._failures = OrderedDict()
+        self._max_failures = max_failures
+        self._max_pending = max_pending
+        self._gradcam = None  # (model version, GradCam)
+
+    def request(self, image_path, category=None, data=None):
+        """
+        Look up the overlay of an upload, starting its generation if needed
+
+        Stored uploads are named by their digest, so they are only read when
+        the overlay is generated; legacy uploads are read and hashed here.
+        The queue only holds the path: the thread reads the upload again.
+
+        Args:
+            image_path (str): The upload
+            category (str, optional): Tumor type recorded for the upload, the
+                class explained; the served model's top class if None or unknown
+            data (bytes, optional): The upload's bytes, if already in memory,
+                to hash legacy uploads
+
+        Returns:
+            tuple: (status, overlay path)
+        """
+        from .inference import CATEGORIES, get_serving_model
+
+        model = get_serving_model()
+        digest = stored_digest(image_path)
+        if digest is None:
+            if data is None:
+                with open(image_path, 'rb') as f:
+                    data = f.read()
+            digest = image_digest(data)
+        target = CATEGORIES.index(category) if category in CATEGORIES else None
+        path = explanation_path(image_path, digest, model.version, target)
+        if os.path.exists(path):
+            return EXPLANATION_DONE, path
+        if not hasattr(model.backend, 'model'):
+            return EXPLANATION_UNAVAILABLE, path
+
+        with self._lock:
+            if path in self._failures:
+                self._failures.move_to_end(path)
+                return EXPLANATION_FAILED, path
+            if path not in self._pending and len(self._pending) < self._max_pending:
+                self._pending.add(path)
+                self._executor.submit(self._generate, model, image_path, target, path)
+        return EXPLANATION_PENDING, path
+
+    def _generate(self, model, image_path, target, path):
+        try:
+            with open(image_path, 'rb') as f:
+                data = f.read()
+            if self._gradcam is None or self._gradcam[0] != model.version:
+                self._gradcam = (model.version, GradCam(model.backend.model))
+            heatmap, _ = self._gradcam[1].heatmap(decode_image(data), target)
+            overlay = render_overlay(data, heatmap, self.app.config['EXPLANATION_OVERLAY_ALPHA'],
+                                     self.app.config['EXPLANATION_MAX_SIZE'])
+            temporary = f"{path}.{os.getpid()}.tmp"
+            overlay.save(temporary, 'JPEG', quality=90)
+            os.replace(temporary, path)
+        except Exception as e:
+            self.app.logger.error(f"Error in Grad-CAM explanation: {str(e)}")
+            with self._lock:
+                self._failures[path] = str(e)
+                while len(self._failures) > self._max_failures:
+                    self._failures.popitem(last=False)
+        finally:
+            with self._lock:
+                self._pending.discard(path)
+
+
+def get_explanation_service(app):
+    """
+    Return the process-wide explanation service, creating it on first use
+
+    Args:
+        app: The Flask application instance
+
+    Returns:
+        ExplanationService: The service
+    """
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = ExplanationService(app, max_pending=app.config['EXPLANATION_MAX_PENDING'])
+    return _service
+
+
+def schedule_explanation(app, image_path, category, data=None):
+    """
+    Start generating the overlay of a freshly predicted upload, if explanations are enabled
+
+    Never raises: explanations must not fail the prediction they belong to.
+
+    Args:
+        app: The Flask application instance
+        image_path (str): The saved upload
+        category (str): Tumor type predicted for the upload
+        data (bytes, optional): The upload's bytes, if already in memory
+    """
+    if not app.config['EXPLANATIONS_ENABLED']:
+        return
+    try:
+        get_explanation_service(app).request(image_path, category, data)
+    except Exception as e:
+        app.logger.error(f"Error scheduling explanation: {str(e)}")
@@ -0,0 +1,369 @@
+# Model Lifecycle for Tumor Classification
+
+"""
+Lazy Model Loading, Hot-Swap and Inference Entry Points
+
+The runtime (see app/backends.py) is imported and the classifier is loaded
+the first time a prediction actually needs it, so processes that never predict (admin-only
+workers, migrations, tests, CLI scripts) do not pay the TensorFlow start-up
+cost or hold the model in memory.
+
+The served model is the ACTIVE version of the model registry
+(app/registry.py), or the artifact configured by INFERENCE_BACKEND /
+MODEL_PATH while nothing has been promoted. Every MODEL_REGISTRY_CHECK_INTERVAL
+seconds a request re-reads the registry pointers; a newly promoted version is
+loaded on a background thread and swapped in atomically, while requests
+already holding the previous model finish on it.
+
+Key Functionality:
+- Deferred runtime import and model load on first use
+- Hot-swap of promoted registry versions without a restart
+- Optional warm-up hook (INFERENCE_WARMUP) that loads the model and runs a
+  dummy forward pass at worker boot
+- Micro-batcher per served model, shared by all request threads
+- Process-wide prediction cache keyed by image hash and model version
+- Shadow evaluation of the registry's SHADOW candidate on sampled traffic
+- Runtime profile (threads, core pinning, oneDNN) applied before the load
+
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+from flask import current_app
+
+from .backends import INPUT_SHAPE, load_backend, backend_model_path
+from .batching import MicroBatcher
+from .prediction_cache import PredictionCache, model_version
+from .registry import ModelRegistry, ShadowEvaluator
+from .runtime import apply_runtime_profile, runtime_profile
+
+# Output classes of the model, in the order of its softmax units
+CATEGORIES = ["Glioma", "Meningioma", "No Tumor", "Pituitary"]
+
+# Everything persisted about one prediction (see Patient.probabilities etc.)
+Prediction = namedtuple('Prediction', ['category', 'confidence', 'probabilities', 'model_version', 'inference_ms'])
+
+# Model answering predictions; replaced as a whole on hot-swap
+_serving = None
+_serving_lock = threading.Lock()
+
+# Registry pointer checks: at most one thread checks, at most one swap loads at a time
+_next_check = 0.0
+_check_lock = threading.Lock()
+_swapping = threading.Event()
+
+# Target that failed to load, with the error; not retried until the pointers move
+_failed_swap = None
+
+# Candidate scored on sampled traffic, if the registry names one
+_shadow = None
+
+# Results of previous predictions, so re-uploaded scans skip the CNN
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class ServingModel:
+    """
+    A loaded model version together with its own micro-batcher
+
+    Attributes:
+    - backend: Loaded InferenceBackend
+    - version: Registry version, or the content hash of a configured artifact
+    - source: 'registry' or 'config'
+    - load_seconds: Time it took to load the backend
+    - batcher: MicroBatcher running `backend.predict`
+    """
+
+    def __init__(self, backend, version, source, load_seconds, max_batch_size, max_wait_ms):
+        self.backend = backend
+        self.version = version
+        self.source = source
+        self.load_seconds = load_seconds
+        self.batcher = MicroBatcher(backend.predict, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+    def matches(self, target):
+        """Whether this model already serves a `serving_target` result."""
+        name, path, version, _ = target
+        return (self.backend.name, self.backend.model_path, self.version) == (name, path, version)
+
+
+def get_registry(config=None):
+    """
+    The model registry configured by MODEL_REGISTRY_DIR
+
+    Args:
+        config: Flask config mapping; defaults to the current app's
+
+    Returns:
+        ModelRegistry: Registry instance (cheap; nothing is read until used)
+    """
+    return ModelRegistry((config or current_app.config)['MODEL_REGISTRY_DIR'])
+
+
+def serving_target(config):
+    """
+    Which model this process should serve
+
+    Args:
+        config: Flask config mapping
+
+    Returns:
+        tuple: (backend name, artifact path, version, source)
+    """
+    registry = get_registry(config)
+    version = registry.active_version()
+    if version:
+        return registry.get(version)['backend'], registry.artifact_path(version), version, 'registry'
+    name = config['INFERENCE_BACKEND']
+    path = backend_model_path(config, name)
+    return name, path, model_version(path), 'config'
+
+
+def _load_serving(config, target):
+    name, path, version, source = target
+    profile = apply_runtime_profile(config)
+    started = time.perf_counter()
+    backend = load_backend(name, path, profile['intra_op_threads'], profile['inter_op_threads'])
+    load_seconds = time.perf_counter() - started
+    print(f"Model loaded successfully from {path} ({name}, {version[:16]}) in {load_seconds:.2f}s")
+    return ServingModel(backend, version, source, load_seconds,
+                        config['INFERENCE_MAX_BATCH_SIZE'], config['INFERENCE_MAX_WAIT_MS'])
+
+
+def _swap(config, logger, target):
+    global _serving, _failed_swap
+    try:
+        replacement = _load_serving(config, target)
+        previous, _serving = _serving, replacement
+        # Requests already queued on the previous model are answered before its batcher stops
+        previous.batcher.close()
+        logger.info(f"Swapped model {previous.version[:16]} -> {replacement.version[:16]}")
+    except Exception as e:
+        _failed_swap = (target, str(e))
+        logger.error(f"Error in model hot-swap: {str(e)}")
+    finally:
+        _swapping.clear()
+
+
+def _sync_shadow(config, registry, active_version):
+    global _shadow
+    version = registry.shadow_version()
+    if version == active_version:
+        version = None
+    if (_shadow.version if _shadow else None) == version:
+        return
+    previous = _shadow
+    profile = apply_runtime_profile(config)
+    _shadow = ShadowEvaluator(registry, version, config['MODEL_SHADOW_SAMPLE_RATE'],
+                              profile['intra_op_threads'], profile['inter_op_threads']) if version else None
+    if previous is not None:
+        threading.Thread(target=previous.close, name='shadow-close', daemon=True).start()
+
+
+def check_for_model_update(app=None):
+    """
+    Re-read the registry pointers and start a hot-swap / shadow change if they moved
+
+    Called periodically from `get_serving_model`, and directly after an
+    admin promotes a version so the promoting worker switches at once. A
+    target that failed to load is not tried again until it changes.
+
+    Args:
+        app: Flask application; defaults to the current app
+    """
+    global _next_check
+    app = app or current_app._get_current_object()
+    if not _check_lock.acquire(blocking=False):
+        return
+    try:
+        _next_check = time.monotonic() + app.config['MODEL_REGISTRY_CHECK_INTERVAL']
+        serving = _serving
+        if serving is None:
+            return
+        target = serving_target(app.config)
+        failed = _failed_swap
+        if not serving.matches(target) and not (failed and failed[0] == target) and not _swapping.is_set():
+            _swapping.set()
+            threading.Thread(target=_swap, args=(app.config, app.logger, target),
+                             name='model-swap', daemon=True).start()
+        _sync_shadow(app.config, get_registry(app.config), target[2] if target[3] == 'registry' else None)
+    except Exception as e:
+        app.logger.error(f"Error in model registry check: {str(e)}")
+    finally:
+        _check_lock.release()
+
+
+def get_serving_model():
+    """
+    Return the model that answers predictions, loading it on first use
+
+    Callers should fetch it once per request and use its backend, batcher
+    and version together, so a concurrent swap never mixes two versions.
+
+    Returns:
+        ServingModel: The current model
+    """
+    global _serving, _next_check
+    serving = _serving
+    if serving is None:
+        with _serving_lock:
+            if _serving is None:
+                config = current_app.config
+                _serving = _load_serving(config, serving_target(config))
+                _next_check = 0.0
+        serving = _serving
+    if time.monotonic() >= _next_check:
+        check_for_model_update()
+    return serving
+
+
+def get_batcher():
+    """
+    Return the micro-batcher of the served model
+
+    Returns:
+        MicroBatcher: Scheduler configured from the current app's config
+    """
+    return get_serving_model().batcher
+
+
+def observe_shadow(batch, probabilities, primary_ms):
+    """
+    Offer predictions of the served model to the shadow candidate, if any
+
+    Args:
+        batch (np.ndarray): Model inputs of shape (N, 150, 150, 3)
+        probabilities (np.ndarray): Outputs of the served model
+        primary_ms (float): Latency of the served model for this batch
+    """
+    shadow = _shadow
+    if shadow is not None:
+        shadow.observe(batch, probabilities, primary_ms)
+
+
+def get_prediction_cache():
+    """
+    Return the process-wide prediction cache, creating it on first use
+
+    Returns:
+        PredictionCache: Cache sized from PREDICTION_CACHE_SIZE / PREDICTION_CACHE_DIR
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PredictionCache(
+                    max_entries=current_app.config['PREDICTION_CACHE_SIZE'],
+                    disk_dir=current_app.config['PREDICTION_CACHE_DIR'],
+                )
+    return _cache
+
+
+def predict_batch(batch, model=None):
+    """
+    Run one forward pass over an already stacked batch, bypassing the micro-batcher
+
+    Args:
+        batch (np.ndarray): Preprocessed images of shape (N, 150, 150, 3)
+        model (ServingModel, optional): Model to use; defaults to the served model
+
+    Returns:
+        np.ndarray: Class probabilities of shape (N, 4)
+    """
+    model = model or get_serving_model()
+    started = time.perf_counter()
+    probabilities = model.backend.predict(batch)
+    observe_shadow(batch, probabilities, (time.perf_counter() - started) * 1000.0)
+    return probabilities
+
+
+def describe_prediction(probabilities):
+    """
+    Turn one row of class probabilities into the label and confidence shown to users
+
+    Args:
+        probabilities (np.ndarray): Softmax output for a single image
+
+    Returns:
+        tuple: (category, confidence percentage rounded to 2 decimals)
+    """
+    predicted_class = int(np.argmax(probabilities))
+    return CATEGORIES[predicted_class], round(float(probabilities[predicted_class]) * 100, 2)
+
+
+def prediction_result(probabilities, model_version, inference_ms):
+    """
+    Bundle one row of class probabilities with the model and latency that produced it
+
+    Args:
+        probabilities (np.ndarray): Softmax output for a single image
+        model_version (str): Version of the model that produced it
+        inference_ms (float): Time spent obtaining the probabilities (decode and
+            forward pass, or the cache lookup on a hit)
+
+    Returns:
+        Prediction: Label, confidence percentage, {category: probability}, version and latency
+    """
+    category, confidence = describe_prediction(probabilities)
+    return Prediction(category, confidence,
+                      {name: round(float(p), 6) for name, p in zip(CATEGORIES, probabilities)},
+                      model_version, round(float(inference_ms), 2))
+
+
+def warm_up(app):
+    """
+    Load the model and run one dummy forward pass so the first real request is fast
+
+    Args:
+        app: The Flask application instance
+    """
+    with app.app_context():
+        started = time.perf_counter()
+        get_batcher().predict(np.zeros(INPUT_SHAPE, dtype=np.float32))
+        app.logger.info(f"Inference warm-up finished in {time.perf_counter() - started:.2f}s")
+
+
+def model_info():
+    """
+    Describe the model state of this process
+
+    Returns:
+        dict: Whether the model is loaded, from where and how long loading took
+    """
+    serving = _serving
+    return {
+        'loaded': serving is not None,
+        'backend': serving.backend.name if serving is not None else None,
+        'model_path': serving.backend.model_path if serving is not None else None,
+        'version': serving.version if serving is not None else None,
+        'source': serving.source if serving is not None else None,
+        'load_seconds': round(serving.load_seconds, 3) if serving is not None else None,
+        'shadow_version': _shadow.version if _shadow is not None else None,
+        'shadow_error': _shadow.error if _shadow is not None else None,
+        'swap_error': _failed_swap[1] if _failed_swap is not None else None,
+        'runtime': runtime_profile(),
+    }
+
+
+def cache_stats():
+    """
+    Prediction cache counters without creating the cache
+
+    Returns:
+        dict: PredictionCache.stats() output, or None if nothing was predicted yet
+    """
+    return _cache.stats() if _cache is not None else None
+
+
+def batcher_stats():
+    """
+    Micro-batching metrics without forcing the model to load
+
+    Returns:
+        dict: MicroBatcher.stats() output, or None if nothing was predicted yet
+    """
+    return _serving.batcher.stats() if _serving is not None else None
@@ -0,0 +1,287 @@
+# Asynchronous Prediction Jobs
+
+"""
+DB-backed Prediction Job Queue
+
+Lets `/predict` hand an upload off to a worker and return immediately
+instead of holding a web worker for the whole inference and DB commit.
+Jobs live in the `prediction_job` table, so queued work survives restarts.
+
+Key Functionality:
+- Enqueue a job for an already saved upload
+- Claim jobs with `SELECT ... FOR UPDATE SKIP LOCKED`, so any number of
+  worker threads and processes can share the queue without double work
+- Re-queue jobs whose worker died mid-run (PREDICTION_JOB_TIMEOUT); a
+  worker only finishes a job it still holds, so a slow run that was
+  reclaimed never saves a second record
+- Worker pool sized by PREDICTION_JOB_WORKERS, run inside the web process
+  or as a dedicated process with `flask jobs worker`
+
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from .models import db, PredictionJob
+from .storage import track_files
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+FINISHED_STATES = (JOB_DONE, JOB_FAILED)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def enqueue_prediction(user_id, image_path, name, age, gender, diagnosis_date):
+    """
+    Queue a prediction for an uploaded image
+
+    The upload is registered with the storage in the same transaction, so
+    it is collected if the job fails or is deleted before it runs.
+
+    Args:
+        user_id (int): Submitting user
+        image_path (str): Saved upload
+        name (str): Patient's full name
+        age (int): Patient's age
+        gender (str): Patient's gender
+        diagnosis_date (date): Date of diagnosis
+
+    Returns:
+        PredictionJob: The queued job
+    """
+    job = PredictionJob(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        status=JOB_QUEUED,
+        image_path=image_path,
+        name=name,
+        age=age,
+        gender=gender,
+        diagnosis_date=diagnosis_date,
+    )
+    db.session.add(job)
+    track_files([image_path])
+    db.session.commit()
+    return job
+
+
+def get_job(job_id, user_id):
+    """
+    Fetch a job owned by a user, bypassing any state cached in the session
+
+    Args:
+        job_id (str): Job identifier
+        user_id (int): Owner used for authorization
+
+    Returns:
+        PredictionJob: The job, or None if it does not exist or belongs to someone else
+    """
+    db.session.rollback()  # end the current transaction so REPEATABLE READ sees worker updates
+    return PredictionJob.query.populate_existing().filter_by(id=job_id, user_id=user_id).first()
+
+
+def claim_next_job(worker_name, stale_after):
+    """
+    Atomically take the oldest runnable job
+
+    Queued jobs are runnable, and so are running jobs whose worker has not
+    finished them within `stale_after` (it most likely died). Every claim
+    stores a fresh random token in `claim`; only the run holding the
+    current token may finish the job.
+
+    Args:
+        worker_name (str): Recorded on the job for diagnostics (host:pid:thread)
+        stale_after (float): Seconds after which a running job is reclaimed
+
+    Returns:
+        PredictionJob: The claimed job (now running), or None if the queue is empty
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=stale_after)
+    job = (
+        PredictionJob.query
+        .filter(
+            (PredictionJob.status == JOB_QUEUED)
+            | ((PredictionJob.status == JOB_RUNNING) & (PredictionJob.started_at < cutoff))
+        )
+        .order_by(PredictionJob.created_at)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if job is None:
+        db.session.rollback()
+        return None
+    job.status = JOB_RUNNING
+    job.worker = worker_name[:255]
+    job.claim = uuid.uuid4().hex
+    job.started_at = datetime.utcnow()
+    db.session.commit()
+    return job
+
+
+def run_job(job):
+    """
+    Predict, look up the treatment and save the patient record for a claimed job
+
+    Args:
+        job (PredictionJob): A job in the running state
+    """
+    from flask import current_app
+    from .explanations import schedule_explanation
+    from .thumbnails import schedule_derivatives
+    from .operations import get_treatment_data, add_patient
+    from .route import score_image
+
+    job_id, claim = job.id, job.claim  # as claimed; a reclaim changes the row, not these
+    try:
+        result = score_image(job.image_path)
+        prediction, confidence = result.category, result.confidence
+        # The record and the job's completion are committed together: a worker
+        # dying in between would otherwise leave a record that a reclaimed
+        # run of the job adds again
+        patient = add_patient(job.name, job.age, job.gender, prediction, job.diagnosis_date,
+                              job.image_path, job.user_id, result, commit=False)
+        body = json.dumps({
+            'prediction': prediction,
+            'confidence': confidence,
+            'probabilities': result.probabilities,
+            'model_version': result.model_version,
+            'treatment': get_treatment_data(prediction),
+            'patient_id': patient.id,
+        })
+        finished = _finish(job_id, claim, status=JOB_DONE, result=body)
+    except Exception as e:
+        db.session.rollback()
+        _finish(job_id, claim, status=JOB_FAILED, error=str(e))
+        return
+    if not finished:
+        return
+    schedule_explanation(current_app._get_current_object(), job.image_path, prediction)
+    schedule_derivatives(current_app._get_current_object(), job.image_path)
+
+
+def _finish(job_id, claim, **values):
+    """
+    Complete a job, provided its `claim` token is still current, and commit
+
+    A run outlasting PREDICTION_JOB_TIMEOUT is reclaimed by another worker;
+    the conditional UPDATE lets only the current holder finish the job, and
+    everything the stale run added to the transaction (its patient record)
+    is rolled back.
+
+    Returns:
+        bool: Whether the job was completed
+    """
+    values['finished_at'] = datetime.utcnow()
+    finished = PredictionJob.query.filter(
+        PredictionJob.id == job_id, PredictionJob.claim == claim, PredictionJob.status == JOB_RUNNING,
+    ).update({getattr(PredictionJob, key): value for key, value in values.items()}, synchronize_session=False)
+    if not finished:
+        db.session.rollback()
+        return False
+    db.session.commit()
+    return True
+
+
+class JobWorkerPool:
+    """
+    Threads that claim and run prediction jobs
+
+    Attributes:
+    - app: Application whose context and config the workers use
+    - size: Number of worker threads
+    - poll_interval: Seconds to sleep when the queue is empty
+    """
+
+    def __init__(self, app, size, poll_interval=0.5):
+        self.app = app
+        self.size = size
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """Start the worker threads."""
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        for index in range(self.size):
+            thread = threading.Thread(target=self._work, args=(f"{prefix}:{index}",),
+                                      name=f"prediction-job-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Ask the workers to exit after their current job and wait for them."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _work(self, worker_name):
+        stale_after = self.app.config['PREDICTION_JOB_TIMEOUT']
+        while not self._stop.is_set():
+            with self.app.app_context():
+                try:
+                    job = claim_next_job(worker_name, stale_after)
+                    if job is not None:
+                        run_job(job)
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error(f"Error in prediction job worker: {str(e)}")
+                    job = None
+                finally:
+                    db.session.remove()
+            if job is None:
+                self._stop.wait(self.poll_interval)
+
+
+def ensure_worker_pool(app):
+    """
+    Start this process's in-process worker pool once, if PREDICTION_JOB_WORKERS > 0
+
+    Args:
+        app: The Flask application instance
+
+    Returns:
+        JobWorkerPool: The running pool, or None when in-process workers are disabled
+    """
+    global _pool
+    if _pool is None and app.config['PREDICTION_JOB_WORKERS'] > 0:
+        with _pool_lock:
+            if _pool is None:
+                _pool = JobWorkerPool(app, app.config['PREDICTION_JOB_WORKERS'])
+                _pool.start()
+    return _pool
+
+
+def wait_for_job(job_id, user_id, timeout, poll_interval=0.5):
+    """
+    Yield the job's state whenever it changes, until it finishes or `timeout` passes
+
+    Args:
+        job_id (str): Job identifier
+        user_id (int): Owner used for authorization
+        timeout (float): Seconds to keep watching
+        poll_interval (float): Seconds between checks
+
+    Yields:
+        dict: `PredictionJob.to_dict()` snapshots
+    """
+    deadline = time.monotonic() + timeout
+    last_status = None
+    while True:
+        job = get_job(job_id, user_id)
+        if job is None:
+            return
+        if job.status != last_status:
+            last_status = job.status
+            yield job.to_dict()
+        if job.status in FINISHED_STATES or time.monotonic() >= deadline:
+            return
+        time.sleep(poll_interval)
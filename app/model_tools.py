@@ -0,0 +1,273 @@
+# Model Export and Backend Verification Tools
+
+"""
+Offline Tooling for Serving Artifacts
+
+Converts the trained Keras model into the artifacts used by the alternative
+inference backends and checks that they behave like the original.
+
+Key Functionality:
+- Export `model/brains.h5` to TFLite and ONNX
+- Parity check: identical top-1 class and near-identical confidence across
+  backends on a sample image set
+- Latency / peak RSS comparison, each backend measured in a fresh process
+- Microbenchmark of `model.predict` against the compiled forward function
+
+Optional Dependencies:
+- tf2onnx for the ONNX export, onnxruntime for serving/verifying it
+
+"""
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from .backends import BACKENDS, INPUT_SHAPE, load_backend
+from .preprocessing import decode_into, new_batch
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def export_tflite(keras_path, output_path):
+    """
+    Convert the Keras model into a float32 TFLite flatbuffer
+
+    Args:
+        keras_path (str): Source `.h5` model
+        output_path (str): Destination `.tflite` file
+
+    Returns:
+        str: The written path
+    """
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(keras_path)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    with open(output_path, 'wb') as f:
+        f.write(converter.convert())
+    return output_path
+
+
+def export_onnx(keras_path, output_path, opset=13):
+    """
+    Convert the Keras model into an ONNX graph with a dynamic batch axis
+
+    Args:
+        keras_path (str): Source `.h5` model
+        output_path (str): Destination `.onnx` file
+        opset (int): ONNX opset version
+
+    Returns:
+        str: The written path
+    """
+    import tensorflow as tf
+    try:
+        import tf2onnx
+    except ImportError:
+        raise RuntimeError("ONNX export requires the tf2onnx package")
+
+    model = tf.keras.models.load_model(keras_path)
+    signature = (tf.TensorSpec((None,) + INPUT_SHAPE, tf.float32, name='input'),)
+    tf2onnx.convert.from_keras(model, input_signature=signature, opset=opset, output_path=output_path)
+    return output_path
+
+
+def find_images(directory, limit=None):
+    """
+    List image files under a directory, recursively and in a stable order
+
+    Args:
+        directory (str): Root directory (a flat folder or a class-per-folder layout)
+        limit (int, optional): Maximum number of files to return
+
+    Returns:
+        list: Image file paths
+    """
+    paths = []
+    for root, _, files in sorted(os.walk(directory)):
+        paths.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith(IMAGE_EXTENSIONS))
+    return paths[:limit] if limit else paths
+
+
+def load_samples(paths):
+    """
+    Decode image files into one preprocessed batch
+
+    Args:
+        paths (list): Image file paths
+
+    Returns:
+        np.ndarray: Float32 batch of shape (N, 150, 150, 3)
+    """
+    batch = new_batch(len(paths))
+    for row, path in enumerate(paths):
+        with open(path, 'rb') as f:
+            decode_into(f.read(), batch[row])
+    return batch
+
+
+def parity_check(backends, samples, reference='keras', confidence_tolerance=0.01, batch_size=16):
+    """
+    Compare backends against a reference backend on the same inputs
+
+    Args:
+        backends (dict): Backend name -> artifact path; must include `reference`
+        samples (np.ndarray): Preprocessed sample batch
+        reference (str): Backend whose outputs are treated as ground truth
+        confidence_tolerance (float): Largest allowed absolute difference of the
+            top-1 probability (0.01 == one percentage point)
+        batch_size (int): Rows per forward pass
+
+    Returns:
+        dict: Per-backend agreement report and an overall `passed` flag
+    """
+    outputs = {}
+    for name, path in backends.items():
+        backend = load_backend(name, path)
+        outputs[name] = np.concatenate([
+            backend.predict(samples[i:i + batch_size]) for i in range(0, len(samples), batch_size)
+        ])
+
+    expected = outputs[reference]
+    expected_top1 = expected.argmax(axis=1)
+    report = {'reference': reference, 'samples': int(len(samples)), 'backends': {}, 'passed': True}
+    for name, probabilities in outputs.items():
+        if name == reference:
+            continue
+        top1 = probabilities.argmax(axis=1)
+        rows = np.arange(len(samples))
+        confidence_delta = np.abs(probabilities[rows, expected_top1] - expected[rows, expected_top1])
+        mismatches = int((top1 != expected_top1).sum())
+        passed = mismatches == 0 and float(confidence_delta.max()) <= confidence_tolerance
+        report['backends'][name] = {
+            'top1_mismatches': mismatches,
+            'max_confidence_delta': float(confidence_delta.max()),
+            'mean_confidence_delta': float(confidence_delta.mean()),
+            'max_abs_probability_delta': float(np.abs(probabilities - expected).max()),
+            'passed': passed,
+        }
+        report['passed'] = report['passed'] and passed
+    return report
+
+
+def _latency_summary(latencies):
+    return {
+        'p50': round(float(np.percentile(latencies, 50)), 3),
+        'p95': round(float(np.percentile(latencies, 95)), 3),
+        'mean': round(float(np.mean(latencies)), 3),
+    }
+
+
+def measure_backend(name, path, batch_size=1, iterations=50):
+    """
+    Measure load time, forward-pass latency and peak RSS of one backend in this process
+
+    Args:
+        name (str): Backend name
+        path (str): Artifact path
+        batch_size (int): Rows per forward pass
+        iterations (int): Timed forward passes (after one untimed warm-up pass)
+
+    Returns:
+        dict: Load seconds, latency percentiles (ms) and peak RSS (MiB)
+    """
+    started = time.perf_counter()
+    backend = load_backend(name, path)
+    load_seconds = time.perf_counter() - started
+
+    batch = np.random.default_rng(0).random((batch_size,) + INPUT_SHAPE, dtype=np.float32)
+    backend.predict(batch)
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        backend.predict(batch)
+        latencies.append((time.perf_counter() - started) * 1000.0)
+
+    return {
+        'backend': name,
+        'model_path': path,
+        'batch_size': batch_size,
+        'load_seconds': round(load_seconds, 3),
+        'latency_ms': _latency_summary(latencies),
+        # ru_maxrss is reported in KiB on Linux
+        'peak_rss_mib': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1),
+    }
+
+
+def benchmark_forward(keras_path, batch_sizes=(1, 4, 8), iterations=100):
+    """
+    Per-call latency of `model.predict` versus the compiled forward function
+
+    Both paths run the same loaded model on the same inputs; the compiled
+    path is what KerasBackend serves.
+
+    Args:
+        keras_path (str): Source `.h5` model
+        batch_sizes (iterable): Batch sizes to measure
+        iterations (int): Timed calls per path and batch size (after a warm-up call)
+
+    Returns:
+        list: Latency percentiles (ms) of both paths and the speed-up per batch size
+    """
+    backend = load_backend('keras', keras_path)
+    rng = np.random.default_rng(0)
+    results = []
+    for batch_size in batch_sizes:
+        batch = rng.random((batch_size,) + INPUT_SHAPE, dtype=np.float32)
+        paths = {
+            'model_predict': lambda: backend.model.predict(batch, verbose=0),
+            'compiled': lambda: backend.predict(batch),
+        }
+        timings = {}
+        for name, call in paths.items():
+            call()
+            latencies = []
+            for _ in range(iterations):
+                started = time.perf_counter()
+                call()
+                latencies.append((time.perf_counter() - started) * 1000.0)
+            timings[name] = _latency_summary(latencies)
+        results.append({
+            'batch_size': batch_size,
+            'latency_ms': timings,
+            'speedup_p50': round(timings['model_predict']['p50'] / timings['compiled']['p50'], 2),
+        })
+    return results
+
+
+def compare_backends(backends, batch_size=1, iterations=50):
+    """
+    Latency / RSS report for several backends, each measured in its own process
+
+    A fresh interpreter per backend keeps one runtime's memory from
+    inflating the RSS figure of the next.
+
+    Args:
+        backends (dict): Backend name -> artifact path
+        batch_size (int): Rows per forward pass
+        iterations (int): Timed forward passes per backend
+
+    Returns:
+        list: One `measure_backend` result per backend
+    """
+    results = []
+    for name, path in backends.items():
+        output = subprocess.run(
+            [sys.executable, '-m', 'app.model_tools', 'measure', name, path, str(batch_size), str(iterations)],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+if __name__ == '__main__':
+    # Entry point used by compare_backends: measure one backend and print JSON
+    if len(sys.argv) == 6 and sys.argv[1] == 'measure' and sys.argv[2] in BACKENDS:
+        print(json.dumps(measure_backend(sys.argv[2], sys.argv[3], int(sys.argv[4]), int(sys.argv[5]))))
+    else:
+        sys.exit("usage: python -m app.model_tools measure <backend> <model_path> <batch_size> <iterations>")
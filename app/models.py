@@ -23,6 +23,7 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+import json
 import random
 import string
 
@@ -104,6 +105,9 @@ class Treatment(db.Model):
     Methods:
     - to_dict(): Convert treatment data to dictionary for easy serialization
     """
+    # Looked up by tumor type on every prediction
+    __table_args__ = (db.Index('tumor_type', 'tumor_type'),)
+
     id = db.Column(db.Integer, primary_key=True)
     tumor_type = db.Column(db.String(80), nullable=False)
     description = db.Column(db.Text, nullable=False)
@@ -140,10 +144,25 @@ class Patient(db.Model):
     - diagnosis_date: Date of tumor diagnosis
     - image_path: Path to patient's medical imaging file
     - user_id: Foreign key linking to the User who created the record
+    - probabilities: JSON {category: probability} of the prediction
+    - confidence: Probability of tumor_type, in percent
+    - model_version: Version of the model that produced the prediction
+    - inference_ms: Time spent obtaining the prediction
+
+    The prediction columns are NULL for records created before they existed
+    (until `flask patients rescore` fills them in) and for manual diagnoses.
 
     Relationships:
     - Belongs to a specific User (many-to-one relationship)
     """
+    # Reports filter on the producing model and on low-confidence predictions;
+    # the patients list seeks on (diagnosis_date, id)
+    __table_args__ = (
+        db.Index('model_version', 'model_version'),
+        db.Index('tumor_type_confidence', 'tumor_type', 'confidence'),
+        db.Index('diagnosis_date_id', 'diagnosis_date', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     age = db.Column(db.Integer, nullable=False)
@@ -151,12 +170,30 @@ class Patient(db.Model):
     tumor_type = db.Column(db.String(80), nullable=True)  # Stores predicted tumor type
     diagnosis_date = db.Column(db.Date, nullable=False)
     image_path = db.Column(db.String(200), nullable=True)  # Medical image file path
+    probabilities = db.Column(db.Text, nullable=True)
+    confidence = db.Column(db.Float, nullable=True)
+    model_version = db.Column(db.String(64), nullable=True)
+    inference_ms = db.Column(db.Float, nullable=True)
     
     # Foreign key relationship with User model
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
 
     # Commented out potential Treatment relationship
     # treatment_id = db.Column(db.Integer, db.ForeignKey('treatment.id'), nullable=True)
+
+    def prediction_details(self):
+        """
+        Stored output of the model for this record
+
+        Returns:
+            dict: probabilities (decoded), confidence, model_version and inference_ms
+        """
+        return {
+            'probabilities': json.loads(self.probabilities) if self.probabilities else None,
+            'confidence': self.confidence,
+            'model_version': self.model_version,
+            'inference_ms': self.inference_ms,
+        }
 """
 Database Design Considerations:
 1. Secure password storage using hash
@@ -181,9 +218,232 @@ class Admin(db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
     
+class CacheVersion(db.Model):
+    """
+    Version stamp of data that every worker caches in memory
+
+    Writers bump the version in the same transaction as their change;
+    workers compare it with the version their copy was built from.
+
+    Attributes:
+    - name: Cached dataset, e.g. 'treatments'
+    - version: Incremented on every write
+    - updated_at: Time of the last write
+    """
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class StatCounter(db.Model):
+    """
+    Running count (and sum) behind the dashboard and statistics totals
+
+    Writers of users and patient records adjust the counters in the same
+    transaction as their change; `flask stats reconcile` recomputes them.
+
+    Attributes:
+    - name: Counter, e.g. 'patients' or 'confidence:Glioma' (see app/stat_counters.py)
+    - count: Number of rows counted
+    - total: Sum of the counted value, for counters of a column (0 otherwise)
+    """
+    __tablename__ = 'stat_counter'
+
+    name = db.Column(db.String(100), primary_key=True)
+    count = db.Column(db.BigInteger, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0.0)
+
+class PredictionRollup(db.Model):
+    """
+    Patient records per diagnosis day, user and predicted tumor type
+
+    Derived from the patient table by `refresh_rollups` (app/analytics.py).
+
+    Attributes:
+    - day: Diagnosis date
+    - user_id: User who created the records
+    - tumor_type: Predicted tumor type ('' for records without one)
+    - count: Number of records
+    """
+    __tablename__ = 'prediction_rollup'
+
+    day = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    tumor_type = db.Column(db.String(80), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class LoginRollup(db.Model):
+    """
+    Login attempts per day (UTC), derived from user_login by `refresh_rollups`
+
+    Attributes:
+    - day: Date of the attempts
+    - successes / failures: Number of successful and failed attempts
+    """
+    __tablename__ = 'login_rollup'
+
+    day = db.Column(db.Date, primary_key=True)
+    successes = db.Column(db.Integer, nullable=False, default=0)
+    failures = db.Column(db.Integer, nullable=False, default=0)
+
+class RollupWatermark(db.Model):
+    """
+    Highest source row id folded into a rollup
+
+    Attributes:
+    - name: Rollup, 'predictions' or 'logins'
+    - last_id: Source rows with a higher id are not rolled up yet
+    - refreshed_at: Time of the last refresh
+    """
+    __tablename__ = 'rollup_watermark'
+
+    name = db.Column(db.String(50), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    refreshed_at = db.Column(db.DateTime, nullable=True)
+
+class RollupStaleDay(db.Model):
+    """
+    Day whose prediction or login rollup must be recomputed
+
+    Written by the writers that delete or re-score existing patient records,
+    or delete login attempts; the next refresh recomputes the day and removes
+    the row.
+
+    Attributes:
+    - rollup: 'predictions' or 'logins'
+    - day: Diagnosis date, or UTC date of the login attempts
+    - marked_at: Time of the last change on that day
+    """
+    __tablename__ = 'rollup_stale_day'
+
+    rollup = db.Column(db.String(50), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    marked_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
 class UserLogin(db.Model):
+    # The admin dashboard and login log show the most recent attempts first
+    __table_args__ = (db.Index('timestamp', 'timestamp'),)
+
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    success = db.Column(db.Boolean, default=True)
+    success = db.Column(db.Boolean, default=True, nullable=False)
     user = db.relationship('User', backref=db.backref('login_attempts', lazy=True))
+
+class VolumeStudy(db.Model):
+    """
+    Volumetric scan (NIfTI volume or DICOM series) behind a patient record
+
+    The patient's tumor_type holds the study-level prediction and its
+    image_path the key slice; the volume and the per-slice results live here.
+
+    Attributes:
+    - patient_id: The patient record (one study per record)
+    - volume_path: Stored volume file
+    - modality: 'nifti' or 'dicom'
+    - slice_count: Axial slices in the volume
+    - scored_slices: Slices classified (background-only slices are skipped)
+    - key_slice: Slice saved as the patient's image
+    - slice_predictions: JSON list of {'index', 'probabilities'} per scored slice
+    - study_probabilities: JSON mean class probabilities over the scored slices
+    - created_at: When the study was ingested
+    """
+    __tablename__ = 'volume_study'
+
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id', ondelete='CASCADE'), nullable=False, unique=True)
+    volume_path = db.Column(db.String(200), nullable=False)
+    modality = db.Column(db.String(10), nullable=False)
+    slice_count = db.Column(db.Integer, nullable=False)
+    scored_slices = db.Column(db.Integer, nullable=False)
+    key_slice = db.Column(db.Integer, nullable=False)
+    slice_predictions = db.Column(db.Text(16777215), nullable=False)  # MEDIUMTEXT on MySQL
+    study_probabilities = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    patient = db.relationship('Patient', backref=db.backref('study', uselist=False, cascade='all, delete-orphan'))
+
+    def to_dict(self):
+        """
+        Serialize the study for the JSON API
+
+        Returns:
+            dict: Modality, slice counts, key slice, per-slice and study probabilities
+        """
+        return {
+            'modality': self.modality,
+            'slices': self.slice_count,
+            'scored_slices': self.scored_slices,
+            'key_slice': self.key_slice,
+            'slice_predictions': json.loads(self.slice_predictions),
+            'probabilities': json.loads(self.study_probabilities),
+        }
+
+class StoredFile(db.Model):
+    """
+    Content-addressed upload, shared by every record that references identical bytes
+
+    Attributes:
+    - path: File path, as stored in Patient.image_path (or the file behind User.profile_image)
+    - digest: SHA-256 of the content, also the file name
+    - size: File size in bytes
+    - ref_count: Number of records referencing the file; 0 makes it eligible for removal
+    - created_at, updated_at: Timestamps; updated_at changes with every reference change
+    """
+    __tablename__ = 'stored_file'
+    # Garbage collection scans for unreferenced files untouched for a grace period
+    __table_args__ = (db.Index('ref_count_updated_at', 'ref_count', 'updated_at'),)
+
+    path = db.Column(db.String(200), primary_key=True)
+    digest = db.Column(db.String(64), nullable=False, index=True)
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class PredictionJob(db.Model):
+    """
+    Asynchronous prediction request, persisted so it survives restarts
+
+    Attributes:
+    - id: Random job identifier returned to the client
+    - user_id: User who submitted the image
+    - status: queued, running, done or failed
+    - image_path: Uploaded image, already saved to disk
+    - name, age, gender, diagnosis_date: Patient fields from the prediction form
+    - result: JSON response body once the job is done
+    - error: Failure message if the job failed
+    - worker: Name of the worker that claimed the job, for diagnostics
+    - claim: Random token of the current claim; only its holder may finish the job
+    - created_at, started_at, finished_at: Lifecycle timestamps
+    """
+    # Workers scan for the oldest queued job
+    __table_args__ = (db.Index('status_created_at', 'status', 'created_at'),)
+
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='queued')
+    image_path = db.Column(db.String(200), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    age = db.Column(db.Integer, nullable=False)
+    gender = db.Column(db.String(10), nullable=False)
+    diagnosis_date = db.Column(db.Date, nullable=False)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    worker = db.Column(db.String(255), nullable=True)
+    claim = db.Column(db.String(32), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        """
+        Serialize the job status for the polling and event-stream endpoints
+
+        Returns:
+            dict: Job id, status, result (decoded) and error
+        """
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+        }
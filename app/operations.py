@@ -13,8 +13,14 @@ Key Functionality:
 
 """
 
-from .models import db, User, Treatment, Patient,Admin
+from .analytics import mark_stale_days
+from .models import db, User, Treatment, Patient,Admin, VolumeStudy
+from .stat_counters import (CONFIDENCE, INFERENCE_MS, MIN_CONFIDENCE, MODEL_VERSION, PATIENTS, TUMOR_TYPE, USERS,
+                            increment_counters, patient_counts, read_counters)
+from .storage import acquire_files, release_files
+from .treatment_catalog import TREATMENTS, bump_cache_version, get_treatment_catalog
 from datetime import datetime
+import json
 from sqlalchemy.exc import SQLAlchemyError
 import smtplib
 from email.mime.text import MIMEText
@@ -59,6 +65,7 @@ def add_user(username, email, password):
     new_user = User(username=username, email=email)
     new_user.set_password(password)
     db.session.add(new_user)
+    increment_counters({USERS: (1, 0.0)})
     db.session.commit()
     return new_user
 
@@ -96,7 +103,9 @@ def add_treatment(tumor_type, description, recommended_medication, duration, sid
         side_effects=side_effects
     )
     db.session.add(new_treatment)
+    bump_cache_version(TREATMENTS)
     db.session.commit()
+    get_treatment_catalog().invalidate()
     return new_treatment
 
 def get_treatment_by_tumor_type(tumor_type):
@@ -111,7 +120,39 @@ def get_treatment_by_tumor_type(tumor_type):
     """
     return Treatment.query.filter_by(tumor_type=tumor_type).first()
 
-def add_patient(name, age, gender, prediction, diagnosis_date, filepath, user_id):
+def get_treatment_data(tumor_type):
+    """
+    Serialized treatment protocol for a tumor type, from the in-process catalog
+    
+    Args:
+        tumor_type (str): Tumor type to look up
+    
+    Returns:
+        dict: `Treatment.to_dict()` of the protocol (shared, do not modify), or None
+    """
+    entry = get_treatment_catalog().get(tumor_type)
+    return entry.data if entry else None
+
+def prediction_columns(result):
+    """
+    Patient column values for a model prediction
+    
+    Args:
+        result (Prediction): Output of `prediction_result`, or None for a manual diagnosis
+    
+    Returns:
+        dict: probabilities (JSON), confidence, model_version and inference_ms
+    """
+    if result is None:
+        return {}
+    return {
+        'probabilities': json.dumps(result.probabilities),
+        'confidence': result.confidence,
+        'model_version': result.model_version,
+        'inference_ms': result.inference_ms,
+    }
+
+def add_patient(name, age, gender, prediction, diagnosis_date, filepath, user_id, result=None, commit=True):
     """
     Add a new patient record to the database
     
@@ -121,8 +162,11 @@ def add_patient(name, age, gender, prediction, diagnosis_date, filepath, user_id
         gender (str): Patient's gender
         prediction (str): Predicted tumor type
         diagnosis_date (date): Date of diagnosis
-        filepath (str): Path to medical image
+        filepath (str): Path to medical image, as returned by `BlobStore.put`
         user_id (int): ID of the user adding the record
+        result (Prediction, optional): Full model output behind `prediction`
+        commit (bool): Commit the record; when False it is only flushed, so the
+            caller can commit it together with other changes
     
     Returns:
         Patient: Newly created patient record
@@ -134,13 +178,107 @@ def add_patient(name, age, gender, prediction, diagnosis_date, filepath, user_id
         tumor_type=prediction, 
         diagnosis_date=diagnosis_date,
         image_path=filepath,
-        user_id=user_id
+        user_id=user_id,
+        **prediction_columns(result)
     )
 
     db.session.add(new_patient)
-    db.session.commit()
+    acquire_files([filepath])
+    increment_counters(patient_counts([new_patient]))
+    if commit:
+        db.session.commit()
+    else:
+        db.session.flush()
     return new_patient
 
+def add_patients(records):
+    """
+    Add several patient records in a single transaction
+    
+    Args:
+        records (list): Dicts with the keyword arguments of `add_patient` (`result` optional)
+    
+    Returns:
+        list: Newly created patient records, in input order
+    """
+    new_patients = [
+        Patient(
+            name=record['name'],
+            age=record['age'],
+            gender=record['gender'],
+            tumor_type=record['prediction'],
+            diagnosis_date=record['diagnosis_date'],
+            image_path=record['filepath'],
+            user_id=record['user_id'],
+            **prediction_columns(record.get('result'))
+        )
+        for record in records
+    ]
+
+    try:
+        db.session.add_all(new_patients)
+        acquire_files(record['filepath'] for record in records)
+        increment_counters(patient_counts(new_patients))
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        raise
+    return new_patients
+
+
+def add_volume_study(name, age, gender, diagnosis_date, user_id, image_path, volume_path, result,
+                     model_version=None, inference_ms=None):
+    """
+    Add a patient record for a volumetric scan, with its per-slice results
+    
+    Args:
+        name (str): Patient's full name
+        age (int): Patient's age
+        gender (str): Patient's gender
+        diagnosis_date (date): Date of diagnosis
+        user_id (int): ID of the user adding the record
+        image_path (str): Stored key slice image
+        volume_path (str): Stored volume file
+        result (dict): Output of `predict_volume`
+        model_version (str, optional): Version of the model that scored the slices
+        inference_ms (float, optional): Time spent scoring the whole volume
+    
+    Returns:
+        Patient: Newly created patient record (study-level prediction as tumor_type)
+    """
+    study = result['study']
+    new_patient = Patient(
+        name=name,
+        age=age,
+        gender=gender,
+        tumor_type=study['prediction'],
+        diagnosis_date=diagnosis_date,
+        image_path=image_path,
+        user_id=user_id,
+        probabilities=json.dumps(study['probabilities']),
+        confidence=study['confidence'],
+        model_version=model_version,
+        inference_ms=round(inference_ms, 2) if inference_ms is not None else None
+    )
+    new_patient.study = VolumeStudy(
+        volume_path=volume_path,
+        modality=result['modality'],
+        slice_count=result['slices'],
+        scored_slices=result['scored_slices'],
+        key_slice=study['key_slice'],
+        slice_predictions=json.dumps(result['slice_predictions']),
+        study_probabilities=json.dumps(study['probabilities'])
+    )
+
+    try:
+        db.session.add(new_patient)
+        acquire_files([image_path, volume_path])
+        increment_counters(patient_counts([new_patient]))
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        raise
+    return new_patient
 
 
 def update_user_profile(user_id, new_username=None, new_email=None, new_profile_image=None, new_password=None):
@@ -239,10 +377,94 @@ def delete_patient_record(patient_id, user_id):
     patient = Patient.query.filter_by(id=patient_id, user_id=user_id).first()
     if patient:
         db.session.delete(patient)
+        release_files([patient.image_path] + ([patient.study.volume_path] if patient.study else []))
+        increment_counters(patient_counts([patient], sign=-1))
+        mark_stale_days([patient.diagnosis_date])
         db.session.commit()
         return True
     return False
 
+def encode_patient_cursor(diagnosis_date, patient_id):
+    """
+    Opaque position of a row in the patients list, for the next page's `after`
+    
+    Args:
+        diagnosis_date (date): Diagnosis date of the last row shown
+        patient_id (int): ID of the last row shown
+    
+    Returns:
+        str: Cursor such as '2024-05-01.1234'
+    """
+    return f"{diagnosis_date.isoformat()}.{patient_id}"
+
+def decode_patient_cursor(cursor):
+    """
+    Parse a cursor produced by `encode_patient_cursor`
+    
+    Args:
+        cursor (str): Cursor from a previous page
+    
+    Returns:
+        tuple: (diagnosis_date, patient_id)
+    
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    day, _, patient_id = cursor.partition('.')
+    return datetime.strptime(day, '%Y-%m-%d').date(), int(patient_id)
+
+def patients_page_query(after=None):
+    """
+    Query of the patients list after a cursor, newest diagnosis first, without a LIMIT
+    
+    Args:
+        after (str): Cursor of the last row of the previous page, None for the first page
+    
+    Returns:
+        Query: Rows with id, name, age, gender, tumor_type, confidence,
+            diagnosis_date, image_path and username
+    
+    Raises:
+        ValueError: If `after` is malformed
+    """
+    query = db.session.query(
+        Patient.id, Patient.name, Patient.age, Patient.gender, Patient.tumor_type, Patient.confidence,
+        Patient.diagnosis_date, Patient.image_path, User.username
+    ).join(User, Patient.user_id == User.id)
+    if after:
+        last_date, last_id = decode_patient_cursor(after)
+        query = query.filter(db.or_(
+            Patient.diagnosis_date < last_date,
+            db.and_(Patient.diagnosis_date == last_date, Patient.id < last_id)
+        ))
+    return query.order_by(Patient.diagnosis_date.desc(), Patient.id.desc())
+
+def get_patients_page(after=None, limit=50):
+    """
+    One page of the patients list, newest diagnosis first
+    
+    Keyset pagination on (diagnosis_date, id): each page seeks past the last
+    row of the previous one through the diagnosis_date_id index, so deep
+    pages cost the same as the first. The creating user's name is joined in
+    the same query and only the displayed columns are fetched.
+    
+    Args:
+        after (str): Cursor of the last row of the previous page, None for the first page
+        limit (int): Rows per page
+    
+    Returns:
+        tuple: (rows of `patients_page_query`; cursor of the next page or None)
+    
+    Raises:
+        ValueError: If `after` is malformed
+    """
+    # One extra row tells whether there is a next page, without a COUNT
+    rows = patients_page_query(after).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_patient_cursor(rows[-1].diagnosis_date, rows[-1].id)
+
 def get_patients_by_tumor_type(tumor_type):
     """
     Retrieve patients with a specific tumor type
@@ -255,22 +477,110 @@ def get_patients_by_tumor_type(tumor_type):
     """
     return Patient.query.filter_by(tumor_type=tumor_type).all()
 
-def generate_patient_statistics():
+def patient_filters(tumor_type=None, model_version=None, min_confidence=None, max_confidence=None,
+                    date_from=None, date_to=None, user_id=None):
     """
-    Generate basic patient statistics
+    SQL conditions selecting patient records for reports
+    
+    Args:
+        tumor_type (str): Predicted tumor type
+        model_version (str): Version of the model that produced the prediction
+        min_confidence (float): Lowest confidence, in percent
+        max_confidence (float): Highest confidence, in percent (e.g. 60 for uncertain predictions)
+        date_from (date): First diagnosis date
+        date_to (date): Last diagnosis date
+        user_id (int): Records created by this user
     
     Returns:
-        dict: Statistical information about patients
+        list: Conditions for `Query.filter`
     """
-    total_patients = Patient.query.count()
-    tumor_type_distribution = db.session.query(
-        Patient.tumor_type, 
-        db.func.count(Patient.id)
-    ).group_by(Patient.tumor_type).all()
+    conditions = []
+    if tumor_type:
+        conditions.append(Patient.tumor_type == tumor_type)
+    if model_version:
+        conditions.append(Patient.model_version == model_version)
+    if min_confidence is not None:
+        conditions.append(Patient.confidence >= min_confidence)
+    if max_confidence is not None:
+        conditions.append(Patient.confidence <= max_confidence)
+    if date_from:
+        conditions.append(Patient.diagnosis_date >= date_from)
+    if date_to:
+        conditions.append(Patient.diagnosis_date <= date_to)
+    if user_id:
+        conditions.append(Patient.user_id == user_id)
+    return conditions
+
+def generate_patient_statistics(**filters):
+    """
+    Generate patient statistics from the stored predictions, without running the model
+    
+    Args:
+        **filters: Keyword arguments of `patient_filters`
     
+    Returns:
+        dict: Totals, the tumor type distribution with confidence and latency per
+            type, record counts per model version, and records never scored by the model
+    """
+    conditions = patient_filters(**filters)
+    if not conditions:
+        return _counter_statistics()
+    rows = db.session.query(
+        Patient.tumor_type,
+        db.func.count(Patient.id),
+        db.func.count(Patient.confidence),
+        db.func.avg(Patient.confidence),
+        db.func.min(Patient.confidence),
+        db.func.avg(Patient.inference_ms)
+    ).filter(*conditions).group_by(Patient.tumor_type).all()
+    by_model_version = db.session.query(
+        Patient.model_version,
+        db.func.count(Patient.id)
+    ).filter(*conditions).group_by(Patient.model_version).all()
+
+    def rounded(value):
+        return round(float(value), 2) if value is not None else None
+
+    return {
+        'total_patients': sum(count for _, count, *_ in rows),
+        'unscored_patients': sum(count - scored for _, count, scored, *_ in rows),
+        'tumor_type_distribution': {tumor_type: count for tumor_type, count, *_ in rows},
+        'by_tumor_type': {
+            tumor_type: {'count': count, 'mean_confidence': rounded(mean_confidence),
+                         'min_confidence': rounded(min_confidence), 'mean_inference_ms': rounded(mean_ms)}
+            for tumor_type, count, _, mean_confidence, min_confidence, mean_ms in rows
+        },
+        'by_model_version': {version or 'unknown': count for version, count in by_model_version},
+    }
+
+def _counter_statistics():
+    # Unfiltered statistics from the maintained counters, same shape as the aggregated ones
+    counters = read_counters()
+
+    def by_key(prefix):
+        return {name[len(prefix):] or None: value for name, value in counters.items()
+                if name.startswith(prefix) and value.count}
+
+    def mean(value):
+        return round(value.total / value.count, 2) if value else None
+
+    distribution = by_key(TUMOR_TYPE)
+    confidence = by_key(CONFIDENCE)
+    minimum = by_key(MIN_CONFIDENCE)
+    inference_ms = by_key(INFERENCE_MS)
+    total_patients = counters[PATIENTS].count if PATIENTS in counters else 0
+
     return {
         'total_patients': total_patients,
-        'tumor_type_distribution': dict(tumor_type_distribution)
+        'unscored_patients': total_patients - sum(value.count for value in confidence.values()),
+        'tumor_type_distribution': {tumor_type: value.count for tumor_type, value in distribution.items()},
+        'by_tumor_type': {
+            tumor_type: {'count': value.count, 'mean_confidence': mean(confidence.get(tumor_type)),
+                         'min_confidence': round(minimum[tumor_type].total, 2) if tumor_type in minimum else None,
+                         'mean_inference_ms': mean(inference_ms.get(tumor_type))}
+            for tumor_type, value in distribution.items()
+        },
+        'by_model_version': {version or 'unknown': value.count for version, value in by_key(MODEL_VERSION).items()},
     }
 
 def populate_treatments():
@@ -360,7 +670,9 @@ def populate_treatments():
         try:
             # Add all treatments to the database
             db.session.add_all(treatments)
+            bump_cache_version(TREATMENTS)
             db.session.commit()
+            get_treatment_catalog().invalidate()
             print("Treatment data successfully populated!")
         except Exception as e:
             db.session.rollback()
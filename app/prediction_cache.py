@@ -0,0 +1,174 @@
+# Prediction Result Cache
+
+"""
+Content-addressed Cache of Model Outputs
+
+Re-uploaded scans (second opinions, re-submits after form errors) produce
+exactly the same bytes, so their class probabilities can be served without
+running the CNN again.
+
+Key Functionality:
+- Keys combine a SHA-256 of the raw image bytes with the model version, so
+  pointing MODEL_PATH at a different model file never serves stale results
+- Bounded in-memory LRU tier shared by all model versions, so entries of
+  the outgoing model simply age out during a hot-swap
+- Optional on-disk tier that survives restarts, namespaced per model version
+- Hit / miss / eviction counters
+
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+_version_lock = threading.Lock()
+_version_memo = {}
+
+
+def image_digest(data):
+    """
+    Hash raw image bytes
+
+    Args:
+        data (bytes): Uploaded file content
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def model_version(model_path):
+    """
+    Identify a model file by the hash of its content
+
+    The hash is only recomputed when the file's path, size or mtime change.
+
+    Args:
+        model_path (str): Path to the model artifact
+
+    Returns:
+        str: Hex SHA-256 digest of the model file
+    """
+    stat = os.stat(model_path)
+    signature = (os.path.abspath(model_path), stat.st_size, stat.st_mtime_ns)
+    with _version_lock:
+        version = _version_memo.get(signature)
+        if version is None:
+            digest = hashlib.sha256()
+            with open(model_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+            version = digest.hexdigest()
+            _version_memo[signature] = version
+    return version
+
+
+class PredictionCache:
+    """
+    Two-tier cache of probability vectors keyed by (image hash, model version)
+
+    Attributes:
+    - max_entries: Capacity of the in-memory LRU tier
+    - disk_dir: Root of the persistent tier, or None to keep results in memory only
+    """
+
+    def __init__(self, max_entries=1024, disk_dir=None):
+        self.max_entries = max(0, int(max_entries))
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+
+    def _disk_path(self, digest, version):
+        return os.path.join(self.disk_dir, version[:16], digest[:2], f"{digest}.json")
+
+    def get(self, digest, version):
+        """
+        Look up the cached output for an image under a model version
+
+        Args:
+            digest (str): `image_digest` of the image bytes
+            version (str): `model_version` of the serving model
+
+        Returns:
+            np.ndarray: Cached class probabilities, or None on a miss
+        """
+        key = (digest, version)
+        with self._lock:
+            probabilities = self._entries.get(key)
+            if probabilities is not None:
+                self._entries.move_to_end(key)
+                self._counters['memory_hits'] += 1
+                return probabilities
+
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(digest, version)) as f:
+                    probabilities = np.asarray(json.load(f), dtype=np.float32)
+            except (OSError, ValueError):
+                probabilities = None
+            if probabilities is not None:
+                with self._lock:
+                    self._counters['disk_hits'] += 1
+                    self._remember(key, probabilities)
+                return probabilities
+
+        with self._lock:
+            self._counters['misses'] += 1
+        return None
+
+    def put(self, digest, version, probabilities):
+        """
+        Store the model output for an image under a model version
+
+        Args:
+            digest (str): `image_digest` of the image bytes
+            version (str): `model_version` of the model that produced the output
+            probabilities (np.ndarray): Softmax output for the image
+        """
+        probabilities = np.array(probabilities, dtype=np.float32)
+        with self._lock:
+            self._remember((digest, version), probabilities)
+
+        if self.disk_dir:
+            path = self._disk_path(digest, version)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(probabilities.tolist(), f)
+            os.replace(tmp_path, path)  # readers never see a half-written entry
+
+    def _remember(self, key, probabilities):
+        if self.max_entries == 0:
+            return
+        self._entries[key] = probabilities
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters['evictions'] += 1
+
+    def clear(self):
+        """Drop every in-memory entry (the disk tier is left untouched)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Snapshot of cache counters
+
+        Returns:
+            dict: Hit, miss and eviction counts plus current size and hit rate
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            counters['size'] = len(self._entries)
+            counters['max_entries'] = self.max_entries
+            counters['disk_enabled'] = bool(self.disk_dir)
+        lookups = counters['memory_hits'] + counters['disk_hits'] + counters['misses']
+        counters['hit_rate'] = round((lookups - counters['misses']) / lookups, 4) if lookups else 0.0
+        return counters
@@ -0,0 +1,192 @@
+# Image Preprocessing for the Tumor Classifier
+
+"""
+Decode-and-Downscale Path for Model Inputs
+
+Turns uploaded JPEG/PNG bytes into the (150, 150, 3) float32 input the
+classifier was trained on (RGB, nearest-neighbour resize, scaled to
+[0, 1]), with as little work and allocation as possible.
+
+Key Functionality:
+- Reduced-resolution JPEG decoding: when the source is at least twice the
+  target size, the decoder is put in draft mode and scales the DCT blocks
+  by 1/2, 1/4 or 1/8 while decoding, instead of producing every pixel of a
+  multi-megapixel scan only to throw most of them away
+- Decoding straight into a preallocated float32 batch buffer, normalized
+  in place (no expand_dims / float copy / division temporaries)
+- Reference implementation of the previous full-resolution path and a
+  numeric comparison against it
+
+Draft decoding averages pixels inside the decoder, so its output is close
+to, but not bit-identical with, the full-resolution path; PNG and small
+JPEGs take the full-resolution path and match it exactly.
+
+"""
+
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+from .backends import INPUT_SHAPE
+
+TARGET_SIZE = INPUT_SHAPE[1], INPUT_SHAPE[0]
+
+# Draft decoding is only used when the source is at least this many times the target
+DRAFT_MIN_SCALE = 2
+
+_SCALE = np.float32(255.0)
+
+
+def new_batch(size):
+    """
+    Allocate an uninitialized float32 batch buffer for `decode_into`
+
+    Args:
+        size (int): Number of images
+
+    Returns:
+        np.ndarray: Array of shape (size, 150, 150, 3)
+    """
+    return np.empty((size,) + INPUT_SHAPE, dtype=np.float32)
+
+
+def open_image(data):
+    """
+    Open an image for decoding at the smallest resolution that still covers the target
+
+    Nothing is decoded yet; pixels are produced on first access.
+
+    Args:
+        data (bytes): Raw JPEG/PNG bytes
+
+    Returns:
+        PIL.Image.Image: Lazily decoded image, in draft mode for large JPEGs
+    """
+    img = Image.open(io.BytesIO(data))
+    if (img.format == 'JPEG'
+            and img.size[0] >= DRAFT_MIN_SCALE * TARGET_SIZE[0]
+            and img.size[1] >= DRAFT_MIN_SCALE * TARGET_SIZE[1]):
+        # Picks the smallest DCT scale that still yields at least TARGET_SIZE
+        img.draft(img.mode, TARGET_SIZE)
+    return img
+
+
+def fit_into(img, out):
+    """
+    Convert an opened image to RGB, resize it to the target and normalize it into `out`
+
+    Args:
+        img (PIL.Image.Image): Image from `open_image`
+        out (np.ndarray): Float32 destination of shape (150, 150, 3)
+
+    Returns:
+        np.ndarray: `out`
+    """
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    if img.size != TARGET_SIZE:
+        img = img.resize(TARGET_SIZE, Image.NEAREST)
+    np.divide(np.asarray(img), _SCALE, out=out, dtype=np.float32)
+    return out
+
+
+def decode_into(data, out):
+    """
+    Decode an image and write the normalized model input into `out`
+
+    Args:
+        data (bytes): Raw JPEG/PNG bytes
+        out (np.ndarray): Float32 destination of shape (150, 150, 3), e.g. one row of `new_batch`
+
+    Returns:
+        np.ndarray: `out`
+    """
+    return fit_into(open_image(data), out)
+
+
+def decode_image(data):
+    """
+    Decode and preprocess an in-memory image for prediction
+
+    Args:
+        data (bytes): Raw JPEG/PNG bytes
+
+    Returns:
+        np.ndarray: Float32 array of shape (150, 150, 3), without a batch dimension
+    """
+    return decode_into(data, np.empty(INPUT_SHAPE, dtype=np.float32))
+
+
+def decode_batch(payloads):
+    """
+    Decode several images into one batch
+
+    Args:
+        payloads (list): Raw JPEG/PNG bytes
+
+    Returns:
+        np.ndarray: Float32 batch of shape (N, 150, 150, 3)
+    """
+    batch = new_batch(len(payloads))
+    for row, data in enumerate(payloads):
+        decode_into(data, batch[row])
+    return batch
+
+
+def reference_decode(data):
+    """
+    The previous full-resolution path, equivalent to Keras' `load_img(target_size=(150, 150))`
+    followed by `/ 255.0`; kept to verify `decode_image` against
+
+    Args:
+        data (bytes): Raw JPEG/PNG bytes
+
+    Returns:
+        np.ndarray: Float32 array of shape (150, 150, 3)
+    """
+    img = Image.open(io.BytesIO(data))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    if img.size != TARGET_SIZE:
+        img = img.resize(TARGET_SIZE, Image.NEAREST)
+    return np.asarray(img, dtype=np.float32) / 255.0
+
+
+def compare_with_reference(payloads, predict=None):
+    """
+    Numeric difference and speed of `decode_image` against `reference_decode`
+
+    Args:
+        payloads (list): Raw JPEG/PNG bytes
+        predict (callable, optional): Batch -> class probabilities; when given, the
+            model outputs of both paths are compared as well
+
+    Returns:
+        dict: Per-pixel absolute differences (max, mean, p99), total milliseconds of
+            both paths and, with `predict`, top-1 mismatches and confidence deltas
+    """
+    timings = {}
+    outputs = {}
+    for name, decode in (('reference', lambda items: np.stack([reference_decode(data) for data in items])),
+                         ('fast', decode_batch)):
+        started = time.perf_counter()
+        outputs[name] = decode(payloads)
+        timings[name] = round((time.perf_counter() - started) * 1000.0, 3)
+    delta = np.abs(outputs['fast'] - outputs['reference'])
+    report = {
+        'images': len(payloads),
+        'max_abs_delta': float(delta.max()),
+        'mean_abs_delta': float(delta.mean()),
+        'p99_abs_delta': float(np.percentile(delta, 99)),
+        'reference_ms': timings['reference'],
+        'fast_ms': timings['fast'],
+    }
+    if predict is not None:
+        expected, actual = predict(outputs['reference']), predict(outputs['fast'])
+        rows = np.arange(len(payloads))
+        top1 = expected.argmax(axis=1)
+        report['top1_mismatches'] = int((actual.argmax(axis=1) != top1).sum())
+        report['max_confidence_delta'] = float(np.abs(actual[rows, top1] - expected[rows, top1]).max())
+    return report
@@ -0,0 +1,213 @@
+# Post-training Quantization of the Tumor Classifier
+
+"""
+INT8 / Float16 Quantization with an Accuracy Gate
+
+Produces reduced-precision TFLite variants of the Keras model and only
+publishes them if they classify the held-out test set about as well as the
+float model.
+
+Dataset Layout (the same one model/brain.ipynb trains on):
+    <data_dir>/Training/<glioma|meningioma|notumor|pituitary>/*.jpg
+    <data_dir>/Testing/<glioma|meningioma|notumor|pituitary>/*.jpg
+
+Key Functionality:
+- INT8 quantization calibrated on a class-balanced sample of Training
+- Float16 weight quantization (no calibration needed)
+- Per-class accuracy of float vs quantized model on Testing
+- Publishing refused when any class loses more than the allowed accuracy
+
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+from .backends import load_backend
+from .model_tools import find_images, load_samples
+
+# Folder names used by the training notebook, in the model's output order
+DATASET_CLASSES = ["glioma", "meningioma", "notumor", "pituitary"]
+
+QUANTIZATION_MODES = ('int8', 'float16')
+
+
+def labelled_images(split_dir, per_class_limit=None):
+    """
+    List images of a dataset split with their class indices
+
+    Args:
+        split_dir (str): A Training or Testing directory
+        per_class_limit (int, optional): Maximum images taken from each class
+
+    Returns:
+        list: (path, class index) pairs, classes interleaved round-robin
+    """
+    per_class = [find_images(os.path.join(split_dir, name), per_class_limit) for name in DATASET_CLASSES]
+    pairs = []
+    for row in range(max((len(paths) for paths in per_class), default=0)):
+        for label, paths in enumerate(per_class):
+            if row < len(paths):
+                pairs.append((paths[row], label))
+    return pairs
+
+
+def quantize(keras_path, output_path, mode='int8', calibration_dir=None, calibration_samples=200):
+    """
+    Convert the Keras model into a quantized TFLite flatbuffer
+
+    INT8 uses full-integer kernels with float32 input/output, so the serving
+    code feeds it exactly like the float model.
+
+    Args:
+        keras_path (str): Source `.h5` model
+        output_path (str): Destination `.tflite` file
+        mode (str): 'int8' or 'float16'
+        calibration_dir (str): Training split used to calibrate INT8 activation ranges
+        calibration_samples (int): Number of calibration images
+
+    Returns:
+        str: The written path
+    """
+    import tensorflow as tf
+
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode '{mode}'")
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(tf.keras.models.load_model(keras_path))
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if mode == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    else:
+        per_class = -(-calibration_samples // len(DATASET_CLASSES))
+        paths = [path for path, _ in labelled_images(calibration_dir, per_class)][:calibration_samples]
+        if not paths:
+            raise ValueError(f"No calibration images found in {calibration_dir}")
+
+        def representative_dataset():
+            for path in paths:
+                yield [load_samples([path])]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    with open(output_path, 'wb') as f:
+        f.write(converter.convert())
+    return output_path
+
+
+def evaluate(backends, test_dir, per_class_limit=None, batch_size=32):
+    """
+    Per-class accuracy of several backends on the Testing split
+
+    Args:
+        backends (dict): Label -> loaded InferenceBackend
+        test_dir (str): Testing split directory
+        per_class_limit (int, optional): Maximum images evaluated per class
+        batch_size (int): Rows per forward pass
+
+    Returns:
+        dict: Label -> {'overall': accuracy, 'per_class': {class: accuracy}}
+    """
+    pairs = labelled_images(test_dir, per_class_limit)
+    if not pairs:
+        raise ValueError(f"No test images found in {test_dir}")
+    labels = np.array([label for _, label in pairs])
+
+    predicted = {name: [] for name in backends}
+    for start in range(0, len(pairs), batch_size):
+        batch = load_samples([path for path, _ in pairs[start:start + batch_size]])
+        for name, backend in backends.items():
+            predicted[name].append(backend.predict(batch).argmax(axis=1))
+
+    results = {}
+    for name, chunks in predicted.items():
+        correct = np.concatenate(chunks) == labels
+        results[name] = {
+            'overall': float(correct.mean()),
+            'per_class': {
+                class_name: float(correct[labels == index].mean()) if (labels == index).any() else None
+                for index, class_name in enumerate(DATASET_CLASSES)
+            },
+        }
+    return results
+
+
+def accuracy_gate(float_accuracy, quantized_accuracy, max_drop):
+    """
+    Decide whether a quantized model is accurate enough to publish
+
+    Args:
+        float_accuracy (dict): `evaluate` result of the float model
+        quantized_accuracy (dict): `evaluate` result of the quantized model
+        max_drop (float): Largest allowed accuracy loss of any class (0.01 == 1 point)
+
+    Returns:
+        dict: Per-class and overall deltas (quantized - float) and a `passed` flag
+    """
+    deltas = {
+        class_name: (quantized_accuracy['per_class'][class_name] - accuracy
+                     if accuracy is not None else None)
+        for class_name, accuracy in float_accuracy['per_class'].items()
+    }
+    worst = min((delta for delta in deltas.values() if delta is not None), default=0.0)
+    overall = quantized_accuracy['overall'] - float_accuracy['overall']
+    return {
+        'per_class_delta': deltas,
+        'overall_delta': overall,
+        'max_allowed_drop': max_drop,
+        'passed': worst >= -max_drop and overall >= -max_drop,
+    }
+
+
+def quantize_and_publish(keras_path, output_path, data_dir, mode='int8', max_drop=0.01,
+                         calibration_samples=200, per_class_limit=None):
+    """
+    Quantize, evaluate against the float model and publish only if the gate passes
+
+    The candidate is written next to `output_path` and moved into place
+    atomically on success; on failure it is deleted and `output_path` is left
+    untouched. A `<output_path>.json` report is written when publishing.
+
+    Args:
+        keras_path (str): Source `.h5` model
+        output_path (str): Published `.tflite` path
+        data_dir (str): Dataset root containing Training/ and Testing/
+        mode (str): 'int8' or 'float16'
+        max_drop (float): Largest allowed per-class accuracy loss
+        calibration_samples (int): INT8 calibration images
+        per_class_limit (int, optional): Maximum test images per class
+
+    Returns:
+        dict: Evaluation report including `published`
+    """
+    candidate = f"{output_path}.candidate"
+    started = time.perf_counter()
+    quantize(keras_path, candidate, mode, os.path.join(data_dir, 'Training'), calibration_samples)
+
+    accuracy = evaluate(
+        {'float': load_backend('keras', keras_path), mode: load_backend('tflite', candidate)},
+        os.path.join(data_dir, 'Testing'),
+        per_class_limit,
+    )
+    report = {
+        'mode': mode,
+        'source': keras_path,
+        'output': output_path,
+        'accuracy': accuracy,
+        'gate': accuracy_gate(accuracy['float'], accuracy[mode], max_drop),
+        'float_size_bytes': os.path.getsize(keras_path),
+        'quantized_size_bytes': os.path.getsize(candidate),
+    }
+
+    report['published'] = report['gate']['passed']
+    if report['published']:
+        os.replace(candidate, output_path)
+        with open(f"{output_path}.json", 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        os.remove(candidate)
+    report['seconds'] = round(time.perf_counter() - started, 2)
+    return report
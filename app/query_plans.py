@@ -0,0 +1,118 @@
+# Query Plan Checks
+
+"""
+EXPLAIN Checks for the Hot Query Paths
+
+The queries below run on every prediction, page view or dashboard load.
+Each one is backed by an index created by a migration; `flask schema
+explain` asks the database for their plans and fails when a query is not
+answered through its index (a dropped or renamed index, or a query
+rewritten in a way the index no longer serves).
+
+MySQL's optimizer may prefer a full scan on tables with a handful of rows,
+so run the check against a database of representative size (or after
+ANALYZE TABLE). SQLite plans do not depend on table size until ANALYZE has
+run, which makes the check deterministic in tests.
+
+Key Functionality:
+- HOT_QUERIES: the checked queries and the index each must use
+- explain_query: the indexes a query's plan uses (MySQL EXPLAIN / SQLite EXPLAIN QUERY PLAN)
+- explain_hot_queries: report over all hot queries
+
+"""
+
+import re
+from collections import namedtuple
+from datetime import date, datetime
+
+from .models import db, Patient, PredictionJob, Treatment, UserLogin
+from .operations import encode_patient_cursor, patients_page_query
+
+HotQuery = namedtuple('HotQuery', ['name', 'build', 'index'])
+
+# build() returns the query as the application issues it, with representative parameters
+HOT_QUERIES = (
+    HotQuery('treatment_by_tumor_type',
+             lambda: Treatment.query.filter_by(tumor_type='Glioma').limit(1), 'tumor_type'),
+    HotQuery('patients_by_tumor_type',
+             lambda: Patient.query.filter_by(tumor_type='Glioma'), 'tumor_type_confidence'),
+    HotQuery('tumor_type_distribution',
+             lambda: db.session.query(Patient.tumor_type, db.func.count(Patient.id)).group_by(Patient.tumor_type),
+             'tumor_type_confidence'),
+    HotQuery('min_confidence_by_tumor_type',
+             lambda: db.session.query(Patient.confidence)
+             .filter(Patient.tumor_type == 'Glioma', Patient.confidence.isnot(None))
+             .order_by(Patient.confidence).limit(1), 'tumor_type_confidence'),
+    HotQuery('patients_page',
+             lambda: patients_page_query(encode_patient_cursor(date.today(), 2 ** 31 - 1)).limit(51),
+             'diagnosis_date_id'),
+    HotQuery('prediction_rollup_days',
+             lambda: db.session.query(Patient.diagnosis_date, Patient.user_id, Patient.tumor_type,
+                                      db.func.count(Patient.id))
+             .filter(Patient.diagnosis_date.in_([date.today()]))
+             .group_by(Patient.diagnosis_date, Patient.user_id, Patient.tumor_type), 'diagnosis_date_id'),
+    HotQuery('login_rollup_days',
+             lambda: db.session.query(db.func.date(UserLogin.timestamp), UserLogin.success, db.func.count(UserLogin.id))
+             .filter(UserLogin.timestamp >= datetime(2024, 1, 1), UserLogin.timestamp < datetime(2024, 1, 2))
+             .group_by(db.func.date(UserLogin.timestamp), UserLogin.success), 'timestamp'),
+    HotQuery('recent_logins',
+             lambda: UserLogin.query.order_by(UserLogin.timestamp.desc()).limit(5), 'timestamp'),
+    HotQuery('next_prediction_job',
+             lambda: PredictionJob.query.filter(PredictionJob.status == 'queued')
+             .order_by(PredictionJob.created_at).limit(1), 'status_created_at'),
+)
+
+_SQLITE_INDEX = re.compile(r'USING (?:COVERING )?INDEX (\w+)')
+
+
+def explain_query(query):
+    """
+    Ask the database how it would run a query
+
+    Args:
+        query: SQLAlchemy ORM query
+
+    Returns:
+        tuple: (names of the indexes the plan uses, plan lines as text)
+    """
+    connection = db.session.connection()
+    # render_postcompile expands IN lists into one bound parameter per value
+    compiled = query.statement.compile(dialect=connection.dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+
+    if connection.dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + compiled.string, params).fetchall()
+        plan = [row[-1] for row in rows]
+        indexes = [name for line in plan for name in _SQLITE_INDEX.findall(line)]
+    else:
+        rows = connection.exec_driver_sql('EXPLAIN ' + compiled.string, params).mappings().fetchall()
+        plan = [f"{row['table']}: type={row['type']} key={row['key']} rows={row['rows']} {row['Extra'] or ''}".strip()
+                for row in rows]
+        indexes = [name for row in rows if row['key'] for name in row['key'].split(',')]
+    return indexes, plan
+
+
+def explain_hot_queries(queries=HOT_QUERIES):
+    """
+    Check that every hot query uses its index
+
+    Args:
+        queries (tuple): HotQuery entries to check
+
+    Returns:
+        dict: dialect, overall `passed`, and per query the expected index,
+            the indexes used, the plan and whether it passed
+    """
+    report = []
+    for hot in queries:
+        indexes, plan = explain_query(hot.build())
+        report.append({'query': hot.name, 'expected_index': hot.index, 'used_indexes': indexes,
+                       'plan': plan, 'passed': hot.index in indexes})
+    db.session.rollback()
+    return {
+        'dialect': db.engine.dialect.name,
+        'passed': all(entry['passed'] for entry in report),
+        'queries': report,
+    }
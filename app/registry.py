@@ -0,0 +1,359 @@
+# Model Registry for the Tumor Classifier
+
+"""
+Versioned Model Artifacts with Hot-Swap and Shadow Evaluation
+
+Keeps every deployed model as an immutable version on local disk, so a
+retrained model can be promoted in running workers instead of restarting
+them.
+
+Layout:
+    <MODEL_REGISTRY_DIR>/versions/<version>/<artifact>   the model file
+    <MODEL_REGISTRY_DIR>/versions/<version>/metadata.json
+    <MODEL_REGISTRY_DIR>/ACTIVE                            version served to users
+    <MODEL_REGISTRY_DIR>/SHADOW                            candidate scored in the background
+    <MODEL_REGISTRY_DIR>/shadow/<version>/<worker>.json   shadow statistics per worker
+
+Pointer files are replaced atomically. Every worker re-reads them at most
+every MODEL_REGISTRY_CHECK_INTERVAL seconds, so a promotion made in one
+worker reaches all workers on the host without a restart.
+
+Key Functionality:
+- Register an artifact as a new version, with its hash and notes
+- Promote a version (ACTIVE) or select a shadow candidate (SHADOW)
+- Shadow evaluator: scores a sampled fraction of live predictions with the
+  candidate on a background thread and records agreement and latency
+
+"""
+
+import hashlib
+import json
+import os
+import random
+import shutil
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from .backends import BACKENDS, load_backend
+
+ACTIVE_POINTER = 'ACTIVE'
+SHADOW_POINTER = 'SHADOW'
+
+
+def _write_atomic(path, text):
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as f:
+        f.write(text)
+    os.replace(temporary, path)
+
+
+class ModelRegistry:
+    """
+    Model versions stored under one directory
+
+    Attributes:
+    - root: Registry directory
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _version_dir(self, version):
+        return os.path.join(self.root, 'versions', version)
+
+    def _read_pointer(self, name):
+        try:
+            with open(os.path.join(self.root, name)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def register(self, artifact_path, backend='keras', notes=''):
+        """
+        Copy a model artifact into the registry as a new version
+
+        Args:
+            artifact_path (str): Model file to register
+            backend (str): Backend that serves the artifact
+            notes (str): Free-form description (training run, dataset, ...)
+
+        Returns:
+            dict: Metadata of the new version
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown inference backend '{backend}'")
+        digest = hashlib.sha256()
+        with open(artifact_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        created_at = datetime.utcnow()
+        version = f"{created_at:%Y%m%d%H%M%S}-{digest.hexdigest()[:8]}"
+
+        version_dir = self._version_dir(version)
+        os.makedirs(version_dir)
+        artifact = os.path.basename(artifact_path)
+        shutil.copy2(artifact_path, os.path.join(version_dir, artifact))
+        metadata = {
+            'version': version,
+            'backend': backend,
+            'artifact': artifact,
+            'sha256': digest.hexdigest(),
+            'size_bytes': os.path.getsize(artifact_path),
+            'source': os.path.abspath(artifact_path),
+            'notes': notes,
+            'created_at': created_at.isoformat() + 'Z',
+        }
+        _write_atomic(os.path.join(version_dir, 'metadata.json'), json.dumps(metadata, indent=2))
+        return metadata
+
+    def get(self, version):
+        """
+        Metadata of one version
+
+        Args:
+            version (str): Version identifier
+
+        Returns:
+            dict: Metadata, or None if the version does not exist
+        """
+        try:
+            with open(os.path.join(self._version_dir(version), 'metadata.json')) as f:
+                return json.load(f)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+    def versions(self):
+        """
+        All registered versions, newest first
+
+        Returns:
+            list: Metadata dicts
+        """
+        try:
+            names = os.listdir(os.path.join(self.root, 'versions'))
+        except FileNotFoundError:
+            return []
+        found = [self.get(name) for name in names]
+        return sorted((m for m in found if m), key=lambda m: m['created_at'], reverse=True)
+
+    def artifact_path(self, version):
+        """
+        Path of the model file of a version
+
+        Args:
+            version (str): Version identifier
+
+        Returns:
+            str: Artifact path
+        """
+        return os.path.join(self._version_dir(version), self.get(version)['artifact'])
+
+    def active_version(self):
+        """Version currently served, or None if nothing was promoted yet."""
+        return self._read_pointer(ACTIVE_POINTER)
+
+    def shadow_version(self):
+        """Version evaluated in shadow mode, or None."""
+        return self._read_pointer(SHADOW_POINTER)
+
+    def promote(self, version):
+        """
+        Make a version the one served to users
+
+        Workers pick the change up on their next pointer check. A version
+        that was the shadow candidate stops being shadowed.
+
+        Args:
+            version (str): Version identifier
+        """
+        if self.get(version) is None:
+            raise ValueError(f"Unknown model version '{version}'")
+        _write_atomic(os.path.join(self.root, ACTIVE_POINTER), version)
+        if self.shadow_version() == version:
+            self.set_shadow(None)
+
+    def set_shadow(self, version):
+        """
+        Select the shadow candidate
+
+        Args:
+            version (str): Version identifier, or None to stop shadowing
+        """
+        path = os.path.join(self.root, SHADOW_POINTER)
+        if version is None:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        if self.get(version) is None:
+            raise ValueError(f"Unknown model version '{version}'")
+        _write_atomic(path, version)
+
+    def record_shadow_stats(self, version, worker, stats):
+        """Persist one worker's shadow statistics for `version`."""
+        directory = os.path.join(self.root, 'shadow', version)
+        os.makedirs(directory, exist_ok=True)
+        _write_atomic(os.path.join(directory, f"{worker}.json"), json.dumps(stats))
+
+    def shadow_stats(self, version):
+        """
+        Shadow statistics of a candidate, combined over every worker
+
+        Args:
+            version (str): Candidate version
+
+        Returns:
+            dict: Sample count, agreement rate, mean confidence delta and
+                latency percentiles (ms) of the primary and the candidate model
+        """
+        directory = os.path.join(self.root, 'shadow', version)
+        samples = agreements = dropped = 0
+        confidence_delta = 0.0
+        latencies = {'primary': [], 'shadow': []}
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    worker = json.load(f)
+            except (OSError, ValueError):
+                continue
+            samples += worker['samples']
+            agreements += worker['agreements']
+            dropped += worker['dropped']
+            confidence_delta += worker['confidence_delta_sum']
+            for key in latencies:
+                latencies[key].extend(worker['latency_ms'][key])
+
+        def percentiles(values):
+            if not values:
+                return None
+            return {'p50': round(float(np.percentile(values, 50)), 3),
+                    'p95': round(float(np.percentile(values, 95)), 3)}
+
+        return {
+            'version': version,
+            'workers': len(names),
+            'samples': samples,
+            'dropped': dropped,
+            'agreement_rate': round(agreements / samples, 4) if samples else None,
+            'mean_confidence_delta': round(confidence_delta / samples, 4) if samples else None,
+            'latency_ms': {key: percentiles(values) for key, values in latencies.items()},
+        }
+
+
+class ShadowEvaluator:
+    """
+    Scores a sample of live predictions with a candidate model, off the request path
+
+    `observe` only draws a random number and, for sampled requests, hands
+    the already decoded input to a single background thread; when that
+    thread falls behind, samples are dropped instead of queued. If the
+    candidate cannot be loaded, the evaluator stops sampling for good rather
+    than retrying the load on every sample.
+
+    Attributes:
+    - registry: ModelRegistry that stores the statistics
+    - version: Candidate version
+    - sample_rate: Fraction of predictions scored by the candidate
+    - error: Why the candidate could not be loaded, or None
+    """
+
+    def __init__(self, registry, version, sample_rate, intra_op_threads=0, inter_op_threads=0,
+                 max_pending=32, latency_window=500, flush_interval=5.0):
+        self.registry = registry
+        self.version = version
+        self.sample_rate = sample_rate
+        self._threads = (intra_op_threads, inter_op_threads)
+        self._backend = None
+        self.error = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shadow')
+        self._pending = threading.Semaphore(max_pending)
+        self._lock = threading.Lock()
+        self._worker = f"{socket.gethostname()}-{os.getpid()}"
+        self._samples = self._agreements = self._dropped = 0
+        self._confidence_delta = 0.0
+        self._latencies = {'primary': deque(maxlen=latency_window), 'shadow': deque(maxlen=latency_window)}
+        self._flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+
+    def observe(self, batch, probabilities, primary_ms):
+        """
+        Offer live predictions for shadow scoring
+
+        Args:
+            batch (np.ndarray): Model inputs of shape (N, 150, 150, 3)
+            probabilities (np.ndarray): Outputs of the primary model, shape (N, 4)
+            primary_ms (float): Primary model latency for this batch
+        """
+        if self.error is not None or self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return
+        if not self._pending.acquire(blocking=False):
+            with self._lock:
+                self._dropped += 1
+            return
+        future = self._executor.submit(self._score, np.array(batch, copy=True), np.asarray(probabilities), primary_ms)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        self._pending.release()
+        error = future.exception()
+        if error is not None:
+            print(f"Error in shadow scoring of {self.version[:16]}: {error}")
+
+    def _score(self, batch, expected, primary_ms):
+        if self.error is not None:
+            return  # sampled before the load failed
+        if self._backend is None:
+            try:
+                metadata = self.registry.get(self.version)
+                self._backend = load_backend(metadata['backend'], self.registry.artifact_path(self.version),
+                                             *self._threads)
+            except Exception as e:
+                self.error = str(e)
+                raise
+        started = time.perf_counter()
+        actual = self._backend.predict(batch)
+        shadow_ms = (time.perf_counter() - started) * 1000.0
+
+        rows = np.arange(len(batch))
+        top1 = expected.argmax(axis=1)
+        with self._lock:
+            self._samples += len(batch)
+            self._agreements += int((actual.argmax(axis=1) == top1).sum())
+            self._confidence_delta += float(np.abs(actual[rows, top1] - expected[rows, top1]).sum())
+            self._latencies['primary'].append(primary_ms)
+            self._latencies['shadow'].append(shadow_ms)
+        if time.monotonic() - self._last_flush >= self._flush_interval:
+            self.flush()
+
+    def stats(self):
+        """Counters of this worker, in the format stored in the registry."""
+        with self._lock:
+            return {
+                'samples': self._samples,
+                'agreements': self._agreements,
+                'dropped': self._dropped,
+                'confidence_delta_sum': self._confidence_delta,
+                'latency_ms': {key: list(values) for key, values in self._latencies.items()},
+            }
+
+    def flush(self):
+        """Write this worker's statistics to the registry."""
+        self._last_flush = time.monotonic()
+        try:
+            self.registry.record_shadow_stats(self.version, self._worker, self.stats())
+        except OSError as e:
+            print(f"Could not record shadow statistics: {e}")
+
+    def close(self):
+        """Finish pending samples, flush the statistics and stop the background thread."""
+        self._executor.shutdown(wait=True)
+        self.flush()
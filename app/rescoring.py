@@ -0,0 +1,225 @@
+# Offline Re-scoring of Patient Records
+
+"""
+Bulk Re-scoring of Stored Scans with the Current Model
+
+After a model is retrained, every historical diagnosis was produced by
+the previous version. `flask patients rescore` runs the served model over
+the stored scan of every patient record and writes the new predictions
+back, without going through the web UI.
+
+Pipeline:
+- Rows (id, image_path, tumor_type) are streamed from a server-side
+  cursor on a dedicated connection, never loading the table into memory
+- Scans are read and decoded in a process pool; the next chunk is already
+  decoding while the current one is on the model
+- Inference runs in fixed-size batches straight on the backend (no
+  micro-batcher, no shadow sampling: this is not live traffic)
+- The new prediction of every scored record (label, probabilities,
+  confidence, model version) is written with one bulk UPDATE per chunk,
+  and the last committed id is saved to a checkpoint file, so an
+  interrupted run resumes where it stopped
+- The statistics counters move from the old to the new values in the same
+  transaction as the UPDATE, and the diagnosis days of changed predictions
+  are marked for the analytics rollup
+
+Patients created from a volume study are skipped: their diagnosis is the
+aggregate over all slices, not the prediction for the key slice stored
+as their image.
+
+Key Functionality:
+- rescore_patients: runs the pipeline and returns a report with
+  throughput and the old -> new prediction transitions
+- load_checkpoint / save_checkpoint: resumable progress, tied to the model version
+
+"""
+
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sqlalchemy import select
+
+from .analytics import mark_stale_days
+from .inference import prediction_result
+from .models import db, Patient, VolumeStudy
+from .operations import prediction_columns
+from .preprocessing import decode_image, new_batch
+from .stat_counters import CountedPatient, increment_counters, merge_counts, patient_counts
+
+# Changed records listed individually in the report
+SAMPLE_CHANGES = 50
+
+
+def _load_scan(path):
+    # Runs in a pool process: read + decode, errors are reported instead of raised
+    try:
+        with open(path, 'rb') as f:
+            return decode_image(f.read()), None
+    except FileNotFoundError:
+        return None, 'missing'
+    except Exception as e:
+        return None, f"unreadable: {e}"
+
+
+def load_checkpoint(path, model_version):
+    """
+    Read a checkpoint written by an earlier run
+
+    Args:
+        path (str): Checkpoint file
+        model_version (str): Version being scored; a checkpoint of another version is refused
+
+    Returns:
+        dict: Checkpoint contents, or None when the file does not exist
+
+    Raises:
+        ValueError: If the checkpoint belongs to another model version
+    """
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('model_version') != model_version:
+        raise ValueError(f"Checkpoint {path} was written for model {checkpoint.get('model_version')}, "
+                         f"not {model_version}")
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    """
+    Atomically replace the checkpoint file
+
+    Args:
+        path (str): Checkpoint file
+        checkpoint (dict): JSON-serializable progress
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _stream_rows(connection, after_id, chunk_size, limit):
+    query = (select(Patient.id, Patient.image_path, Patient.tumor_type, Patient.confidence,
+                    Patient.model_version, Patient.inference_ms, Patient.diagnosis_date)
+             .outerjoin(VolumeStudy, VolumeStudy.patient_id == Patient.id)
+             .where(Patient.id > after_id, VolumeStudy.id.is_(None))
+             .order_by(Patient.id))
+    if limit:
+        query = query.limit(limit)
+    rows = connection.execution_options(stream_results=True).execute(query)
+    while True:
+        chunk = rows.fetchmany(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _score_chunk(chunk, decoded, predict, model_version, batch_size, checkpoint, dry_run):
+    decoded = list(decoded)
+    scored = [(row, array) for row, (array, error) in zip(chunk, decoded) if array is not None]
+    for row, (array, error) in zip(chunk, decoded):
+        if error is not None:
+            checkpoint['failed'] += 1
+            if len(checkpoint['errors']) < SAMPLE_CHANGES:
+                checkpoint['errors'].append({'id': row.id, 'error': error})
+
+    updates = []
+    rescored = []
+    changed_days = set()
+    changed = 0
+    transitions = Counter(checkpoint['transitions'])
+    for start in range(0, len(scored), batch_size):
+        part = scored[start:start + batch_size]
+        batch = new_batch(len(part))
+        for i, (_, array) in enumerate(part):
+            batch[i] = array
+        started = time.perf_counter()
+        probabilities = np.asarray(predict(batch))
+        inference_ms = (time.perf_counter() - started) * 1000.0 / len(part)
+        for (row, _), row_probabilities in zip(part, probabilities):
+            result = prediction_result(row_probabilities, model_version, inference_ms)
+            transitions[f"{row.tumor_type} -> {result.category}"] += 1
+            updates.append(dict(prediction_columns(result), id=row.id, tumor_type=result.category))
+            rescored.append(CountedPatient(result.category, result.confidence, model_version, result.inference_ms))
+            if result.category != row.tumor_type:
+                changed += 1
+                changed_days.add(row.diagnosis_date)
+                if len(checkpoint['changes']) < SAMPLE_CHANGES:
+                    checkpoint['changes'].append({'id': row.id, 'from': row.tumor_type, 'to': result.category,
+                                                  'confidence': result.confidence})
+
+    if updates and not dry_run:
+        db.session.bulk_update_mappings(Patient, updates)
+        increment_counters(merge_counts(patient_counts([row for row, _ in scored], sign=-1),
+                                        patient_counts(rescored)))
+        mark_stale_days(changed_days)
+        db.session.commit()
+    checkpoint['transitions'] = dict(transitions)
+    checkpoint['rows'] += len(chunk)
+    checkpoint['scored'] += len(scored)
+    checkpoint['changed'] += changed
+    checkpoint['last_id'] = chunk[-1].id
+    return len(scored)
+
+
+def rescore_patients(predict, model_version, chunk_size=256, batch_size=32, workers=None,
+                     checkpoint_path=None, dry_run=False, limit=None):
+    """
+    Re-score stored patient scans and write the new predictions back
+
+    Args:
+        predict (callable): Maps a (N, 150, 150, 3) batch to (N, 4) probabilities,
+            e.g. `get_serving_model().backend.predict`
+        model_version (str): Version of that model, recorded in the checkpoint
+        chunk_size (int): Rows per decode chunk and per UPDATE transaction
+        batch_size (int): Images per forward pass
+        workers (int): Decoding processes (default: CPU count)
+        checkpoint_path (str): Progress file; an existing one for the same model version is resumed
+        dry_run (bool): Report the changes without writing anything
+        limit (int): Maximum rows scored in this run
+
+    Returns:
+        dict: Totals (rows, scored, failed, changed), old -> new transition
+            counts, sample changes and errors, and this run's throughput
+
+    Raises:
+        ValueError: If the checkpoint belongs to another model version
+    """
+    checkpoint = load_checkpoint(checkpoint_path, model_version) or {
+        'model_version': model_version, 'last_id': 0, 'rows': 0, 'scored': 0, 'failed': 0,
+        'changed': 0, 'transitions': {}, 'changes': [], 'errors': []}
+    resumed_from = checkpoint['last_id']
+
+    started = time.perf_counter()
+    scored = 0
+    # Spawned rather than forked: the parent may already run TensorFlow threads
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=context) as pool, \
+            db.engine.connect() as reader:
+        pending = None
+        for chunk in _stream_rows(reader, checkpoint['last_id'], chunk_size, limit):
+            # Executor.map submits at once, so this chunk decodes while the previous one is scored
+            decoding = chunk, pool.map(_load_scan, [row.image_path for row in chunk], chunksize=8)
+            if pending is not None:
+                scored += _score_chunk(*pending, predict, model_version, batch_size, checkpoint, dry_run)
+                if checkpoint_path and not dry_run:
+                    save_checkpoint(checkpoint_path, checkpoint)
+            pending = decoding
+        if pending is not None:
+            scored += _score_chunk(*pending, predict, model_version, batch_size, checkpoint, dry_run)
+            if checkpoint_path and not dry_run:
+                save_checkpoint(checkpoint_path, checkpoint)
+
+    seconds = time.perf_counter() - started
+    report = dict(checkpoint, dry_run=dry_run, resumed_from=resumed_from)
+    report['throughput'] = {'images': scored, 'seconds': round(seconds, 3),
+                            'images_per_second': round(scored / seconds, 2) if seconds else None}
+    return report
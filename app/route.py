@@ -1,36 +1,35 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify
+from flask import render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context, send_file
 from flask_login import login_user, login_required, logout_user, current_user
 from werkzeug.utils import secure_filename
 from werkzeug.security import check_password_hash
 import os
 from datetime import datetime
 from .models import User, Treatment, Patient,UserLogin
-from .operations import add_user, get_user_by_username, add_treatment, get_treatment_by_tumor_type, add_patient,update_user_profile,send_verification_email
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
+from .operations import add_user, get_user_by_username, add_treatment, get_treatment_data, add_patient, add_patients, add_volume_study, get_patients_page,update_user_profile,send_verification_email
+import json
+import time
 import numpy as np
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from .form import ProfileImageForm
 from .models import db
+from .inference import get_serving_model, observe_shadow, batcher_stats, cache_stats, model_info, predict_batch, get_prediction_cache, prediction_result
+from .prediction_cache import image_digest
+from .preprocessing import decode_image, decode_into, new_batch
+from .jobs import enqueue_prediction, ensure_worker_pool, get_job, wait_for_job
+from .explanations import (get_explanation_service, schedule_explanation, EXPLANATION_DONE, EXPLANATION_PENDING,
+                           EXPLANATION_UNAVAILABLE)
+from .storage import BlobStore, PROFILE_PREFIX, acquire_files, release_files, track_files
+from .uploads import UploadRejected, read_upload
+from .volumes import VolumeUnsupported, open_volume, predict_volume, render_slice
+from .treatment_catalog import get_treatment_catalog
+from .thumbnails import DERIVATIVE_SIZES, FORMATS, ensure_derivative, preferred_format, schedule_derivatives
 
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 
-
-# Load Pre-trained Machine Learning Model
-# This line loads a pre-trained neural network model for brain tumor classification
-# Get the absolute path to the model file
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-MODEL_PATH = os.path.join(BASE_DIR, 'model', 'brains.h5')
-
-# Load the model
-try:
-    model = load_model(MODEL_PATH)
-    print(f"Model loaded successfully from {MODEL_PATH}")
-except Exception as e:
-    print(f"Error loading model: {e}")
-    model = None
-
-
+# Threads for decoding and saving the files of one multi-image upload in parallel;
+# PIL releases the GIL while decoding, so this scales with cores
+_upload_pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1), thread_name_prefix='upload')
 
 def configure_routes(app):
     """
@@ -42,6 +41,28 @@ def configure_routes(app):
     Returns:
         None
     """
+
+    def receive_upload(file, formats=('JPEG', 'PNG')):
+        """Read an uploaded image within the configured limits (raises UploadRejected)."""
+        return read_upload(file.stream, app.config['UPLOAD_MAX_BYTES'], app.config['UPLOAD_MAX_PIXELS'], formats)
+
+    def track_uploads(paths):
+        """Register freshly stored files, so `flask storage gc` removes those no record ends up referencing."""
+        try:
+            track_files(paths)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    @app.errorhandler(413)
+    def request_too_large(e):
+        """Reject request bodies above MAX_CONTENT_LENGTH before they are parsed."""
+        message = f"Upload exceeds the {app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)} MB request limit."
+        if request.path.startswith('/predict'):
+            return jsonify({'error': message}), 413
+        flash(message, "error")
+        return render_template('error.html'), 413
     
     @app.route('/')
     def home():
@@ -240,21 +261,42 @@ def configure_routes(app):
                     flash("No selected file.", "error")
                     return redirect(request.url)
 
-                filename = secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
+                # Read the upload once, validating and hashing it on the way in
+                try:
+                    upload = receive_upload(file)
+                except UploadRejected as e:
+                    if request.form.get('mode') == 'async':
+                        return jsonify({'error': e.message}), e.status
+                    flash(e.message, "error")
+                    return render_template('error.html')
+
+                if request.form.get('mode') == 'async':
+                    return enqueue_predict_job(upload, file.filename)
+
+                # Inference decodes from this buffer while the same bytes are stored
+                # in the background, keeping disk I/O off the critical path
+                data = upload.data
+                saved = _upload_pool.submit(BlobStore(app.config['UPLOAD_FOLDER']).put, data, file.filename,
+                                            upload.digest)
 
                 # Process the image and get the prediction
                 try:
-                    prediction, confidence = predict_image(filepath)
+                    result = score_image_bytes(data, upload.digest)
+                    prediction, confidence = result.category, result.confidence
                 except Exception as e:
-                    flash("Error during image prediction.", "error")
                     app.logger.error(f"Error in predict_image: {str(e)}")
+                    result = None
+
+                # Registered as soon as it is on disk, so the upload is collected if
+                # the prediction or the patient record below fails
+                filepath = saved.result()
+                track_uploads([filepath])
+                if result is None:
+                    flash("Error during image prediction.", "error")
                     return render_template('error.html')
 
-                # Get treatment by tumor type
-                treatment_instance = get_treatment_by_tumor_type(prediction)
-                treatment_data = treatment_instance.to_dict() if treatment_instance else None
+                # Get treatment by tumor type (in-process catalog, no query)
+                treatment_data = get_treatment_data(prediction)
 
                 # Save patient data
                 try:
@@ -263,15 +305,22 @@ def configure_routes(app):
                     gender = request.form['gender']
                     diagnosis_date = datetime.strptime(request.form['diagnosis_date'], '%Y-%m-%d').date()
                     user_id = current_user.id
-                    add_patient(name, age, gender, prediction, diagnosis_date, filepath, user_id)
+                    add_patient(name, age, gender, prediction, diagnosis_date, filepath, user_id, result)
                 except Exception as e:
                     flash("Error saving patient data.", "error")
                     app.logger.error(f"Error in add_patient: {str(e)}")
                     return render_template('error.html')
 
+                # Grad-CAM and thumbnails run in the background; fetch them later from
+                # /patients/<id>/explanation and /patients/<id>/image/<size>
+                schedule_explanation(app, filepath, prediction, data)
+                schedule_derivatives(app, filepath)
+
                 return jsonify({
                     'prediction': prediction,
                     'confidence': confidence,
+                    'probabilities': result.probabilities,
+                    'model_version': result.model_version,
                     'treatment': treatment_data
                 })
             except Exception as e:
@@ -280,18 +329,397 @@ def configure_routes(app):
                 return render_template('error.html')
         return render_template('predict.html')
 
+    def enqueue_predict_job(upload, filename):
+        """Save the upload, queue it for a prediction worker and return the job id (202)."""
+        try:
+            name = request.form['name']
+            age = int(request.form['age'])
+            gender = request.form['gender']
+            diagnosis_date = datetime.strptime(request.form['diagnosis_date'], '%Y-%m-%d').date()
+        except (KeyError, ValueError):
+            return jsonify({'error': 'Patient name, age, gender and diagnosis_date are required.'}), 400
+
+        try:
+            # The worker reads the image from disk; the job registers it with the storage
+            filepath = BlobStore(app.config['UPLOAD_FOLDER']).put(upload.data, filename, upload.digest)
+            job = enqueue_prediction(current_user.id, filepath, name, age, gender, diagnosis_date)
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error in enqueue_prediction: {str(e)}")
+            return jsonify({'error': 'Error queueing prediction.'}), 500
+        ensure_worker_pool(app)
+
+        return jsonify({
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': url_for('prediction_job', job_id=job.id),
+            'events_url': url_for('prediction_job_events', job_id=job.id),
+        }), 202
+
+    @app.route('/predict/jobs/<job_id>')
+    @login_required
+    def prediction_job(job_id):
+        """Return the status (and, once done, the result) of an asynchronous prediction."""
+        job = get_job(job_id, current_user.id)
+        if job is None:
+            return jsonify({'error': 'Job not found.'}), 404
+        return jsonify(job.to_dict())
+
+    @app.route('/predict/jobs/<job_id>/events')
+    @login_required
+    def prediction_job_events(job_id):
+        """Stream status changes of an asynchronous prediction as server-sent events.
+
+        Emits one `status` event per state change and closes the stream once
+        the job is done or failed (or PREDICTION_JOB_EVENTS_TIMEOUT passes).
+        """
+        user_id = current_user.id
+        if get_job(job_id, user_id) is None:
+            return jsonify({'error': 'Job not found.'}), 404
+
+        def events():
+            for state in wait_for_job(job_id, user_id, app.config['PREDICTION_JOB_EVENTS_TIMEOUT']):
+                yield f"event: status\ndata: {json.dumps(state)}\n\n"
+
+        return Response(stream_with_context(events()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    @app.route('/predict/batch', methods=['POST'])
+    @login_required
+    def predict_batch_route():
+        """Predict tumor types for every slice of a multi-image study in one request.
+
+        All files share the patient fields of the form. Images are decoded in
+        parallel, classified in a single forward pass, and one Patient row per
+        decodable image is inserted in a single transaction.
+
+        Returns:
+            JSON with a per-file `results` array, in upload order.
+        """
+        files = [f for f in request.files.getlist('files') if f.filename]
+        if not files:
+            return jsonify({'error': 'No files uploaded.'}), 400
+        max_files = app.config['PREDICT_BATCH_MAX_FILES']
+        if len(files) > max_files:
+            return jsonify({'error': f'At most {max_files} files per request.'}), 400
+
+        try:
+            name = request.form['name']
+            age = request.form['age']
+            gender = request.form['gender']
+            diagnosis_date = datetime.strptime(request.form['diagnosis_date'], '%Y-%m-%d').date()
+        except (KeyError, ValueError):
+            return jsonify({'error': 'Patient name, age, gender and diagnosis_date are required.'}), 400
+
+        filenames = [secure_filename(f.filename) for f in files]
+        store = BlobStore(app.config['UPLOAD_FOLDER'])
+        results = [{'filename': filename} for filename in filenames]
+
+        # Files that fail the size / format / dimension checks are reported and skipped
+        payloads, digests = [None] * len(files), [None] * len(files)
+        for i, f in enumerate(files):
+            try:
+                upload = receive_upload(f)
+                payloads[i], digests[i] = upload.data, upload.digest
+            except UploadRejected as e:
+                results[i]['error'] = e.message
+
+        # Re-uploaded slices are answered from the cache and skip decoding entirely
+        cache = get_prediction_cache()
+        try:
+            model = get_serving_model()
+        except Exception as e:
+            app.logger.error(f"Error loading model: {str(e)}")
+            return jsonify({'error': 'Error during image prediction.'}), 500
+        version = model.version
+        lookup_started = time.perf_counter()
+        probabilities = [cache.get(digest, version) if digest else None for digest in digests]
+        lookup_ms = (time.perf_counter() - lookup_started) * 1000.0 / len(digests)
+        misses = [i for i, row in enumerate(probabilities) if row is None and payloads[i] is not None]
+
+        # Every miss is decoded straight into its row of one preallocated batch
+        decode_started = time.perf_counter()
+        batch = new_batch(len(misses))
+
+        def try_decode(row):
+            try:
+                decode_into(payloads[misses[row]], batch[row])
+                return True
+            except Exception:
+                return False
+
+        decoded_rows = list(_upload_pool.map(try_decode, range(len(misses))))
+        pending = [i for i, ok in zip(misses, decoded_rows) if ok]
+        for i, ok in zip(misses, decoded_rows):
+            if not ok:
+                results[i]['error'] = 'Could not decode image.'
+
+        if pending:
+            try:
+                rows = predict_batch(batch if len(pending) == len(misses) else batch[np.array(decoded_rows)], model)
+            except Exception as e:
+                app.logger.error(f"Error in predict_batch: {str(e)}")
+                return jsonify({'error': 'Error during image prediction.'}), 500
+            for i, row in zip(pending, rows):
+                probabilities[i] = row
+                cache.put(digests[i], version, row)
+            # Each image is charged its share of the decode + forward pass
+            miss_ms = (time.perf_counter() - decode_started) * 1000.0 / len(pending)
+        latency = {i: miss_ms for i in pending} if pending else {}
+
+        decoded = [i for i, row in enumerate(probabilities) if row is not None]
+        if not decoded:
+            return jsonify({'results': results}), 400
+
+        predictions = [prediction_result(probabilities[i], version, latency.get(i, lookup_ms)) for i in decoded]
+
+        filepaths = list(_upload_pool.map(lambda index: store.put(payloads[index], filenames[index], digests[index]), decoded))
+
+        try:
+            # Registered first, so the batch's files are collected if the records fail
+            track_uploads(filepaths)
+            patients = add_patients([
+                dict(name=name, age=age, gender=gender, prediction=result.category,
+                     diagnosis_date=diagnosis_date, filepath=filepath, user_id=current_user.id, result=result)
+                for result, filepath in zip(predictions, filepaths)
+            ])
+        except Exception as e:
+            app.logger.error(f"Error in add_patients: {str(e)}")
+            return jsonify({'error': 'Error saving patient data.'}), 500
+
+        for i, result, patient, filepath in zip(decoded, predictions, patients, filepaths):
+            schedule_explanation(app, filepath, result.category, payloads[i])
+            schedule_derivatives(app, filepath)
+            results[i].update({
+                'prediction': result.category,
+                'confidence': result.confidence,
+                'probabilities': result.probabilities,
+                'treatment': get_treatment_data(result.category),
+                'patient_id': patient.id,
+            })
+        return jsonify({'results': results})
+
+    @app.route('/predict/volume', methods=['POST'])
+    @login_required
+    def predict_volume_route():
+        """Predict the tumor type of a volumetric scan (NIfTI volume or zipped DICOM series).
+
+        Axial slices are windowed and classified in batches of
+        VOLUME_BATCH_SIZE; the per-slice distributions are aggregated into
+        one study-level prediction, stored as a patient record whose image
+        is the key slice.
+
+        Returns:
+            JSON with the study prediction, treatment, patient id and per-slice results.
+        """
+        file = request.files.get('file')
+        if file is None or not file.filename:
+            return jsonify({'error': 'No file uploaded.'}), 400
+        try:
+            name = request.form['name']
+            age = request.form['age']
+            gender = request.form['gender']
+            diagnosis_date = datetime.strptime(request.form['diagnosis_date'], '%Y-%m-%d').date()
+        except (KeyError, ValueError):
+            return jsonify({'error': 'Patient name, age, gender and diagnosis_date are required.'}), 400
+
+        store = BlobStore(app.config['UPLOAD_FOLDER'])
+        try:
+            volume_path = store.put_stream(file.stream, secure_filename(file.filename), app.config['VOLUME_MAX_BYTES'])
+            # Registered unreferenced, so `flask storage gc` removes it if the volume is rejected below
+            track_uploads([volume_path])
+        except UploadRejected as e:
+            return jsonify({'error': e.message}), e.status
+        except Exception as e:
+            app.logger.error(f"Error in predict_volume: {str(e)}")
+            return jsonify({'error': 'Error saving the volume.'}), 500
+
+        try:
+            model = get_serving_model()
+            started = time.perf_counter()
+            volume = open_volume(volume_path, app.config['VOLUME_MAX_DECOMPRESSED_BYTES'])
+        except VolumeUnsupported as e:
+            return jsonify({'error': str(e)}), 415
+        except Exception as e:
+            app.logger.error(f"Error in predict_volume: {str(e)}")
+            return jsonify({'error': 'Error during volume prediction.'}), 500
+        try:
+            result = predict_volume(volume, lambda batch: predict_batch(batch, model),
+                                    app.config['VOLUME_BATCH_SIZE'],
+                                    min_foreground=app.config['VOLUME_MIN_FOREGROUND'],
+                                    min_tumor_fraction=app.config['VOLUME_TUMOR_SLICE_FRACTION'])
+            inference_ms = (time.perf_counter() - started) * 1000.0
+            key_image = render_slice(volume, result['study']['key_slice'], result['window'])
+        except VolumeUnsupported as e:
+            return jsonify({'error': str(e)}), 422
+        except Exception as e:
+            app.logger.error(f"Error in predict_volume: {str(e)}")
+            return jsonify({'error': 'Error during volume prediction.'}), 500
+        finally:
+            volume.close()
+
+        study = result['study']
+        try:
+            image_path = store.put(key_image, 'key-slice.png')
+            track_uploads([image_path])
+            patient = add_volume_study(name, age, gender, diagnosis_date, current_user.id,
+                                       image_path, volume_path, result, model.version, inference_ms)
+        except Exception as e:
+            app.logger.error(f"Error in add_volume_study: {str(e)}")
+            return jsonify({'error': 'Error saving patient data.'}), 500
+
+        # The key slice gets the same background Grad-CAM and thumbnails as a 2-D upload
+        schedule_explanation(app, image_path, study['prediction'], key_image)
+        schedule_derivatives(app, image_path)
+
+        return jsonify({
+            'prediction': study['prediction'],
+            'confidence': study['confidence'],
+            'treatment': get_treatment_data(study['prediction']),
+            'patient_id': patient.id,
+            'study': study,
+            'modality': result['modality'],
+            'window': result['window'],
+            'slices': result['slices'],
+            'scored_slices': result['scored_slices'],
+            'slice_predictions': result['slice_predictions'],
+        })
+
+    def page_size():
+        return max(1, min(request.args.get('limit', app.config['PATIENTS_PAGE_SIZE'], type=int),
+                          app.config['PATIENTS_MAX_PAGE_SIZE']))
+
+    @app.route('/treatments/<tumor_type>')
+    @login_required
+    def treatment_detail(tumor_type):
+        """Treatment protocol of a tumor type as JSON, with an ETag for conditional requests.
+
+        Returns:
+            JSON treatment (304 if If-None-Match matches), or 404 for an unknown tumor type.
+        """
+        entry = get_treatment_catalog().get(tumor_type)
+        if entry is None:
+            return jsonify({'error': 'No treatment for this tumor type.'}), 404
+        response = jsonify(entry.data)
+        response.set_etag(entry.etag)
+        response.cache_control.private = True
+        response.cache_control.max_age = app.config['TREATMENT_CACHE_MAX_AGE']
+        return response.make_conditional(request)
+
     @app.route('/patients')
     @login_required
     def patients_list():
-        """Render the list of patients."""
+        """Render one page of the patient list, newest diagnosis first; `after` selects the next page."""
         try:
-            patients = Patient.query.all()
-            return render_template('patients.html', patients=patients)
+            patients, next_cursor = get_patients_page(request.args.get('after'), page_size())
+            return render_template('patients.html', patients=patients, next_cursor=next_cursor)
+        except ValueError:
+            flash("Invalid page.", "error")
+            return render_template('error.html')
         except Exception as e:
             flash("Error loading patient list.", "error")
             app.logger.error(f"Error in patients_list route: {str(e)}")
             return render_template('error.html')
 
+    @app.route('/patients/page')
+    @login_required
+    def patients_page():
+        """One page of the patient list as JSON, for infinite scroll.
+
+        Returns:
+            JSON with `patients` and `next` (cursor for `after`, null on the last page).
+        """
+        try:
+            patients, next_cursor = get_patients_page(request.args.get('after'), page_size())
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor.'}), 400
+        except Exception as e:
+            app.logger.error(f"Error in patients_page route: {str(e)}")
+            return jsonify({'error': 'Error loading patient list.'}), 500
+        return jsonify({
+            'patients': [{
+                'id': row.id,
+                'name': row.name,
+                'age': row.age,
+                'gender': row.gender,
+                'tumor_type': row.tumor_type,
+                'confidence': row.confidence,
+                'diagnosis_date': row.diagnosis_date.isoformat(),
+                'username': row.username,
+                'thumb_url': url_for('patient_image', patient_id=row.id, size='thumb') if row.image_path else None,
+                'preview_url': url_for('patient_image', patient_id=row.id, size='preview') if row.image_path else None,
+                'explanation_url': url_for('patient_explanation', patient_id=row.id) if row.image_path else None,
+            } for row in patients],
+            'next': next_cursor,
+        })
+
+    @app.route('/patients/<int:patient_id>/explanation')
+    @login_required
+    def patient_explanation(patient_id):
+        """Serve the Grad-CAM overlay of a patient's scan.
+
+        Returns:
+            The JPEG overlay once generated; otherwise JSON with the status
+            (202 while pending, starting generation if nobody has yet).
+        """
+        patient = Patient.query.get_or_404(patient_id)
+        if not patient.image_path or not os.path.exists(patient.image_path):
+            return jsonify({'status': 'missing', 'error': 'No image stored for this patient.'}), 404
+        try:
+            status, path = get_explanation_service(app).request(patient.image_path, patient.tumor_type)
+        except Exception as e:
+            app.logger.error(f"Error in patient_explanation: {str(e)}")
+            return jsonify({'error': 'Error generating explanation.'}), 500
+
+        if status == EXPLANATION_DONE:
+            # Immutable (named by image hash, model version and class) but patient data: browser cache only
+            response = send_file(os.path.abspath(path), mimetype='image/jpeg', max_age=86400)
+            response.cache_control.public = False
+            response.cache_control.private = True
+            return response
+        if status == EXPLANATION_PENDING:
+            response = jsonify({'status': status})
+            response.headers['Retry-After'] = '2'
+            return response, 202
+        if status == EXPLANATION_UNAVAILABLE:
+            return jsonify({'status': status, 'error': 'Explanations require the keras inference backend.'}), 501
+        return jsonify({'status': status, 'error': 'Explanation could not be generated.'}), 500
+
+    @app.route('/patients/<int:patient_id>/image/<size>')
+    @login_required
+    def patient_image(patient_id, size):
+        """Serve a downscaled copy of a patient's scan ('thumb' or 'preview').
+
+        The derivative is generated on first request if the upload-time job
+        has not produced it. WebP is sent to clients that accept it, JPEG
+        otherwise.
+        """
+        if size not in DERIVATIVE_SIZES:
+            return jsonify({'error': f"Unknown image size '{size}'."}), 404
+        patient = Patient.query.get_or_404(patient_id)
+        if not patient.image_path or not os.path.exists(patient.image_path):
+            return jsonify({'error': 'No image stored for this patient.'}), 404
+        fmt = preferred_format(request.headers.get('Accept', ''))
+        try:
+            path = ensure_derivative(patient.image_path, size, fmt)
+        except Exception as e:
+            app.logger.error(f"Error in patient_image: {str(e)}")
+            return jsonify({'error': 'Error generating image.'}), 500
+
+        # A patient's scan never changes: cache for a year, in the browser only (patient data)
+        response = send_file(os.path.abspath(path), mimetype=FORMATS[fmt][1], max_age=31536000)
+        response.cache_control.public = False
+        response.cache_control.private = True
+        response.cache_control.immutable = True
+        response.vary.add('Accept')
+        return response
+
+    @app.route('/predict/stats')
+    @login_required
+    def predict_stats():
+        """Return model load state, micro-batching metrics (queue depth, batch sizes, wait times) and cache counters as JSON."""
+        return jsonify({'model': model_info(), 'batching': batcher_stats(), 'cache': cache_stats()})
+
     @app.route('/about')
     def about():
         """Render the about page."""
@@ -328,16 +756,23 @@ def configure_routes(app):
             if form.validate_on_submit():
                 # Retrieve the file from the form
                 file = form.profile_image.data
-                filename = secure_filename(file.filename)
-               
-                # Define the path to save the file
-                file_path = os.path.join(app.config['UPLOAD_FOLDERS'], filename)
-                
-                # Save the file
-                file.save(file_path)
-                
-                # Update the current user's profile_image field in the database
-                current_user.profile_image = f'profiles/{filename}'
+
+                try:
+                    upload = receive_upload(file)
+                except UploadRejected as e:
+                    flash(e.message, "error")
+                    return render_template('profile_image.html', form=form)
+
+                # Save the file (identical images are stored once)
+                store = BlobStore(app.config['UPLOAD_FOLDERS'])
+                file_path = store.put(upload.data, secure_filename(file.filename), upload.digest)
+                track_uploads([file_path])
+
+                # Update the current user's profile_image field and the file references
+                if current_user.profile_image:
+                    release_files([store.file_path(current_user.profile_image, PROFILE_PREFIX)])
+                acquire_files([file_path])
+                current_user.profile_image = store.url_path(file_path, PROFILE_PREFIX)
                 db.session.commit()
                 print("hello")
                 flash("Profile picture updated successfully!", "success")
@@ -404,14 +839,69 @@ def preprocess_image(img_path):
     Returns:
         Preprocessed image array suitable for model input.
     """
-    img = image.load_img(img_path, target_size=(150, 150))  # Resizing to the model's input size
-    img_array = image.img_to_array(img)
-    img_array = np.expand_dims(img_array, axis=0)  # Add batch dimension
-    img_array = img_array / 255.0  # Normalize the image data
-    return img_array
+    with open(img_path, 'rb') as f:
+        batch = new_batch(1)
+        decode_into(f.read(), batch[0])
+    return batch
+
+def score_image_bytes(data, digest=None):
+    """Predict the tumor type from in-memory image bytes, with everything stored about the prediction.
+
+    Results are cached by the hash of the bytes and the model version, so a
+    re-uploaded scan skips the CNN. On a miss the forward pass is shared
+    with other concurrent requests through the micro-batcher, so this call
+    may wait up to INFERENCE_MAX_WAIT_MS for company before the batch runs.
+
+    Args:
+        data: Raw bytes of the image file.
+        digest: `image_digest` of the bytes, if already computed (e.g. by `read_upload`).
+
+    Returns:
+        Prediction: Category, confidence, class probabilities, model version and latency.
+    """
+    started = time.perf_counter()
+    digest = digest or image_digest(data)
+    model = get_serving_model()
+    cache = get_prediction_cache()
+
+    prediction = cache.get(digest, model.version)
+    if prediction is None:
+        # Decode straight from the buffer and run it as one row of a shared batch
+        array = decode_image(data)
+        forward_started = time.perf_counter()
+        prediction = model.batcher.predict(array)
+        observe_shadow(array[np.newaxis], prediction[np.newaxis], (time.perf_counter() - forward_started) * 1000.0)
+        cache.put(digest, model.version, prediction)
+
+    return prediction_result(prediction, model.version, (time.perf_counter() - started) * 1000.0)
+
+def predict_image_bytes(data, digest=None):
+    """Predict the tumor type from in-memory image bytes.
+
+    Args:
+        data: Raw bytes of the image file.
+        digest: `image_digest` of the bytes, if already computed (e.g. by `read_upload`).
+
+    Returns:
+        Tuple containing predicted category and confidence score.
+    """
+    result = score_image_bytes(data, digest)
+    return result.category, result.confidence
+
+def score_image(img_path):
+    """Predict the tumor type from an image file, with everything stored about the prediction.
+
+    Args:
+        img_path: Path to the image file.
+
+    Returns:
+        Prediction: Category, confidence, class probabilities, model version and latency.
+    """
+    with open(img_path, 'rb') as f:
+        return score_image_bytes(f.read())
 
 def predict_image(img_path):
-    """Predict the tumor type from the image.
+    """Predict the tumor type from an image file.
 
     Args:
         img_path: Path to the image file.
@@ -419,15 +909,5 @@ def predict_image(img_path):
     Returns:
         Tuple containing predicted category and confidence score.
     """
-    # Preprocess the image
-    preprocessed_img = preprocess_image(img_path)
-
-    # Run the prediction
-    prediction = model.predict(preprocessed_img)
-
-    # Get the class index with the highest probability and its confidence score
-    predicted_class = np.argmax(prediction, axis=1)[0]
-    categories = ["Glioma", "Meningioma", "No Tumor", "Pituitary"]
-    predicted_category = categories[predicted_class]
-    confidence_score = round(np.max(prediction) * 100, 2)
-    return predicted_category, confidence_score
\ No newline at end of file
+    result = score_image(img_path)
+    return result.category, result.confidence
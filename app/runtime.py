@@ -0,0 +1,202 @@
+# Inference Runtime Profile
+
+"""
+Thread Pools, CPU Affinity and oneDNN Settings for Inference Workers
+
+By default every worker process gives its TensorFlow runtime intra-op and
+inter-op thread pools sized to all cores. With several workers on one box
+they oversubscribe the CPU and thrash each other. The profile configured
+in app/config.py bounds each worker instead, and is applied once per process
+right before the model is loaded.
+
+Core pinning covers the whole process, not just the thread that loads the
+model: every thread running at that point (request handlers, job workers,
+the batcher) is pinned, and threads started afterwards inherit the mask
+from the thread that starts them.
+
+Key Functionality:
+- Intra-op / inter-op thread counts for every backend (INFERENCE_INTRA_OP_THREADS,
+  INFERENCE_INTER_OP_THREADS; 0 keeps the runtime default)
+- Core pinning (INFERENCE_CPU_AFFINITY): an explicit core list, or 'auto' to
+  give each of INFERENCE_WORKERS_PER_HOST workers its own slice of the
+  cores, applied to every thread of the process
+- oneDNN toggle (INFERENCE_ONEDNN), exported as TF_ENABLE_ONEDNN_OPTS before
+  TensorFlow is imported
+
+"""
+
+import fcntl
+import os
+import sys
+import tempfile
+import threading
+
+_profile = None
+_profile_lock = threading.Lock()
+
+# Open lock files holding the worker slots of this process, kept for the process lifetime
+_slot_files = []
+
+
+def parse_cpu_list(value):
+    """
+    Parse a Linux-style core list such as '0-3,8,10-11'
+
+    Args:
+        value (str): Comma separated cores and inclusive ranges
+
+    Returns:
+        list: Sorted core ids
+    """
+    cores = set()
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        cores.update(range(int(first), int(last or first) + 1))
+    return sorted(cores)
+
+
+def worker_cores(available, workers, index):
+    """
+    The slice of the available cores owned by one worker
+
+    Cores are split into `workers` contiguous, near-equal groups. With more
+    workers than cores, workers share cores round-robin.
+
+    Args:
+        available (list): Cores this process may run on
+        workers (int): Workers sharing the host
+        index (int): This worker's slot, 0 <= index < workers
+
+    Returns:
+        list: Cores to pin this worker to
+    """
+    available = sorted(available)
+    if workers <= 1:
+        return available
+    if workers >= len(available):
+        return [available[index % len(available)]]
+    base, extra = divmod(len(available), workers)
+    start = index * base + min(index, extra)
+    return available[start:start + base + (1 if index < extra else 0)]
+
+
+def claim_worker_slot(workers, lock_dir=None):
+    """
+    Take the lowest free worker slot on this host
+
+    Each slot is an exclusive `flock` on a file in `lock_dir`; the lock is
+    held until the process exits, so a restarted worker reuses the slot of
+    the one it replaces.
+
+    Args:
+        workers (int): Number of slots
+        lock_dir (str, optional): Directory of the lock files (default: system temp dir)
+
+    Returns:
+        int: Claimed slot, or None if every slot is taken
+    """
+    lock_dir = lock_dir or tempfile.gettempdir()
+    for index in range(workers):
+        handle = open(os.path.join(lock_dir, f"brain-tumor-inference-slot-{index}.lock"), 'w')
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            continue
+        _slot_files.append(handle)
+        return index
+    return None
+
+
+def _pin_cores(config):
+    setting = (config['INFERENCE_CPU_AFFINITY'] or '').strip()
+    if not setting or not hasattr(os, 'sched_setaffinity'):
+        return None
+    if setting != 'auto':
+        cores = parse_cpu_list(setting)
+    else:
+        workers = config['INFERENCE_WORKERS_PER_HOST']
+        index = os.getenv('INFERENCE_WORKER_INDEX')
+        index = int(index) if index is not None else claim_worker_slot(workers)
+        if index is None:
+            return None
+        cores = worker_cores(os.sched_getaffinity(0), workers, index)
+    pin_process(cores)
+    return cores
+
+
+def pin_process(cores):
+    """
+    Pin every thread of this process to a set of cores
+
+    `sched_setaffinity(0, ...)` only pins the calling thread on Linux, so
+    each thread id under /proc/self/task is pinned, until a pass finds no
+    thread it has not pinned yet (one started meanwhile by an unpinned
+    thread). Threads started later inherit the mask of their creator.
+
+    Args:
+        cores (list): Cores to run on
+    """
+    pinned = set()
+    while True:
+        try:
+            threads = set(int(tid) for tid in os.listdir('/proc/self/task'))
+        except OSError:
+            threads = {0}  # no procfs: the calling thread only
+        if threads <= pinned:
+            return
+        for tid in threads - pinned:
+            try:
+                os.sched_setaffinity(tid, cores)
+            except ProcessLookupError:
+                pass  # the thread exited
+        pinned |= threads
+
+
+def apply_runtime_profile(config):
+    """
+    Apply the inference runtime profile to this process, once
+
+    Must run before TensorFlow is imported for the oneDNN toggle to take
+    effect. When cores are pinned and no intra-op thread count is
+    configured, the intra-op pool is sized to the pinned cores.
+
+    Args:
+        config: Flask config mapping
+
+    Returns:
+        dict: The applied profile (threads, pinned cores, oneDNN setting)
+    """
+    global _profile
+    if _profile is not None:
+        return _profile
+    with _profile_lock:
+        if _profile is None:
+            onednn = (config['INFERENCE_ONEDNN'] or '').strip()
+            if onednn:
+                if 'tensorflow' in sys.modules:
+                    print("Warning: TensorFlow already imported; INFERENCE_ONEDNN has no effect")
+                os.environ['TF_ENABLE_ONEDNN_OPTS'] = onednn
+
+            cores = _pin_cores(config)
+            intra_op = config['INFERENCE_INTRA_OP_THREADS'] or (len(cores) if cores else 0)
+            _profile = {
+                'intra_op_threads': intra_op,
+                'inter_op_threads': config['INFERENCE_INTER_OP_THREADS'],
+                'cpu_affinity': cores,
+                'onednn': onednn or None,
+            }
+    return _profile
+
+
+def runtime_profile():
+    """
+    The profile applied in this process, without applying it
+
+    Returns:
+        dict: `apply_runtime_profile` result, or None if the model was not loaded yet
+    """
+    return _profile
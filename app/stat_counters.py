@@ -0,0 +1,268 @@
+# Statistics Counters
+
+"""
+Incrementally Maintained Counters for the Dashboard and Statistics
+
+Counting users and patients (and grouping patients by tumor type) scans
+the whole table or index, on every dashboard load. The stat_counter table
+keeps these totals instead, adjusted by every writer in the same
+transaction as its insert, delete or update, so reading them costs one
+scan of a table with a few dozen rows whatever the size of the data.
+
+Counters (name -> count, total):
+- 'users', 'patients': row counts
+- 'tumor_type:<type>', 'model_version:<version>': patient records per
+  prediction and per model (an empty suffix stands for NULL)
+- 'confidence:<type>', 'inference_ms:<type>': records of that tumor type
+  with a value, and the sum of the values (means without a scan)
+- 'min_confidence:<type>': 1 and the lowest confidence of that tumor type
+  (0 when no record has one). A minimum cannot be adjusted by deltas when
+  records go away, so writers re-read it with one seek on the
+  tumor_type_confidence index instead, after their own changes
+
+Counters are updated in sorted name order so that concurrent writers lock
+the rows in the same order. Writes that bypass these functions (manual SQL,
+a crashed rescoring run reading stale rows) make them drift;
+`flask stats reconcile` recomputes them from the tables.
+
+Key Functionality:
+- patient_counts / aggregate_patient_counts: counter deltas of patient records
+- increment_counters: apply deltas in the caller's transaction, refreshing
+  the minimum confidence of the tumor types they touch
+- read_counters / counter_value: current values
+- reconcile_counters: repair drift
+
+"""
+
+import math
+from collections import defaultdict, namedtuple
+
+from sqlalchemy.exc import IntegrityError
+
+from .models import db, Patient, StatCounter, User
+
+USERS = 'users'
+PATIENTS = 'patients'
+TUMOR_TYPE = 'tumor_type:'
+MODEL_VERSION = 'model_version:'
+CONFIDENCE = 'confidence:'
+INFERENCE_MS = 'inference_ms:'
+MIN_CONFIDENCE = 'min_confidence:'
+
+CounterValue = namedtuple('CounterValue', ['count', 'total'])
+
+# Counted fields of a patient record, for values that are not (yet) a Patient
+CountedPatient = namedtuple('CountedPatient', ['tumor_type', 'confidence', 'model_version', 'inference_ms'])
+
+
+def counter_name(prefix, key):
+    """
+    Name of a per-value counter
+
+    Args:
+        prefix (str): TUMOR_TYPE, MODEL_VERSION, CONFIDENCE, INFERENCE_MS or MIN_CONFIDENCE
+        key (str): Tumor type or model version, None for NULL
+
+    Returns:
+        str: Counter name
+    """
+    return prefix + (key or '')
+
+
+def _deltas():
+    return defaultdict(lambda: [0, 0.0])
+
+
+def merge_counts(*deltas):
+    """
+    Sum several sets of counter deltas
+
+    Returns:
+        dict: name -> [count, total]
+    """
+    merged = _deltas()
+    for delta in deltas:
+        for name, (count, total) in delta.items():
+            merged[name][0] += count
+            merged[name][1] += total
+    return merged
+
+
+def patient_counts(patients, sign=1):
+    """
+    Counter deltas of patient records being added or removed
+
+    Args:
+        patients (iterable): Patient records or CountedPatient tuples
+        sign (int): 1 when the records are added, -1 when they are removed
+
+    Returns:
+        dict: name -> [count, total]
+    """
+    deltas = _deltas()
+    for patient in patients:
+        deltas[PATIENTS][0] += sign
+        deltas[counter_name(TUMOR_TYPE, patient.tumor_type)][0] += sign
+        deltas[counter_name(MODEL_VERSION, patient.model_version)][0] += sign
+        for prefix, value in ((CONFIDENCE, patient.confidence), (INFERENCE_MS, patient.inference_ms)):
+            if value is not None:
+                delta = deltas[counter_name(prefix, patient.tumor_type)]
+                delta[0] += sign
+                delta[1] += sign * value
+    return deltas
+
+
+def aggregate_patient_counts(conditions=(), sign=1):
+    """
+    Counter deltas of all patient records matching some conditions, computed in SQL
+
+    Args:
+        conditions (iterable): Conditions for `Query.filter` (none: every record)
+        sign (int): 1 for the records' contribution, -1 when they are removed
+
+    Returns:
+        dict: name -> [count, total]
+    """
+    rows = db.session.query(
+        Patient.tumor_type,
+        Patient.model_version,
+        db.func.count(Patient.id),
+        db.func.count(Patient.confidence),
+        db.func.sum(Patient.confidence),
+        db.func.count(Patient.inference_ms),
+        db.func.sum(Patient.inference_ms)
+    ).filter(*conditions).group_by(Patient.tumor_type, Patient.model_version).all()
+
+    deltas = _deltas()
+    for tumor_type, model_version, count, scored, confidence, timed, inference_ms in rows:
+        deltas[PATIENTS][0] += sign * count
+        deltas[counter_name(TUMOR_TYPE, tumor_type)][0] += sign * count
+        deltas[counter_name(MODEL_VERSION, model_version)][0] += sign * count
+        for prefix, counted, total in ((CONFIDENCE, scored, confidence), (INFERENCE_MS, timed, inference_ms)):
+            if counted:
+                delta = deltas[counter_name(prefix, tumor_type)]
+                delta[0] += sign * counted
+                delta[1] += sign * float(total)
+    return deltas
+
+
+def increment_counters(deltas):
+    """
+    Apply counter deltas in the caller's transaction (the caller commits)
+
+    The minimum confidence of every tumor type with a confidence delta is
+    re-read from the patient table, so call this after the records have
+    been added, changed or deleted in the session.
+
+    Args:
+        deltas (dict): name -> (count, total), e.g. from `patient_counts`
+    """
+    minima = {MIN_CONFIDENCE + name[len(CONFIDENCE):] for name in deltas if name.startswith(CONFIDENCE)}
+    for name in sorted(set(deltas) | minima):
+        if name in minima:
+            minimum = min_confidence(name[len(MIN_CONFIDENCE):] or None)
+            _write_counter(name, 0 if minimum is None else 1, minimum or 0.0, replace=True)
+            continue
+        count, total = deltas[name]
+        if not count and not total:
+            continue
+        _write_counter(name, count, total)
+
+
+def _write_counter(name, count, total, replace=False):
+    if replace:
+        values = {'count': count, 'total': total}
+    else:
+        values = {'count': StatCounter.count + count, 'total': StatCounter.total + total}
+    if StatCounter.query.filter_by(name=name).update(values, synchronize_session=False):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(StatCounter(name=name, count=count, total=total))
+    except IntegrityError:
+        # Another writer created the counter first
+        StatCounter.query.filter_by(name=name).update(values, synchronize_session=False)
+
+
+def min_confidence(tumor_type):
+    """
+    Lowest stored confidence of a tumor type, read with one seek on tumor_type_confidence
+
+    Args:
+        tumor_type (str): Tumor type, None for NULL
+
+    Returns:
+        float: The minimum, or None if no record of that type has a confidence
+    """
+    return db.session.query(Patient.confidence).filter(
+        Patient.tumor_type == tumor_type if tumor_type is not None else Patient.tumor_type.is_(None),
+        Patient.confidence.isnot(None)
+    ).order_by(Patient.confidence).limit(1).scalar()
+
+
+def read_counters():
+    """
+    Current value of every counter
+
+    Returns:
+        dict: name -> CounterValue
+    """
+    return {name: CounterValue(count, total)
+            for name, count, total in db.session.query(StatCounter.name, StatCounter.count, StatCounter.total)}
+
+
+def counter_value(name):
+    """
+    Current count of one counter
+
+    Args:
+        name (str): Counter name, e.g. USERS
+
+    Returns:
+        int: Count, 0 for a counter never written
+    """
+    return db.session.query(StatCounter.count).filter_by(name=name).scalar() or 0
+
+
+def reconcile_counters(dry_run=False):
+    """
+    Recompute every counter from the tables and repair the ones that drifted
+
+    The counter rows are locked before the tables are counted, so writers
+    running meanwhile wait and apply their deltas on top of the repaired
+    values (MySQL; SQLite serializes writers anyway).
+
+    Args:
+        dry_run (bool): Report the drift without repairing it
+
+    Returns:
+        dict: Number of counters, the drifted ones with their stored and
+            actual values, and whether they were repaired
+    """
+    stored = {counter.name: counter for counter in StatCounter.query.with_for_update().all()}
+    actual = aggregate_patient_counts()
+    actual[USERS][0] = User.query.count()
+    minima = db.session.query(Patient.tumor_type, db.func.min(Patient.confidence)).filter(
+        Patient.confidence.isnot(None)).group_by(Patient.tumor_type)
+    for tumor_type, minimum in minima:
+        actual[counter_name(MIN_CONFIDENCE, tumor_type)] = [1, float(minimum)]
+
+    drifted = {}
+    for name in sorted(set(stored) | set(actual)):
+        count, total = actual.get(name, (0, 0.0))
+        counter = stored.get(name)
+        if counter is None:
+            if not count and not total:
+                continue
+            counter = StatCounter(name=name, count=0, total=0.0)
+            db.session.add(counter)
+        elif counter.count == count and math.isclose(counter.total, total, rel_tol=1e-9, abs_tol=1e-6):
+            continue
+        drifted[name] = {'stored': [counter.count, counter.total], 'actual': [count, total]}
+        counter.count, counter.total = count, total
+
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+    return {'counters': len(set(stored) | set(actual)), 'drifted': drifted, 'repaired': bool(drifted) and not dry_run}
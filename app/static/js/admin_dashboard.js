@@ -41,8 +41,14 @@
         }
     });
 
-    // Prediction Analytics Chart
-    var ctxPrediction = document.getElementById('predictionChart').getContext('2d');
+    // Prediction Analytics Chart: stored predictions per tumor type
+    var predictionCanvas = document.getElementById('predictionChart');
+    var distribution = JSON.parse(predictionCanvas.dataset.distribution || '{}');
+    benignPredictions = distribution['Glioma'] || 0;
+    malignantPredictions = distribution['Meningioma'] || 0;
+    noTumorPredictions = distribution['No Tumor'] || 0;
+    pituitaryPredictions = distribution['Pituitary'] || 0;
+    var ctxPrediction = predictionCanvas.getContext('2d');
     var predictionChart = new Chart(ctxPrediction, {
         type: 'doughnut',
         data: {
@@ -97,3 +103,116 @@
         }
     });
 
+
+    // Activity Trends: series from /admin/api/analytics (daily rollups)
+    var analyticsCard = document.getElementById('analytics');
+    var tumorColors = {
+        'Glioma': '#36A2EB', 'Meningioma': '#FF6384', 'No Tumor': '#FFCE56', 'Pituitary': '#4BC0C0', 'unknown': '#C9CBCF'
+    };
+    var trendCharts = {};
+
+    function isoDate(date) {
+        return date.toISOString().slice(0, 10);
+    }
+
+    function drawChart(id, config) {
+        if (trendCharts[id]) {
+            trendCharts[id].destroy();
+        }
+        trendCharts[id] = new Chart(document.getElementById(id).getContext('2d'), config);
+    }
+
+    function drawAnalytics(data) {
+        var predictions = data.predictions;
+        drawChart('predictionTrendChart', {
+            type: 'bar',
+            data: {
+                labels: predictions.buckets,
+                datasets: Object.keys(predictions.series).map(function(tumorType) {
+                    return {
+                        label: tumorType,
+                        data: predictions.series[tumorType],
+                        backgroundColor: tumorColors[tumorType] || '#9966FF'
+                    };
+                })
+            },
+            options: {
+                responsive: true,
+                maintainAspectRatio: false,
+                plugins: { title: { display: true, text: 'Predictions per ' + data.range.bucket } },
+                scales: { x: { stacked: true }, y: { stacked: true, beginAtZero: true } }
+            }
+        });
+
+        drawChart('loginRateChart', {
+            type: 'line',
+            data: {
+                labels: data.logins.buckets,
+                datasets: [{
+                    label: 'Login success rate',
+                    data: data.logins.success_rate,
+                    borderColor: '#4BC0C0',
+                    spanGaps: true,
+                    tension: 0.1
+                }]
+            },
+            options: {
+                responsive: true,
+                maintainAspectRatio: false,
+                plugins: { title: { display: true, text: 'Login Success Rate' } },
+                scales: {
+                    y: {
+                        min: 0,
+                        max: 1,
+                        ticks: {
+                            callback: function(value) {
+                                return (value * 100).toFixed(0) + '%';
+                            }
+                        }
+                    }
+                }
+            }
+        });
+
+        drawChart('userVolumeChart', {
+            type: 'bar',
+            data: {
+                labels: data.users.map(function(user) { return user.username; }),
+                datasets: [{
+                    label: 'Predictions',
+                    data: data.users.map(function(user) { return user.predictions; }),
+                    backgroundColor: '#36A2EB'
+                }]
+            },
+            options: {
+                indexAxis: 'y',
+                responsive: true,
+                maintainAspectRatio: false,
+                plugins: { title: { display: true, text: 'Predictions per User' }, legend: { display: false } }
+            }
+        });
+    }
+
+    function loadAnalytics() {
+        var parts = document.getElementById('analytics-range').value.split(':');
+        var to = new Date();
+        var from = new Date(to.getTime() - (parseInt(parts[0], 10) - 1) * 86400000);
+        var url = analyticsCard.dataset.analyticsUrl +
+            '?from=' + isoDate(from) + '&to=' + isoDate(to) + '&bucket=' + parts[1];
+        fetch(url, { headers: { 'Accept': 'application/json' } })
+            .then(function(response) {
+                if (!response.ok) {
+                    throw new Error('HTTP ' + response.status);
+                }
+                return response.json();
+            })
+            .then(drawAnalytics)
+            .catch(function(error) {
+                console.error('Error loading analytics:', error);
+            });
+    }
+
+    if (analyticsCard) {
+        document.getElementById('analytics-range').addEventListener('change', loadAnalytics);
+        loadAnalytics();
+    }
@@ -0,0 +1,69 @@
+    // Infinite scroll for the patient list: fetches the next page from /patients/page
+    // when the "Load more" link comes into view. Without JavaScript the link still
+    // opens the next page.
+    document.addEventListener('DOMContentLoaded', function() {
+        const loadMore = document.getElementById('load-more');
+        const rows = document.getElementById('patient-rows');
+        if (!loadMore || !rows || !('IntersectionObserver' in window)) {
+            return;
+        }
+        let loading = false;
+
+        function text(value) {
+            const span = document.createElement('span');
+            span.textContent = value === null || value === undefined ? '' : value;
+            return span.innerHTML;
+        }
+
+        function renderRow(patient) {
+            const image = patient.thumb_url
+                ? `<a href="${patient.preview_url}" target="_blank">
+                       <img src="${patient.thumb_url}" alt="Patient Image" width="80" height="80"
+                            loading="lazy" style="object-fit: cover;">
+                   </a>`
+                : 'No Image';
+            const explanation = patient.explanation_url
+                ? `<a href="${patient.explanation_url}" target="_blank">Grad-CAM</a>`
+                : '';
+            return `<tr>
+                <td>${patient.id}</td>
+                <td>${text(patient.name)}</td>
+                <td>${patient.age}</td>
+                <td>${text(patient.gender)}</td>
+                <td>${text(patient.tumor_type)}</td>
+                <td>${patient.diagnosis_date}</td>
+                <td>${image}</td>
+                <td>${text(patient.username)}</td>
+                <td>${explanation}</td>
+            </tr>`;
+        }
+
+        function loadNextPage() {
+            if (loading || !loadMore.dataset.next) {
+                return;
+            }
+            loading = true;
+            const url = `${loadMore.dataset.pageUrl}?after=${encodeURIComponent(loadMore.dataset.next)}`;
+            fetch(url, { headers: { 'Accept': 'application/json' } })
+                .then(response => response.json())
+                .then(data => {
+                    rows.insertAdjacentHTML('beforeend', data.patients.map(renderRow).join(''));
+                    if (data.next) {
+                        loadMore.dataset.next = data.next;
+                        loadMore.href = `?after=${encodeURIComponent(data.next)}`;
+                    } else {
+                        observer.disconnect();
+                        loadMore.remove();
+                    }
+                })
+                .catch(error => console.error('Error loading patients:', error))
+                .finally(() => { loading = false; });
+        }
+
+        const observer = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                loadNextPage();
+            }
+        });
+        observer.observe(loadMore);
+    });
@@ -20,8 +20,87 @@
             }
         }
     
+        function renderResult(data) {
+            // Check if treatment is available
+            if (data.treatment) {
+                resultDisplay.innerHTML = `
+                    <p>Prediction: ${data.prediction}</p>
+                    <p>Confidence: ${data.confidence}%</p>
+                    <h3>Treatment Details</h3>
+                    <p><strong>Tumor Type:</strong> ${data.treatment.tumor_type}</p>
+                    <p><strong>Description:</strong> ${data.treatment.description}</p>
+                    <p><strong>Recommended Medication:</strong> ${data.treatment.recommended_medication}</p>
+                    <p><strong>Duration:</strong> ${data.treatment.duration}</p>
+                    <p><strong>Side Effects:</strong> ${data.treatment.side_effects}</p>
+                `;
+            } else {
+                resultDisplay.innerHTML = `
+                    <p>Prediction: ${data.prediction}</p>
+                    <p>Confidence: ${data.confidence}%</p>
+                    <p>No treatment information available.</p>
+                `;
+            }
+        }
+
+        function showError(error) {
+            console.error('Prediction error:', error);
+            resultDisplay.innerHTML = `<p>Error: ${error.message}</p>`;
+        }
+
+        function handleJobState(state) {
+            if (state.status === 'done') {
+                renderResult(state.result);
+                return true;
+            }
+            if (state.status === 'failed') {
+                showError(new Error(state.error || 'Prediction failed'));
+                return true;
+            }
+            resultDisplay.innerHTML = `<p>Processing... (${state.status})</p>`;
+            return false;
+        }
+
+        // Poll the job status endpoint until the job finishes
+        function pollJob(statusUrl) {
+            fetch(statusUrl)
+                .then(response => response.json())
+                .then(state => {
+                    if (!handleJobState(state)) {
+                        setTimeout(() => pollJob(statusUrl), 1000);
+                    }
+                })
+                .catch(showError);
+        }
+
+        // Follow an asynchronous job through server-sent events, falling back to polling
+        function followJob(job) {
+            if (!window.EventSource) {
+                pollJob(job.status_url);
+                return;
+            }
+            let finished = false;
+            const source = new EventSource(job.events_url);
+            source.addEventListener('status', function(e) {
+                finished = handleJobState(JSON.parse(e.data));
+                if (finished) {
+                    source.close();
+                }
+            });
+            source.onerror = function() {
+                // The server closes the stream when the job finishes or the stream times out
+                source.close();
+                if (!finished) {
+                    pollJob(job.status_url);
+                }
+            };
+        }
+
         function submitForm() {
             const formData = new FormData(form);
+            const asyncMode = form.dataset.mode === 'async';
+            if (asyncMode) {
+                formData.append('mode', 'async');
+            }
             resultDisplay.innerHTML = '<p>Processing... Please wait.</p>';
             
             fetch('/predict', {
@@ -43,31 +122,14 @@
                 if (data.error) {
                     throw new Error(data.error);
                 }
-
-                // Check if treatment is available
-                if (data.treatment) {
-                    resultDisplay.innerHTML = `
-                        <p>Prediction: ${data.prediction}</p>
-                        <p>Confidence: ${data.confidence}%</p>
-                        <h3>Treatment Details</h3>
-                        <p><strong>Tumor Type:</strong> ${data.treatment.tumor_type}</p>
-                        <p><strong>Description:</strong> ${data.treatment.description}</p>
-                        <p><strong>Recommended Medication:</strong> ${data.treatment.recommended_medication}</p>
-                        <p><strong>Duration:</strong> ${data.treatment.duration}</p>
-                        <p><strong>Side Effects:</strong> ${data.treatment.side_effects}</p>
-                    `;
-                } else {
-                    resultDisplay.innerHTML = `
-                        <p>Prediction: ${data.prediction}</p>
-                        <p>Confidence: ${data.confidence}%</p>
-                        <p>No treatment information available.</p>
-                    `;
+                if (asyncMode && data.job_id) {
+                    handleJobState(data);
+                    followJob(data);
+                    return;
                 }
+                renderResult(data);
             })
-            .catch(error => {
-                console.error('Prediction error:', error);
-                resultDisplay.innerHTML = `<p>Error: ${error.message}</p>`;
-            });
+            .catch(showError);
         }
     
         function checkFormCompletion() {
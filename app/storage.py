@@ -0,0 +1,437 @@
+# Content-Addressed Upload Storage
+
+"""
+Deduplicated, Sharded Storage for Uploaded Images
+
+Uploads used to be written to UPLOAD_FOLDER under their client file name:
+two scans called 'scan.jpg' silently overwrote each other, re-uploads of
+the same scan were stored again, and one flat directory grew without bound.
+Files are now named after the SHA-256 of their bytes and spread over a
+two-level directory tree:
+
+    <root>/<digest[0:2]>/<digest[2:4]>/<digest><ext>
+
+Identical bytes map to the same file, which is written once. Records keep
+storing the file path (Patient.image_path, User.profile_image), and the
+stored_file table counts how many records reference each file; a file
+whose count dropped to zero is removed by `flask storage gc` once it has
+been unreferenced for UPLOAD_STORAGE_GC_GRACE seconds.
+
+Key Functionality:
+- BlobStore: atomic, idempotent writes of content-addressed files
+- acquire_files / release_files: reference counting, applied in the same
+  transaction as the records that add or drop the references
+- track_files: registers every upload as soon as it is stored, so files
+  that no record ends up referencing (rejected volumes, failed predictions)
+  are collected too
+- collect_garbage: removes unreferenced files (and their overlays and thumbnails)
+- migrate_uploads: moves existing uploads into the store and rewrites the
+  rows that point at them, in bulk
+
+"""
+
+import glob
+import hashlib
+import os
+import re
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from .models import db, Patient, PredictionJob, StoredFile, User
+
+# Levels of two-hex-digit directories above each file (256 ** 2 leaf directories)
+SHARD_DEPTH = 2
+
+# URL prefix of profile images below the static folder (User.profile_image)
+PROFILE_PREFIX = 'profiles'
+
+_STORED_NAME = re.compile(r'^([0-9a-f]{64})(\.[a-z0-9]{1,8})?$')
+
+_MAGIC_EXTENSIONS = (
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'GIF8', '.gif'),
+    (b'BM', '.bmp'),
+)
+
+
+def content_digest(data):
+    """SHA-256 hex digest of raw bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_extension(data, filename=''):
+    """
+    Extension of a stored file, from its leading bytes when recognized
+
+    Sniffing keeps identical bytes uploaded as 'a.JPG' and 'b.jpeg' in one file.
+
+    Args:
+        data (bytes): File content
+        filename (str): Client file name, used for unrecognized formats
+
+    Returns:
+        str: Lower-case extension with its dot, or '' if there is none
+    """
+    for magic, extension in _MAGIC_EXTENSIONS:
+        if data.startswith(magic):
+            return extension
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return '.webp'
+    extension = os.path.splitext(filename)[1].lower()
+    return extension if re.fullmatch(r'\.[a-z0-9]{1,8}', extension) else ''
+
+
+def stored_digest(path):
+    """
+    Digest encoded in the name of a stored file
+
+    Args:
+        path (str): File path
+
+    Returns:
+        str: The digest, or None for files not written by a BlobStore (legacy uploads)
+    """
+    match = _STORED_NAME.match(os.path.basename(path or ''))
+    return match.group(1) if match else None
+
+
+class BlobStore:
+    """
+    Content-addressed files below one directory
+
+    Attributes:
+    - root: Store directory (UPLOAD_FOLDER or UPLOAD_FOLDERS)
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path_for(self, digest, extension=''):
+        """
+        Path of the file holding content with `digest`
+
+        Args:
+            digest (str): SHA-256 hex digest
+            extension (str): Extension, with its dot
+
+        Returns:
+            str: File path below the root
+        """
+        shards = [digest[2 * level:2 * level + 2] for level in range(SHARD_DEPTH)]
+        return os.path.join(self.root, *shards, digest + extension)
+
+    def put(self, data, filename='', digest=None):
+        """
+        Store bytes, unless identical bytes are already stored
+
+        The file is written to a temporary name in its shard directory and
+        renamed into place, so readers never see a partial file and
+        concurrent writers of the same content are harmless.
+
+        Args:
+            data (bytes): File content
+            filename (str): Client file name, for the extension of unrecognized formats
+            digest (str, optional): SHA-256 of `data`, if already computed
+
+        Returns:
+            str: Path of the stored file
+        """
+        path = self.path_for(digest or content_digest(data), file_extension(data, filename))
+        if os.path.exists(path):
+            return path
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                out.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return path
+
+    def put_stream(self, stream, filename='', max_bytes=None, chunk_size=1 << 20):
+        """
+        Store a large upload without holding it in memory
+
+        The stream is copied to a temporary file in the root while it is
+        hashed, then renamed to its content address (or discarded if that
+        content is already stored).
+
+        Args:
+            stream: Binary file object, e.g. `FileStorage.stream`
+            filename (str): Client file name, for the extension of unrecognized formats
+            max_bytes (int, optional): Largest accepted size
+            chunk_size (int): Bytes copied per read
+
+        Returns:
+            str: Path of the stored file
+
+        Raises:
+            UploadRejected: If the stream is empty or longer than `max_bytes`
+        """
+        from .uploads import UploadRejected
+
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        head = b''
+        size = 0
+        fd, temporary = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in iter(lambda: stream.read(chunk_size), b''):
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise UploadRejected(f"File is larger than {max_bytes // (1024 * 1024)} MB.", 413)
+                    if len(head) < 16:
+                        head += chunk[:16]
+                    digest.update(chunk)
+                    out.write(chunk)
+            if not size:
+                raise UploadRejected("The file is empty.", 400)
+            path = self.path_for(digest.hexdigest(), file_extension(head, filename))
+            if os.path.exists(path):
+                os.remove(temporary)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return path
+
+    def url_path(self, path, prefix):
+        """
+        Static-folder relative path of a stored file, e.g. 'profiles/ab/cd/<digest>.jpg'
+
+        Args:
+            path (str): Stored file path
+            prefix (str): Static sub-directory the store root is served as
+
+        Returns:
+            str: Forward-slash separated path
+        """
+        return '/'.join([prefix] + os.path.relpath(path, self.root).split(os.sep))
+
+    def file_path(self, url_path, prefix):
+        """Inverse of `url_path`: the file behind a static-folder relative path."""
+        relative = url_path[len(prefix) + 1:] if url_path.startswith(prefix + '/') else url_path
+        return os.path.join(self.root, *relative.split('/'))
+
+
+def acquire_files(paths):
+    """
+    Add one reference per occurrence of each stored file in `paths`
+
+    Runs in the caller's session; commit it together with the records that
+    hold the references. Paths of legacy (not content-addressed) files are
+    ignored.
+
+    Args:
+        paths (iterable): File paths, as stored in the referencing records
+    """
+    now = datetime.utcnow()
+    for path, count in Counter(p for p in paths if stored_digest(p)).items():
+        _reference(path, count, now)
+
+
+def track_files(paths):
+    """
+    Register stored files before any record references them
+
+    Call it (and commit) as soon as `BlobStore.put` or `put_stream` returns:
+    an upload may still be rejected, fail to score or fail to be saved, and
+    a file that no record takes a reference to within the grace period is
+    removed by `collect_garbage` like any unreferenced file.
+    Also restarts the grace period of files that are already registered.
+    Runs in the caller's session.
+
+    Args:
+        paths (iterable): Stored file paths
+    """
+    now = datetime.utcnow()
+    for path in set(p for p in paths if stored_digest(p)):
+        _reference(path, 0, now)
+
+
+def _reference(path, count, now):
+    if _add_references(path, count, now):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(StoredFile(path=path, digest=stored_digest(path), size=os.path.getsize(path),
+                                      ref_count=count, created_at=now, updated_at=now))
+    except IntegrityError:
+        # Another request inserted the row first
+        _add_references(path, count, now)
+
+
+def release_files(paths):
+    """
+    Drop one reference per occurrence of each stored file in `paths`
+
+    Runs in the caller's session, like `acquire_files`. Files are not
+    removed here: `collect_garbage` does that after the grace period, so a
+    file that is uploaded again in the meantime is simply reused.
+
+    Args:
+        paths (iterable): File paths, as stored in the records being deleted or changed
+    """
+    now = datetime.utcnow()
+    for path, count in Counter(p for p in paths if stored_digest(p)).items():
+        _add_references(path, -count, now)
+
+
+def _add_references(path, count, now):
+    # A single UPDATE, so concurrent requests never lose an increment
+    return StoredFile.query.filter(StoredFile.path == path).update(
+        {StoredFile.ref_count: StoredFile.ref_count + count, StoredFile.updated_at: now},
+        synchronize_session=False,
+    )
+
+
+def collect_garbage(grace_seconds=3600, limit=1000):
+    """
+    Remove stored files that nothing has referenced for `grace_seconds`
+
+    Files of queued or running prediction jobs are kept: the job has not
+    created its patient record yet. Grad-CAM overlays and thumbnails derived
+    from a removed file are removed with it.
+
+    Args:
+        grace_seconds (float): Minimum time since the last reference change
+        limit (int): Maximum number of files removed per call
+
+    Returns:
+        dict: Number of files and bytes removed
+    """
+    from .jobs import JOB_QUEUED, JOB_RUNNING
+
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    in_jobs = db.session.query(PredictionJob.image_path).filter(
+        PredictionJob.status.in_([JOB_QUEUED, JOB_RUNNING]))
+    unreferenced = (
+        StoredFile.query
+        .filter(StoredFile.ref_count <= 0, StoredFile.updated_at < cutoff, ~StoredFile.path.in_(in_jobs))
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    removed = {'files': 0, 'bytes': 0}
+    for stored in unreferenced:
+        directory = os.path.dirname(stored.path)
+        derived = (glob.glob(os.path.join(directory, f"gradcam-{stored.digest[:16]}-*"))
+                   + glob.glob(os.path.join(directory, f"{stored.digest}-*")))
+        for path in [stored.path] + derived:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        removed['files'] += 1
+        removed['bytes'] += stored.size
+        db.session.delete(stored)
+    db.session.commit()
+    return removed
+
+
+def _stage_file(store, path):
+    """Copy one legacy file into `store`; returns (stored path, size) or None if it is missing."""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except (FileNotFoundError, IsADirectoryError):
+        return None
+    return store.put(data, path), len(data)
+
+
+def _migrate_column(column, rows, to_file, to_value, store, batch_size, workers, report, legacy):
+    """Rewrite `column` of `rows` (a query of id, value pairs) to stored files, one chunk per commit."""
+    model = column.class_
+    staged = {}
+    last_id = None
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='storage-migrate') as pool:
+        while True:
+            query = rows if last_id is None else rows.filter(model.id > last_id)
+            chunk = query.order_by(model.id).limit(batch_size).all()
+            if not chunk:
+                break
+            last_id = chunk[-1][0]
+
+            pending = list({value for _, value in chunk} - staged.keys())
+            for value, result in zip(pending, pool.map(lambda v: _stage_file(store, to_file(v)), pending)):
+                staged[value] = result
+
+            mappings = []
+            for row_id, value in chunk:
+                if staged[value] is None:
+                    report['missing'] += 1
+                    continue
+                new_path, size = staged[value]
+                mappings.append({'id': row_id, column.key: to_value(new_path)})
+                report['bytes_referenced'] += size
+                legacy[to_file(value)] = (column, value)
+            db.session.bulk_update_mappings(model, mappings)
+            acquire_files(staged[value][0] for _, value in chunk if staged[value] is not None)
+            db.session.commit()
+            report['rows'] += len(mappings)
+    stored = {result for result in staged.values() if result}
+    report['stored_files'] += len({path for path, _ in stored})
+    report['bytes_stored'] += sum(size for _, size in stored)
+
+
+def _is_stored(column):
+    # Stored files sit in shard directories: '.../ab/cd/<64 hex digits>.<ext>'
+    return column.like('%/__/__/' + '_' * 64 + '%')
+
+
+def migrate_uploads(upload_store, profile_store, batch_size=500, workers=8):
+    """
+    Move uploads saved under their client file names into the content-addressed stores
+
+    Rows are processed in primary key order, `batch_size` per transaction;
+    the files of a chunk are read, hashed and written by `workers` threads.
+    Each chunk's rows and reference counts are committed together, so an
+    interrupted run can simply be started again: migrated rows are skipped.
+    Legacy files are deleted at the end, once no row references them.
+
+    Args:
+        upload_store (BlobStore): Store of patient scans (UPLOAD_FOLDER)
+        profile_store (BlobStore): Store of profile images (UPLOAD_FOLDERS)
+        batch_size (int): Rows per transaction
+        workers (int): Threads copying files
+
+    Returns:
+        dict: Rows rewritten, rows whose file is missing, distinct stored files,
+            bytes referenced vs. bytes stored, and legacy files removed
+    """
+    report = {'rows': 0, 'missing': 0, 'stored_files': 0, 'bytes_referenced': 0, 'bytes_stored': 0,
+              'legacy_files_removed': 0}
+    legacy = {}
+
+    patients = db.session.query(Patient.id, Patient.image_path).filter(
+        Patient.image_path != '', ~_is_stored(Patient.image_path))
+    _migrate_column(Patient.image_path, patients, lambda value: value, lambda path: path,
+                    upload_store, batch_size, workers, report, legacy)
+
+    users = db.session.query(User.id, User.profile_image).filter(
+        User.profile_image.isnot(None), User.profile_image != '', ~_is_stored(User.profile_image))
+    _migrate_column(User.profile_image, users,
+                    lambda value: profile_store.file_path(value, PROFILE_PREFIX),
+                    lambda path: profile_store.url_path(path, PROFILE_PREFIX),
+                    profile_store, batch_size, workers, report, legacy)
+
+    for path, (column, value) in legacy.items():
+        still_used = (column.class_.query.filter(column == value).first()
+                      or PredictionJob.query.filter_by(image_path=path).first())
+        if not still_used and os.path.exists(path):
+            os.remove(path)
+            report['legacy_files_removed'] += 1
+    return report
@@ -0,0 +1,203 @@
+# Thumbnails and Previews of Patient Scans
+
+"""
+Derivative Images for Listing Pages
+
+The patients list used to link every scan at full resolution. Small
+derivatives are generated instead, once per source image and size, and
+served with long-lived cache headers.
+
+Key Functionality:
+- Fixed derivative sizes: 'thumb' (list rows) and 'preview' (click-through)
+- WebP output when Pillow supports it and the client accepts it, JPEG
+  otherwise
+- Reduced-resolution JPEG decoding (draft mode), so a multi-megapixel scan
+  is never decoded at full size just to be shrunk
+- Files stored next to the source, named after the source's content hash
+  and the size: identical scans share derivatives, and they are never stale
+- Generation in the background right after upload, or lazily on first request;
+  at most THUMBNAILS_MAX_PENDING uploads wait for the background thread, and
+  the rest are left to the first request
+
+"""
+
+import io
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, features
+
+from .storage import content_digest, stored_digest
+
+# Longest side in pixels of each derivative
+DERIVATIVE_SIZES = {
+    'thumb': 128,
+    'preview': 512,
+}
+
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+WEBP_SUPPORTED = features.check('webp')
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = 0
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def preferred_format(accept=None):
+    """
+    Derivative format for a client
+
+    Args:
+        accept (str, optional): The request's Accept header; None for the default format
+
+    Returns:
+        str: 'webp' or 'jpeg'
+    """
+    if WEBP_SUPPORTED and (accept is None or 'image/webp' in accept):
+        return 'webp'
+    return 'jpeg'
+
+
+def derivative_path(source_path, size, fmt, digest):
+    """
+    Where the derivative of an image is stored
+
+    Args:
+        source_path (str): The original upload
+        size (str): Key of DERIVATIVE_SIZES
+        fmt (str): Key of FORMATS
+        digest (str): SHA-256 of the original
+
+    Returns:
+        str: Derivative path in the original's directory
+    """
+    extension = 'jpg' if fmt == 'jpeg' else fmt
+    return os.path.join(os.path.dirname(source_path), f"{digest}-{size}{DERIVATIVE_SIZES[size]}.{extension}")
+
+
+def render_derivative(data, size, fmt):
+    """
+    Encode a downscaled copy of an image
+
+    Args:
+        data (bytes): Raw bytes of the original
+        size (str): Key of DERIVATIVE_SIZES
+        fmt (str): Key of FORMATS
+
+    Returns:
+        bytes: The encoded derivative
+    """
+    longest = DERIVATIVE_SIZES[size]
+    img = Image.open(io.BytesIO(data))
+    img.draft('RGB', (longest, longest))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    img.thumbnail((longest, longest), Image.LANCZOS)
+    encoder, _, options = FORMATS[fmt]
+    out = io.BytesIO()
+    img.save(out, encoder, **options)
+    return out.getvalue()
+
+
+def ensure_derivative(source_path, size, fmt, data=None):
+    """
+    Return the path of a derivative, generating it if it does not exist yet
+
+    Args:
+        source_path (str): The original upload
+        size (str): Key of DERIVATIVE_SIZES
+        fmt (str): Key of FORMATS
+        data (bytes, optional): The original's bytes, if already in memory
+
+    Returns:
+        str: Derivative path
+    """
+    # Content-addressed uploads carry their hash in the name; legacy uploads are hashed
+    digest = stored_digest(source_path)
+    if digest is None:
+        data = data if data is not None else _read(source_path)
+        digest = content_digest(data)
+    path = derivative_path(source_path, size, fmt, digest)
+    if os.path.exists(path):
+        return path
+    data = data if data is not None else _read(source_path)
+    encoded = render_derivative(data, size, fmt)
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(encoded)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    return path
+
+
+def generate_derivatives(source_path, data=None, fmt=None):
+    """
+    Generate every derivative size of one upload
+
+    Args:
+        source_path (str): The original upload
+        data (bytes, optional): The original's bytes, if already in memory
+        fmt (str, optional): Key of FORMATS (default: `preferred_format()`)
+
+    Returns:
+        list: Derivative paths
+    """
+    fmt = fmt or preferred_format()
+    return [ensure_derivative(source_path, size, fmt, data) for size in DERIVATIVE_SIZES]
+
+
+def schedule_derivatives(app, source_path):
+    """
+    Generate the derivatives of a fresh upload on a background thread, if enabled
+
+    The task only holds the path and reads the stored upload itself. Uploads
+    arriving while THUMBNAILS_MAX_PENDING others are waiting are skipped;
+    their derivatives are generated on first request instead.
+
+    Never raises: thumbnails must not fail the prediction they belong to.
+
+    Args:
+        app: The Flask application instance
+        source_path (str): The saved upload
+    """
+    global _executor, _pending
+    if not app.config['THUMBNAILS_AT_UPLOAD']:
+        return
+    with _executor_lock:
+        if _pending >= app.config['THUMBNAILS_MAX_PENDING']:
+            return
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='thumbnails')
+        _pending += 1
+
+    def run():
+        global _pending
+        try:
+            generate_derivatives(source_path)
+        except Exception as e:
+            app.logger.error(f"Error generating thumbnails: {str(e)}")
+        finally:
+            with _executor_lock:
+                _pending -= 1
+
+    try:
+        _executor.submit(run)
+    except Exception as e:
+        with _executor_lock:
+            _pending -= 1
+        app.logger.error(f"Error scheduling thumbnails: {str(e)}")
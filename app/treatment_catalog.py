@@ -0,0 +1,151 @@
+# Treatment Catalog Cache
+
+"""
+In-process Cache of the Treatment Catalog
+
+Every prediction returns the treatment protocol of the predicted tumor
+type. The table holds a handful of rows that almost never change, yet each
+prediction used to query it and serialize the row again. Each worker now
+keeps the serialized protocols in memory and only asks the database
+whether they changed.
+
+Invalidation works across workers and hosts through a version stamp: the
+writers (`add_treatment`, `populate_treatments`) bump the 'treatments' row
+of the cache_version table in the same transaction as their change, and a
+worker reloads the catalog when the stamp differs from the one its copy
+was built from. The stamp (a primary-key lookup) is read at most every
+TREATMENT_CACHE_CHECK_INTERVAL seconds; the writing worker drops its own
+copy at once.
+
+Key Functionality:
+- TreatmentCatalog: serialized protocols and content ETags by tumor type
+- get_treatment_catalog: the catalog of the current application
+- bump_cache_version / read_cache_version: version stamps usable for any cached table
+
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from .models import db, CacheVersion, Treatment
+
+# cache_version row of the treatment table
+TREATMENTS = 'treatments'
+
+# Serialized treatment (`Treatment.to_dict()`, shared: never mutate it) and its ETag
+CatalogEntry = namedtuple('CatalogEntry', ['data', 'etag'])
+
+_catalog_lock = threading.Lock()
+
+
+def bump_cache_version(name):
+    """
+    Mark a cached dataset as changed, in the caller's transaction
+
+    Args:
+        name (str): Dataset name, e.g. TREATMENTS
+    """
+    now = datetime.utcnow()
+    values = {'version': CacheVersion.version + 1, 'updated_at': now}
+    if CacheVersion.query.filter_by(name=name).update(values, synchronize_session=False):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(CacheVersion(name=name, version=1, updated_at=now))
+    except IntegrityError:
+        # Another writer created the row first
+        CacheVersion.query.filter_by(name=name).update(values, synchronize_session=False)
+
+
+def read_cache_version(name):
+    """
+    Current version stamp of a cached dataset
+
+    Args:
+        name (str): Dataset name
+
+    Returns:
+        int: Version, 0 if the dataset was never written through a bumping writer
+    """
+    return db.session.query(CacheVersion.version).filter_by(name=name).scalar() or 0
+
+
+def _entry(treatment):
+    data = treatment.to_dict()
+    digest = hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+    return CatalogEntry(data, digest[:32])
+
+
+class TreatmentCatalog:
+    """
+    Serialized treatment protocols by tumor type, reloaded when the version stamp changes
+
+    Attributes:
+    - check_interval: Seconds between two reads of the version stamp
+    """
+
+    def __init__(self, check_interval):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._version = None
+        self._next_check = 0.0
+
+    def _refresh(self):
+        if self._version is not None and time.monotonic() < self._next_check:
+            return
+        with self._lock:
+            if self._version is not None and time.monotonic() < self._next_check:
+                return
+            # Stamp first: a write committed in between only causes one more reload
+            version = read_cache_version(TREATMENTS)
+            if version != self._version:
+                entries = {}
+                for treatment in Treatment.query.order_by(Treatment.id).all():
+                    entries.setdefault(treatment.tumor_type, _entry(treatment))
+                self._entries = entries
+                self._version = version
+            self._next_check = time.monotonic() + self.check_interval
+
+    def get(self, tumor_type):
+        """
+        Look up the protocol of a tumor type
+
+        Args:
+            tumor_type (str): Tumor type, e.g. a predicted category
+
+        Returns:
+            CatalogEntry: Serialized treatment and ETag, or None if the type has no protocol
+        """
+        self._refresh()
+        return self._entries.get(tumor_type)
+
+    def invalidate(self):
+        """Drop the cached copy; the next lookup reloads it."""
+        self._version = None
+
+
+def get_treatment_catalog(app=None):
+    """
+    Return the treatment catalog of an application, creating it on first use
+
+    Args:
+        app: Flask application; defaults to the current app
+
+    Returns:
+        TreatmentCatalog: Catalog checking its stamp every TREATMENT_CACHE_CHECK_INTERVAL seconds
+    """
+    app = app or current_app._get_current_object()
+    catalog = app.extensions.get('treatment_catalog')
+    if catalog is None:
+        with _catalog_lock:
+            catalog = app.extensions.setdefault(
+                'treatment_catalog', TreatmentCatalog(app.config['TREATMENT_CACHE_CHECK_INTERVAL']))
+    return catalog
@@ -0,0 +1,147 @@
+# Upload Intake
+
+"""
+Streaming Validation of Uploaded Images
+
+Uploads used to be read (or saved) whole and handed to the decoder before
+anything was checked, so a huge file or a non-image only failed after it
+had been buffered, written to disk and decoded. The request body is now
+consumed in chunks, and every check that can run on a prefix of the file
+runs as soon as that prefix has arrived.
+
+Key Functionality:
+- Size limit enforced while reading (UPLOAD_MAX_BYTES per file), on top of
+  Flask's MAX_CONTENT_LENGTH for the whole request
+- Magic-byte sniffing: only JPEG and PNG are accepted, whatever the file name says
+- Image dimensions parsed from the header (incremental PIL parser), so
+  decompression bombs are rejected before any pixel is decoded
+- SHA-256 computed in the same pass, reused by the prediction cache and
+  the content-addressed store instead of hashing the bytes again
+
+"""
+
+import hashlib
+from collections import namedtuple
+
+from PIL import Image, ImageFile
+
+CHUNK_SIZE = 64 * 1024
+
+# Leading bytes of the accepted formats
+SIGNATURES = {
+    'JPEG': b'\xff\xd8\xff',
+    'PNG': b'\x89PNG\r\n\x1a\n',
+}
+
+# Bytes needed to recognize every signature
+_SNIFF_BYTES = max(len(signature) for signature in SIGNATURES.values())
+
+Upload = namedtuple('Upload', ['data', 'digest', 'format', 'width', 'height'])
+
+
+class UploadRejected(Exception):
+    """
+    An upload that failed validation
+
+    Attributes:
+    - message: Reason, safe to show to the user
+    - status: HTTP status for JSON responses (413 too large, 415 not an accepted image)
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def sniff_format(head):
+    """
+    Image format from the leading bytes of a file
+
+    Args:
+        head (bytes): At least the first 8 bytes (fewer only for shorter files)
+
+    Returns:
+        str: 'JPEG' or 'PNG', or None for anything else
+    """
+    for name, signature in SIGNATURES.items():
+        if head.startswith(signature):
+            return name
+    return None
+
+
+def read_upload(stream, max_bytes, max_pixels, formats=('JPEG', 'PNG'), chunk_size=CHUNK_SIZE):
+    """
+    Read and validate an uploaded image in one pass
+
+    Reading stops at the first failed check: the format is known after
+    8 bytes and the dimensions after the image header, long before a
+    large file has been read completely.
+
+    Args:
+        stream: Binary file object, e.g. `FileStorage.stream`
+        max_bytes (int): Largest accepted file size
+        max_pixels (int): Largest accepted width * height
+        formats (tuple): Accepted formats (keys of SIGNATURES)
+        chunk_size (int): Bytes read per call
+
+    Returns:
+        Upload: Bytes, SHA-256 hex digest, format and dimensions
+
+    Raises:
+        UploadRejected: If the file is empty, too large, not an accepted image
+            format, or has too many pixels
+    """
+    digest = hashlib.sha256()
+    chunks = []
+    received = 0
+    head = b''
+    fmt = None
+    parser = ImageFile.Parser()
+    dimensions = None
+
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        received += len(chunk)
+        if received > max_bytes:
+            raise UploadRejected(f"File is larger than {max_bytes // (1024 * 1024)} MB.", 413)
+        digest.update(chunk)
+        chunks.append(chunk)
+
+        if fmt is None:
+            head = (head + chunk)[:_SNIFF_BYTES]
+            if len(head) == _SNIFF_BYTES:
+                fmt = _accepted_format(head, formats)
+        if dimensions is None:
+            dimensions = _feed_header(parser, chunk)
+            if dimensions and dimensions[0] * dimensions[1] > max_pixels:
+                raise UploadRejected(f"Image of {dimensions[0]}x{dimensions[1]} pixels is too large.", 413)
+
+    if not received:
+        raise UploadRejected("The file is empty.", 400)
+    if fmt is None:
+        fmt = _accepted_format(head, formats)
+    if dimensions is None:
+        raise UploadRejected("The file is not a readable image.", 415)
+    return Upload(b''.join(chunks), digest.hexdigest(), fmt, dimensions[0], dimensions[1])
+
+
+def _accepted_format(head, formats):
+    fmt = sniff_format(head)
+    if fmt not in formats:
+        raise UploadRejected(f"Only {' and '.join(formats)} images are accepted.", 415)
+    return fmt
+
+
+def _feed_header(parser, chunk):
+    # The parser opens the image as soon as it has seen the header; after that it
+    # would start decoding pixels, so it is not fed any further
+    try:
+        parser.feed(chunk)
+    except Image.DecompressionBombError:
+        raise UploadRejected("Image has too many pixels.", 413)
+    except Exception:
+        raise UploadRejected("The file is not a readable image.", 415)
+    return parser.image.size if parser.image is not None else None
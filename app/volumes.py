@@ -0,0 +1,466 @@
+# Volumetric Scan Ingestion
+
+"""
+NIfTI Volumes and DICOM Series for the 2-D Tumor Classifier
+
+The classifier was trained on single axial slices. Scanners export whole
+volumes, so a volume is cut into its axial slices, each slice is windowed
+to 8 bits like the training images, and the slices are streamed through
+the model in fixed-size batches. The per-slice class distributions are
+then combined into one study-level prediction.
+
+Key Functionality:
+- NIfTI-1 reader (.nii, .nii.gz) that memory-maps the voxel data: only the
+  pages of the slices being scored are read, never the whole volume
+- DICOM series reader (a .zip of slices, or one multi-frame file) that
+  sorts slices by position and decodes one slice at a time; needs the
+  optional `pydicom` package
+- Intensity windowing from the DICOM window tags, or estimated from
+  percentiles of a sample of slices
+- Slice-batched inference into one reused batch buffer; background-only
+  slices are skipped
+- Study aggregate: a tumor class is reported when at least
+  VOLUME_TUMOR_SLICE_FRACTION of the scored slices show a tumor
+
+"""
+
+import gzip
+import io
+import os
+import struct
+import tempfile
+import zipfile
+import zlib
+
+import numpy as np
+from PIL import Image
+
+from .inference import CATEGORIES
+from .preprocessing import fit_into, new_batch
+
+try:
+    import pydicom
+except ImportError:  # DICOM support is optional
+    pydicom = None
+
+NIFTI_HEADER_SIZE = 348
+
+# NIfTI-1 datatype codes -> numpy type codes (byte order added from the header)
+NIFTI_DTYPES = {2: 'u1', 4: 'i2', 8: 'i4', 16: 'f4', 64: 'f8', 256: 'i1', 512: 'u2', 768: 'u4'}
+
+NO_TUMOR = CATEGORIES.index('No Tumor')
+
+
+class VolumeUnsupported(ValueError):
+    """A file that is not a volume this module can read."""
+
+
+class NiftiVolume:
+    """
+    Axial slices of a single-file NIfTI-1 volume, memory-mapped
+
+    Voxels are stored x-fastest, so each axial slice (fixed z) is one
+    contiguous block of the file. Gzipped volumes are decompressed to a
+    temporary file first, since compressed data cannot be mapped; only the
+    bytes the header accounts for are written, up to `max_bytes`.
+
+    Attributes:
+    - modality: 'nifti'
+    - shape: (x, y, z) voxels
+    - spacing: Voxel size in mm (x, y, z)
+    - window: None (NIfTI has no display window; one is estimated)
+    """
+
+    modality = 'nifti'
+    window = None
+
+    def __init__(self, path, max_bytes=None):
+        self._temporary = None
+        self._data = None
+        try:
+            with open(path, 'rb') as f:
+                compressed = f.read(2) == b'\x1f\x8b'
+            if compressed:
+                path = self._decompress(path, max_bytes)
+            with open(path, 'rb') as f:
+                header = read_nifti_header(f.read(NIFTI_HEADER_SIZE))
+            if os.path.getsize(path) < nifti_data_end(header):
+                raise VolumeUnsupported("The NIfTI file is shorter than its header says")
+            self.shape = header['shape']
+            self.spacing = header['spacing']
+            self._slope, self._intercept = header['slope'], header['intercept']
+            # For 4-D series the first volume is the first x*y*z voxels
+            self._data = np.memmap(path, dtype=header['dtype'], mode='r', offset=header['offset'],
+                                   shape=self.shape, order='F')
+        except BaseException:
+            self.close()
+            raise
+
+    def _decompress(self, path, max_bytes):
+        handle, self._temporary = tempfile.mkstemp(suffix='.nii')
+        try:
+            with gzip.open(path, 'rb') as source, os.fdopen(handle, 'wb') as target:
+                raw = source.read(NIFTI_HEADER_SIZE)
+                # The first volume is all that is read: stop there, whatever the archive holds
+                end = nifti_data_end(read_nifti_header(raw))
+                if max_bytes is not None and end > max_bytes:
+                    raise VolumeUnsupported(f"Volume is larger than {max_bytes // (1024 * 1024)} MB uncompressed")
+                target.write(raw)
+                remaining = end - len(raw)
+                while remaining > 0:
+                    chunk = source.read(min(remaining, 1 << 20))
+                    if not chunk:
+                        break
+                    target.write(chunk)
+                    remaining -= len(chunk)
+        except (EOFError, gzip.BadGzipFile, zlib.error) as e:
+            raise VolumeUnsupported(f"Corrupt gzip file: {e}")
+        return self._temporary
+
+    def __len__(self):
+        return self.shape[2]
+
+    def slice(self, index):
+        """
+        One axial slice in scanner units, rows top to bottom
+
+        Args:
+            index (int): Slice number along z
+
+        Returns:
+            np.ndarray: float32 array of shape (y, x)
+        """
+        pixels = np.flipud(np.asarray(self._data[:, :, index], dtype=np.float32).T)
+        if self._slope not in (0.0, 1.0) or self._intercept:
+            pixels = pixels * (self._slope or 1.0) + self._intercept
+        return pixels
+
+    def close(self):
+        """Unmap the voxels and remove the decompressed copy, if any."""
+        self._data = None
+        if self._temporary and os.path.exists(self._temporary):
+            os.remove(self._temporary)
+        self._temporary = None
+
+
+def read_nifti_header(raw):
+    """
+    Parse the fields of a NIfTI-1 header needed to map the voxels
+
+    Args:
+        raw (bytes): The first 348 bytes of the file
+
+    Returns:
+        dict: numpy dtype, shape (x, y, z), spacing, voxel offset, scaling slope and intercept
+    """
+    if len(raw) < NIFTI_HEADER_SIZE:
+        raise VolumeUnsupported("File is too short for a NIfTI-1 header")
+    for endian in '<>':
+        if struct.unpack(endian + 'i', raw[:4])[0] == NIFTI_HEADER_SIZE:
+            break
+    else:
+        raise VolumeUnsupported("Not a NIfTI-1 file")
+    if raw[344:348] != b'n+1\x00':
+        raise VolumeUnsupported("Only single-file NIfTI-1 volumes (.nii) are supported")
+
+    dim = struct.unpack(endian + '8h', raw[40:56])
+    datatype = struct.unpack(endian + 'h', raw[70:72])[0]
+    pixdim = struct.unpack(endian + '8f', raw[76:108])
+    offset, slope, intercept = struct.unpack(endian + '3f', raw[108:120])
+    if dim[0] < 3:
+        raise VolumeUnsupported(f"Expected a 3-D volume, got {dim[0]} dimension(s)")
+    if datatype not in NIFTI_DTYPES:
+        raise VolumeUnsupported(f"Unsupported NIfTI datatype {datatype}")
+    if min(dim[1:4]) < 1:
+        raise VolumeUnsupported(f"Invalid NIfTI dimensions {tuple(dim[1:4])}")
+    if offset < NIFTI_HEADER_SIZE:
+        raise VolumeUnsupported(f"Invalid NIfTI voxel offset {offset}")
+    return {
+        'dtype': np.dtype(endian + NIFTI_DTYPES[datatype]),
+        'shape': tuple(int(d) for d in dim[1:4]),
+        'spacing': tuple(float(p) for p in pixdim[1:4]),
+        'offset': int(offset),
+        'slope': float(slope),
+        'intercept': float(intercept),
+    }
+
+
+def nifti_data_end(header):
+    """
+    Size a NIfTI-1 file needs for the first volume described by its header
+
+    Args:
+        header (dict): Output of `read_nifti_header`
+
+    Returns:
+        int: Voxel offset plus the bytes of x*y*z voxels
+    """
+    return header['offset'] + int(np.prod(header['shape'])) * header['dtype'].itemsize
+
+
+class DicomSeries:
+    """
+    Axial slices of a DICOM series: a .zip of single-slice files, or one multi-frame file
+
+    Slice headers of an archive are read up front (without pixel data) to
+    sort the slices by position; pixel data is then decoded one slice at a
+    time. A multi-frame file is decoded as a whole.
+
+    Attributes:
+    - modality: 'dicom'
+    - window: (center, width) from the first slice's window tags, or None
+    """
+
+    modality = 'dicom'
+
+    def __init__(self, path):
+        if pydicom is None:
+            raise VolumeUnsupported("DICOM support requires the pydicom package")
+        self._zip = None
+        self._frames = None
+        try:
+            if zipfile.is_zipfile(path):
+                self._zip = zipfile.ZipFile(path)
+                headers = []
+                for member in self._zip.namelist():
+                    if member.endswith('/'):
+                        continue
+                    try:
+                        header = pydicom.dcmread(self._zip.open(member), stop_before_pixels=True)
+                    except pydicom.errors.InvalidDicomError:
+                        continue
+                    headers.append((member, header))
+                if not headers:
+                    raise VolumeUnsupported("The archive contains no DICOM files")
+                headers.sort(key=lambda item: _slice_position(item[1]))
+                self._members = [member for member, _ in headers]
+                first = headers[0][1]
+            else:
+                first = pydicom.dcmread(path)
+                frames = first.pixel_array
+                multi_frame = int(getattr(first, 'NumberOfFrames', 1) or 1) > 1
+                self._frames = frames if multi_frame else frames[np.newaxis]
+                self._members = list(range(len(self._frames)))
+            self.window = _dicom_window(first)
+            self._rescale = (float(getattr(first, 'RescaleSlope', 1) or 1), float(getattr(first, 'RescaleIntercept', 0) or 0))
+        except BaseException:
+            self.close()
+            raise
+
+    def __len__(self):
+        return len(self._members)
+
+    def slice(self, index):
+        """
+        One slice in scanner units (rescale slope/intercept applied)
+
+        Args:
+            index (int): Position in the sorted series
+
+        Returns:
+            np.ndarray: float32 array of shape (rows, columns)
+        """
+        if self._frames is not None:
+            pixels = self._frames[index]
+            slope, intercept = self._rescale
+        else:
+            dataset = pydicom.dcmread(self._zip.open(self._members[index]))
+            pixels = dataset.pixel_array
+            slope = float(getattr(dataset, 'RescaleSlope', 1) or 1)
+            intercept = float(getattr(dataset, 'RescaleIntercept', 0) or 0)
+        return pixels.astype(np.float32) * slope + intercept
+
+    def close(self):
+        """Close the archive."""
+        if self._zip is not None:
+            self._zip.close()
+
+
+def _slice_position(header):
+    position = getattr(header, 'ImagePositionPatient', None)
+    if position is not None and len(position) == 3:
+        return float(position[2])
+    return float(getattr(header, 'InstanceNumber', 0) or 0)
+
+
+def _dicom_window(header):
+    center, width = getattr(header, 'WindowCenter', None), getattr(header, 'WindowWidth', None)
+    if center is None or width is None:
+        return None
+    return _first_value(center), max(_first_value(width), 1.0)
+
+
+def _first_value(value):
+    # Multi-valued window tags list several presets; the first one is the default
+    if isinstance(value, (str, bytes)) or np.isscalar(value):
+        return float(value)
+    return float(value[0])
+
+
+def open_volume(path, max_bytes=None):
+    """
+    Open a NIfTI volume or DICOM series, recognized by its content
+
+    Args:
+        path (str): Volume file (.nii, .nii.gz, .zip of DICOM slices, or .dcm)
+        max_bytes (int, optional): Largest volume decompressed from a .nii.gz
+
+    Returns:
+        NiftiVolume or DicomSeries: Call `close()` when done
+
+    Raises:
+        VolumeUnsupported: For anything else
+    """
+    with open(path, 'rb') as f:
+        head = f.read(NIFTI_HEADER_SIZE)
+    if head[:2] == b'\x1f\x8b' or head[:4] in (struct.pack('<i', NIFTI_HEADER_SIZE), struct.pack('>i', NIFTI_HEADER_SIZE)):
+        return NiftiVolume(path, max_bytes)
+    if head[:4] == b'PK\x03\x04' or head[128:132] == b'DICM':
+        return DicomSeries(path)
+    raise VolumeUnsupported("Expected a NIfTI volume (.nii, .nii.gz) or a DICOM series (.zip or .dcm)")
+
+
+def estimate_window(volume, samples=16):
+    """
+    Display window covering the 0.5th to 99.5th percentile of the intensities
+
+    Args:
+        volume: NiftiVolume or DicomSeries
+        samples (int): Evenly spaced slices to sample (every 4th pixel of each)
+
+    Returns:
+        tuple: (center, width)
+    """
+    indices = np.unique(np.linspace(0, len(volume) - 1, min(len(volume), samples)).astype(int))
+    values = np.concatenate([volume.slice(index)[::4, ::4].ravel() for index in indices])
+    low, high = np.percentile(values, [0.5, 99.5])
+    return float(low + high) / 2.0, max(float(high - low), 1e-6)
+
+
+def window_slice(pixels, center, width):
+    """
+    Map scanner intensities to 8 bits through a display window
+
+    Args:
+        pixels (np.ndarray): Slice in scanner units
+        center (float): Window center
+        width (float): Window width
+
+    Returns:
+        np.ndarray: uint8 array of the same shape
+    """
+    scaled = (pixels - (center - width / 2.0)) * (255.0 / width)
+    return np.clip(scaled, 0, 255).astype(np.uint8)
+
+
+def aggregate_slices(probabilities, min_tumor_fraction):
+    """
+    Combine per-slice class distributions into one study-level prediction
+
+    A tumor usually shows on a minority of the slices, so averaging all
+    slices would drown it in 'No Tumor'. Instead, when at least
+    `min_tumor_fraction` of the slices are classified as a tumor, the study
+    is labelled with the tumor class that has the highest mean probability
+    over those slices.
+
+    Args:
+        probabilities (np.ndarray): Shape (slices, 4)
+        min_tumor_fraction (float): Fraction of tumor slices needed to report a tumor
+
+    Returns:
+        dict: prediction, confidence (percent), mean probabilities per class,
+            tumor slice fraction, and the position (row) of the key slice
+    """
+    top = probabilities.argmax(axis=1)
+    tumor = top != NO_TUMOR
+    fraction = float(tumor.mean())
+    if tumor.any() and fraction >= min_tumor_fraction:
+        scores = probabilities[tumor].mean(axis=0)
+        scores[NO_TUMOR] = -1.0
+        label = int(scores.argmax())
+        confidence = float(scores[label])
+        key = int(np.argmax(np.where(tumor, probabilities[:, label], -1.0)))
+    else:
+        label = NO_TUMOR
+        confidence = float(probabilities[:, NO_TUMOR].mean())
+        key = len(probabilities) // 2
+    mean = probabilities.mean(axis=0)
+    return {
+        'prediction': CATEGORIES[label],
+        'confidence': round(confidence * 100, 2),
+        'probabilities': {category: round(float(p), 4) for category, p in zip(CATEGORIES, mean)},
+        'tumor_slice_fraction': round(fraction, 4),
+        'key_row': key,
+    }
+
+
+def predict_volume(volume, predict, batch_size=16, window=None, min_foreground=0.05, min_tumor_fraction=0.1):
+    """
+    Classify every informative axial slice of a volume and aggregate the study
+
+    Slices are windowed and written into one reused batch buffer; each
+    time it fills up, it is sent through `predict`. Slices with less than
+    `min_foreground` non-black pixels after windowing (air above and below
+    the head) are skipped.
+
+    Args:
+        volume: NiftiVolume or DicomSeries
+        predict (callable): Batch of shape (N, 150, 150, 3) -> probabilities (N, 4)
+        batch_size (int): Slices per forward pass
+        window (tuple, optional): (center, width); defaults to the volume's own or an estimate
+        min_foreground (float): Minimum fraction of non-black pixels of a scored slice
+        min_tumor_fraction (float): See `aggregate_slices`
+
+    Returns:
+        dict: window, slice counts, per-slice distributions and the study aggregate
+            (with `key_slice`, the slice that best shows the predicted class)
+    """
+    center, width = window or volume.window or estimate_window(volume)
+    batch = new_batch(batch_size)
+    scored, outputs = [], []
+    filled = 0
+    for index in range(len(volume)):
+        image = window_slice(volume.slice(index), center, width)
+        if np.count_nonzero(image) < min_foreground * image.size:
+            continue
+        fit_into(Image.fromarray(image), batch[filled])
+        scored.append(index)
+        filled += 1
+        if filled == batch_size:
+            outputs.append(np.array(predict(batch), dtype=np.float32))
+            filled = 0
+    if filled:
+        outputs.append(np.array(predict(batch[:filled]), dtype=np.float32))
+    if not scored:
+        raise VolumeUnsupported("No slice of the volume contains enough signal to classify")
+
+    probabilities = np.concatenate(outputs)
+    study = aggregate_slices(probabilities, min_tumor_fraction)
+    study['key_slice'] = scored[study.pop('key_row')]
+    return {
+        'modality': volume.modality,
+        'window': {'center': round(center, 3), 'width': round(width, 3)},
+        'slices': len(volume),
+        'scored_slices': len(scored),
+        'slice_predictions': [{'index': index, 'probabilities': [round(float(p), 4) for p in row]}
+                              for index, row in zip(scored, probabilities)],
+        'study': study,
+    }
+
+
+def render_slice(volume, index, window):
+    """
+    PNG of one windowed slice, stored as the patient's image (thumbnails, Grad-CAM)
+
+    Args:
+        volume: NiftiVolume or DicomSeries
+        index (int): Slice number
+        window (dict): {'center', 'width'} as returned by `predict_volume`
+
+    Returns:
+        bytes: PNG data
+    """
+    image = Image.fromarray(window_slice(volume.slice(index), window['center'], window['width']))
+    out = io.BytesIO()
+    image.save(out, 'PNG')
+    return out.getvalue()
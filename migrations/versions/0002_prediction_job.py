@@ -0,0 +1,50 @@
+"""prediction job
+
+Queue of asynchronous predictions (POST /predict with mode=async), claimed
+by the workers of app/jobs.py.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 12:29:02.305117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('prediction_job',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('image_path', sa.String(length=200), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('age', sa.Integer(), nullable=False),
+    sa.Column('gender', sa.String(length=10), nullable=False),
+    sa.Column('diagnosis_date', sa.Date(), nullable=False),
+    sa.Column('result', sa.Text(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('worker', sa.String(length=255), nullable=True),
+    sa.Column('claim', sa.String(length=32), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('prediction_job', schema=None) as batch_op:
+        batch_op.create_index('status_created_at', ['status', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('prediction_job', schema=None) as batch_op:
+        batch_op.drop_index('status_created_at')
+
+    op.drop_table('prediction_job')
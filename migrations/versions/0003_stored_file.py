@@ -0,0 +1,43 @@
+"""stored file
+
+Reference counts of the content-addressed uploads (app/storage.py). Uploads
+saved before this revision are not counted until `flask storage migrate`
+moves them into the store.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 12:29:31.840562
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stored_file',
+    sa.Column('path', sa.String(length=200), nullable=False),
+    sa.Column('digest', sa.String(length=64), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('path')
+    )
+    with op.batch_alter_table('stored_file', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_stored_file_digest'), ['digest'], unique=False)
+        batch_op.create_index('ref_count_updated_at', ['ref_count', 'updated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('stored_file', schema=None) as batch_op:
+        batch_op.drop_index('ref_count_updated_at')
+        batch_op.drop_index(batch_op.f('ix_stored_file_digest'))
+
+    op.drop_table('stored_file')
@@ -0,0 +1,41 @@
+"""volume study
+
+Per-slice results and the stored volume of patient records created by
+/predict/volume.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 12:29:58.126903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('volume_study',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('patient_id', sa.Integer(), nullable=False),
+    sa.Column('volume_path', sa.String(length=200), nullable=False),
+    sa.Column('modality', sa.String(length=10), nullable=False),
+    sa.Column('slice_count', sa.Integer(), nullable=False),
+    sa.Column('scored_slices', sa.Integer(), nullable=False),
+    sa.Column('key_slice', sa.Integer(), nullable=False),
+    sa.Column('slice_predictions', sa.Text(length=16777215), nullable=False),
+    sa.Column('study_probabilities', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['patient_id'], ['patient.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('patient_id')
+    )
+
+
+def downgrade():
+    op.drop_table('volume_study')
@@ -0,0 +1,39 @@
+"""patient prediction details
+
+Stores the full model output on patient records; existing rows stay NULL
+until `flask patients rescore` fills them in.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 12:40:02.118734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('patient', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('probabilities', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('confidence', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('model_version', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('inference_ms', sa.Float(), nullable=True))
+        batch_op.create_index('model_version', ['model_version'], unique=False)
+        batch_op.create_index('tumor_type_confidence', ['tumor_type', 'confidence'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('patient', schema=None) as batch_op:
+        batch_op.drop_index('tumor_type_confidence')
+        batch_op.drop_index('model_version')
+        batch_op.drop_column('inference_ms')
+        batch_op.drop_column('model_version')
+        batch_op.drop_column('confidence')
+        batch_op.drop_column('probabilities')
@@ -0,0 +1,27 @@
+"""patient list index
+
+Backs the keyset-paginated patients list (ORDER BY diagnosis_date, id).
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 12:40:47.502961
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('patient', schema=None) as batch_op:
+        batch_op.create_index('diagnosis_date_id', ['diagnosis_date', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('patient', schema=None) as batch_op:
+        batch_op.drop_index('diagnosis_date_id')
@@ -0,0 +1,36 @@
+"""hot query indexes
+
+Treatment lookups by tumor type (every prediction) and the most recent
+login attempts (admin dashboard, login log). Patient filters and groups on
+tumor_type use tumor_type_confidence from 0005; `flask schema explain`
+checks that each of these queries uses its index.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 12:41:30.817250
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('treatment', schema=None) as batch_op:
+        batch_op.create_index('tumor_type', ['tumor_type'], unique=False)
+
+    with op.batch_alter_table('user_login', schema=None) as batch_op:
+        batch_op.create_index('timestamp', ['timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user_login', schema=None) as batch_op:
+        batch_op.drop_index('timestamp')
+
+    with op.batch_alter_table('treatment', schema=None) as batch_op:
+        batch_op.drop_index('tumor_type')
@@ -0,0 +1,33 @@
+"""cache version
+
+Version stamps of data cached in every worker's memory (the treatment
+catalog). Writers bump the stamp in the same transaction as their change;
+workers reload their copy when it differs.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 14:05:12.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cache_version',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('cache_version')
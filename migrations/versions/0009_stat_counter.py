@@ -0,0 +1,71 @@
+"""stat counter
+
+Counters behind the dashboard and statistics totals, maintained by the
+writers of users and patient records. The counters are seeded from the
+existing rows; `flask stats reconcile` recomputes them at any time.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 15:22:47.913605
+
+"""
+from collections import defaultdict
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+user = sa.table('user', sa.column('id', sa.Integer))
+patient = sa.table(
+    'patient',
+    sa.column('id', sa.Integer),
+    sa.column('tumor_type', sa.String),
+    sa.column('model_version', sa.String),
+    sa.column('confidence', sa.Float),
+    sa.column('inference_ms', sa.Float),
+)
+
+
+def _seed_counters():
+    # Same counters as app/stat_counters.py at this revision
+    bind = op.get_bind()
+    counters = defaultdict(lambda: [0, 0.0])
+    counters['users'][0] = bind.execute(sa.select(sa.func.count(user.c.id))).scalar()
+    rows = bind.execute(sa.select(
+        patient.c.tumor_type,
+        patient.c.model_version,
+        sa.func.count(patient.c.id),
+        sa.func.count(patient.c.confidence),
+        sa.func.sum(patient.c.confidence),
+        sa.func.count(patient.c.inference_ms),
+        sa.func.sum(patient.c.inference_ms),
+    ).group_by(patient.c.tumor_type, patient.c.model_version))
+    for tumor_type, model_version, count, scored, confidence, timed, inference_ms in rows:
+        counters['patients'][0] += count
+        counters['tumor_type:' + (tumor_type or '')][0] += count
+        counters['model_version:' + (model_version or '')][0] += count
+        for prefix, counted, total in (('confidence:', scored, confidence), ('inference_ms:', timed, inference_ms)):
+            if counted:
+                counters[prefix + (tumor_type or '')][0] += counted
+                counters[prefix + (tumor_type or '')][1] += float(total)
+    return [{'name': name, 'count': count, 'total': total} for name, (count, total) in sorted(counters.items())]
+
+
+def upgrade():
+    stat_counter = op.create_table('stat_counter',
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('count', sa.BigInteger(), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(stat_counter, _seed_counters())
+
+
+def downgrade():
+    op.drop_table('stat_counter')
@@ -0,0 +1,58 @@
+"""analytics rollups
+
+Daily rollups of patient records (per diagnosis day, user and tumor type)
+and of login attempts, with their watermarks and the days marked for
+recomputation. The rollups start empty with both watermarks at 0: run.py
+builds them at startup; elsewhere run `flask stats rollup` once after
+upgrading. Analytics requests only refresh rollups that were built.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18 16:48:03.275419
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('prediction_rollup',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('user_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('tumor_type', sa.String(length=80), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'user_id', 'tumor_type')
+    )
+    op.create_table('login_rollup',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('successes', sa.Integer(), nullable=False),
+    sa.Column('failures', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day')
+    )
+    rollup_watermark = op.create_table('rollup_watermark',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('last_id', sa.Integer(), nullable=False),
+    sa.Column('refreshed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.create_table('rollup_stale_day',
+    sa.Column('rollup', sa.String(length=50), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('marked_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('rollup', 'day')
+    )
+    op.bulk_insert(rollup_watermark, [{'name': 'predictions', 'last_id': 0}, {'name': 'logins', 'last_id': 0}])
+
+
+def downgrade():
+    op.drop_table('rollup_stale_day')
+    op.drop_table('rollup_watermark')
+    op.drop_table('login_rollup')
+    op.drop_table('prediction_rollup')
@@ -20,6 +20,10 @@ SET time_zone = "+00:00";
 --
 -- Database: `brain_tumor_db`
 --
+-- Initial schema and seed data, at migration revision 0001 (see the
+-- alembic_version table). Later schema changes are migrations in
+-- migrations/versions, applied by `flask db upgrade`.
+--
 
 -- --------------------------------------------------------
 
@@ -43,6 +47,23 @@ INSERT INTO `admin` (`id`, `username`, `password_hash`, `created_at`) VALUES
 
 -- --------------------------------------------------------
 
+--
+-- Table structure for table `alembic_version`
+--
+
+CREATE TABLE `alembic_version` (
+  `version_num` varchar(32) NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+--
+-- Dumping data for table `alembic_version`
+--
+
+INSERT INTO `alembic_version` (`version_num`) VALUES
+('0001');
+
+-- --------------------------------------------------------
+
 --
 -- Table structure for table `patient`
 --
@@ -128,6 +149,12 @@ ALTER TABLE `admin`
   ADD PRIMARY KEY (`id`),
   ADD UNIQUE KEY `username` (`username`);
 
+--
+-- Indexes for table `alembic_version`
+--
+ALTER TABLE `alembic_version`
+  ADD PRIMARY KEY (`version_num`);
+
 --
 -- Indexes for table `patient`
 --
@@ -1,5 +1,8 @@
 # run.py
 
+import time
+_started = time.perf_counter()
+
 import os
 from dotenv import load_dotenv
 from app import create_app
@@ -10,19 +13,35 @@ load_dotenv()
 # Create Flask app with development config
 app = create_app('development')
 
+# Cold-start time: imports plus app creation (includes model load only when INFERENCE_WARMUP=1)
+startup_seconds = time.perf_counter() - _started
+print(f"App created in {startup_seconds:.2f}s")
+
 if __name__ == '__main__':
     with app.app_context():
-        from app.models import db
+        from flask_migrate import upgrade
         from app.operations import populate_treatments  # Optional: only if this function exists and is needed
         
-        # Create all tables
-        db.create_all()
+        # Create or update the tables to the latest migration (migrations/versions)
+        upgrade()
 
         # Optional: Pre-populate treatments
         try:
             populate_treatments()
         except Exception as e:
             print(f"Failed to populate treatments: {e}")
+
+        # Build (or catch up) the analytics rollups here rather than in the first analytics request
+        from app.analytics import refresh_rollups
+        try:
+            refresh_rollups()
+        except Exception as e:
+            print(f"Failed to refresh the analytics rollups: {e}")
+
+    # Start the in-process prediction job workers (not in the debug reloader's watcher process)
+    if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        from app.jobs import ensure_worker_pool
+        ensure_worker_pool(app)
     
     # Run the app
     app.run(host='0.0.0.0', port=5000,debug=True)
@@ -1,14 +1,62 @@
 # tests/conftest.py
+import numpy as np
 import pytest
-import os
-import tempfile
+
+from app import create_app
+from app.inference import CATEGORIES, prediction_result
+from app.models import db, User
+from app.operations import add_user
+
+
+@pytest.fixture
+def app_config():
+    """Config overrides of the test app; redefine in a test module to change settings."""
+    return {}
+
 
 @pytest.fixture
-def app():
-    from app.create_app import create_app
+def app(app_config):
+    """App on an in-memory SQLite database holding one user, 'doctor'."""
     app = create_app('testing')
-    return app
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config.update(app_config)
+    with app.app_context():
+        db.create_all()
+        add_user('doctor', 'doctor@test.com', 'password123')
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """Test client logged in as the first user."""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(User.query.first().id)
+        session['_fresh'] = True
+    return client
+
+
+@pytest.fixture
+def admin_client(app):
+    """Test client with an admin session."""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['admin_id'] = 1
+    return client
+
+
+@pytest.fixture
+def make_prediction():
+    """Builds the Prediction of a model giving `probability` to `category` and the rest evenly to the others."""
+    def make(category, probability, version='v1', inference_ms=12.0):
+        probabilities = np.full(len(CATEGORIES), (1 - probability) / 3, dtype=np.float32)
+        probabilities[CATEGORIES.index(category)] = probability
+        return prediction_result(probabilities, version, inference_ms)
+    return make
+
 
 @pytest.fixture
 def test_client(app):
-    return app.test_client()
\ No newline at end of file
+    return app.test_client()
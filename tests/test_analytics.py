@@ -0,0 +1,127 @@
+from datetime import date, datetime
+
+from app.analytics import analytics, get_analytics_cache, rebuild_rollups, refresh_rollups
+from app.models import db, LoginRollup, Patient, PredictionRollup, User, UserLogin
+from app.operations import add_patient, add_user, delete_patient_record
+
+
+def _patient(user, tumor_type, day):
+    return add_patient('P', 40, 'Female', tumor_type, day, f"/tmp/{tumor_type}.jpg", user.id)
+
+
+def _login(user, timestamp, success):
+    db.session.add(UserLogin(user_id=user.id, timestamp=timestamp, success=success))
+    db.session.commit()
+
+
+def _rollup_rows():
+    return sorted((row.day, row.user_id, row.tumor_type, row.count) for row in PredictionRollup.query)
+
+
+def test_rollups_answer_bucketed_ranges(app):
+    first = User.query.first()
+    second = add_user('nurse', 'nurse@test.com', 'password123')
+    _patient(first, 'Glioma', date(2024, 1, 1))    # Monday
+    _patient(first, 'Glioma', date(2024, 1, 3))
+    _patient(second, 'Pituitary', date(2024, 1, 3))
+    _patient(second, None, date(2024, 1, 9))
+    _login(first, datetime(2024, 1, 1, 8), True)
+    _login(first, datetime(2024, 1, 1, 9), False)
+    _login(second, datetime(2024, 1, 2, 23, 59), True)
+    refresh_rollups()
+
+    daily = analytics(date(2024, 1, 1), date(2024, 1, 3))
+    assert daily['predictions']['buckets'] == ['2024-01-01', '2024-01-02', '2024-01-03']
+    assert daily['predictions']['series'] == {'Glioma': [1, 0, 1], 'Pituitary': [0, 0, 1]}
+    assert daily['logins']['success_rate'] == [0.5, 1.0, None]
+    assert [(u['username'], u['predictions']) for u in daily['users']] == [('doctor', 2), ('nurse', 1)]
+
+    weekly = analytics(date(2024, 1, 2), date(2024, 1, 10), 'week')
+    assert weekly['predictions']['buckets'] == ['2024-01-01', '2024-01-08']
+    assert weekly['predictions']['series'] == {'Glioma': [1, 0], 'Pituitary': [1, 0], 'unknown': [0, 1]}
+    assert weekly['predictions']['total'] == 3
+
+
+def test_refresh_is_incremental_and_follows_changes(app):
+    user = User.query.first()
+    patients = [_patient(user, 'Glioma', date(2024, 1, day)) for day in (1, 2, 3)]
+    assert refresh_rollups()['predictions'] == {'days': 3, 'last_id': patients[-1].id}
+    # Nothing new: no day is recomputed
+    assert refresh_rollups(overlap=0)['predictions']['days'] == 0
+
+    new = _patient(user, 'Meningioma', date(2024, 1, 5))
+    assert refresh_rollups(overlap=0)['predictions'] == {'days': 1, 'last_id': new.id}
+
+    assert delete_patient_record(patients[0].id, user.id)
+    refresh_rollups(overlap=0)
+    incremental = _rollup_rows()
+    assert (date(2024, 1, 1), user.id, 'Glioma', 1) not in incremental
+
+    rebuild_rollups()
+    assert _rollup_rows() == incremental
+    assert len(incremental) == 3
+
+
+def test_overlap_catches_rows_committed_below_the_watermark(app):
+    user = User.query.first()
+    first = _patient(user, 'Glioma', date(2024, 1, 1))
+    _patient(user, 'Glioma', date(2024, 1, 2))
+    db.session.delete(first)
+    db.session.commit()
+    refresh_rollups(overlap=0)
+
+    # Row with an id below the watermark, as left by a transaction that committed late
+    db.session.add(Patient(id=first.id, name='Late', age=1, gender='Male', tumor_type='Pituitary',
+                           diagnosis_date=date(2024, 1, 1), image_path='/tmp/late.jpg', user_id=user.id))
+    db.session.commit()
+    _patient(user, 'Glioma', date(2024, 1, 3))
+    assert refresh_rollups(overlap=0)['predictions']['days'] == 1
+    assert refresh_rollups(overlap=10)['predictions']['days'] == 0  # nothing new since
+    _patient(user, 'Glioma', date(2024, 1, 4))
+    refresh_rollups(overlap=10)
+    assert (date(2024, 1, 1), user.id, 'Pituitary', 1) in _rollup_rows()
+
+
+def test_analytics_api_is_cached_and_validated(app, admin_client):
+    user = User.query.first()
+    _patient(user, 'Glioma', date(2024, 3, 1))
+    _login(user, datetime(2024, 3, 1, 12), True)
+
+    # Requests do not build the rollups: that is done at startup or by the CLI
+    unbuilt = admin_client.get('/admin/api/analytics?from=2024-03-01&to=2024-03-02')
+    assert unbuilt.get_json()['predictions']['series'] == {} and PredictionRollup.query.count() == 0
+    refresh_rollups()
+    get_analytics_cache().clear()
+
+    response = admin_client.get('/admin/api/analytics?from=2024-03-01&to=2024-03-02')
+    assert response.status_code == 200
+    assert response.get_json()['predictions']['series'] == {'Glioma': [1, 0]}
+    assert response.get_json()['logins']['successes'] == [1, 0]
+    assert 'max-age' in response.headers['Cache-Control']
+
+    _patient(user, 'Glioma', date(2024, 3, 2))
+    cached = admin_client.get('/admin/api/analytics?from=2024-03-01&to=2024-03-02')
+    assert cached.get_json()['predictions']['series'] == {'Glioma': [1, 0]}
+    get_analytics_cache().clear()
+    fresh = admin_client.get('/admin/api/analytics?from=2024-03-01&to=2024-03-02')
+    assert fresh.get_json()['predictions']['series'] == {'Glioma': [1, 1]}
+
+    assert admin_client.get('/admin/api/analytics?bucket=month').status_code == 400
+    assert admin_client.get('/admin/api/analytics?from=2024-03-02&to=2024-03-01').status_code == 400
+    assert admin_client.get('/admin/api/analytics?from=2000-01-01&to=2024-03-01').status_code == 400
+    assert admin_client.get('/admin/api/analytics?from=03/01/2024').status_code == 400
+    assert LoginRollup.query.count() == 1
+
+
+def test_deleted_logins_leave_the_login_rollup(app, admin_client):
+    keep = User.query.first()
+    user = add_user('nurse', 'nurse@test.com', 'password123')
+    _login(keep, datetime(2024, 1, 1, 8), True)
+    _login(user, datetime(2024, 1, 1, 9), False)
+    _login(user, datetime(2024, 1, 3, 9), True)
+    refresh_rollups()
+
+    assert admin_client.post(f"/admin/user/{user.id}/delete").status_code == 302
+    assert refresh_rollups(overlap=0)['logins']['days'] == 2
+    logins = analytics(date(2024, 1, 1), date(2024, 1, 3))['logins']
+    assert logins['successes'] == [1, 0, 0] and logins['failures'] == [0, 0, 0]
@@ -0,0 +1,86 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.batching import MicroBatcher
+
+
+def test_concurrent_requests_share_one_batch():
+    """Requests arriving inside the wait window run as a single forward pass."""
+    calls = []
+
+    def predict_fn(batch):
+        calls.append(len(batch))
+        return batch.sum(axis=1, keepdims=True)
+
+    batcher = MicroBatcher(predict_fn, max_batch_size=4, max_wait_ms=200)
+    results = {}
+
+    def worker(i):
+        results[i] = batcher.predict(np.full(3, i, dtype=np.float32), timeout=5)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert calls == [4]
+    for i in range(4):
+        assert results[i][0] == pytest.approx(3 * i)  # each caller gets its own row
+
+    stats = batcher.stats()
+    assert stats['batch_size_histogram'] == {'4': 1}
+    assert stats['requests'] == 4
+    assert stats['queue_depth'] == 0
+
+
+def test_batch_is_capped_at_max_batch_size():
+    """A burst larger than max_batch_size is split across forward passes."""
+    gate = threading.Event()
+    calls = []
+
+    def predict_fn(batch):
+        gate.wait(5)
+        calls.append(len(batch))
+        return batch
+
+    batcher = MicroBatcher(predict_fn, max_batch_size=2, max_wait_ms=50)
+    futures = [batcher.submit(np.zeros(1)) for _ in range(5)]
+    time.sleep(0.1)
+    gate.set()
+    for future in futures:
+        future.result(timeout=5)
+
+    assert max(calls) <= 2
+    assert sum(calls) == 5
+
+
+def test_errors_propagate_to_every_caller():
+    def predict_fn(batch):
+        raise ValueError("model failure")
+
+    batcher = MicroBatcher(predict_fn, max_batch_size=2, max_wait_ms=1)
+    with pytest.raises(ValueError):
+        batcher.predict(np.zeros(1), timeout=5)
+    assert batcher.stats()['errors'] == 1
+
+
+def test_close_answers_queued_requests_and_then_runs_inline():
+    gate = threading.Event()
+
+    def predict_fn(batch):
+        gate.wait(5)
+        return batch * 2
+
+    batcher = MicroBatcher(predict_fn, max_batch_size=2, max_wait_ms=1)
+    queued = [batcher.submit(np.full(1, i, dtype=np.float32)) for i in range(5)]
+    batcher.close()
+    gate.set()
+    assert [future.result(timeout=5)[0] for future in queued] == [0, 2, 4, 6, 8]
+
+    batcher._worker.join(5)
+    assert not batcher._worker.is_alive()
+    assert batcher.predict(np.ones(1, dtype=np.float32), timeout=5)[0] == 2
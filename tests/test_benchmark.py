@@ -0,0 +1,28 @@
+from app.benchmark import bench_preprocessing, diff_results, summarize, synthetic_images
+
+
+def test_summarize_reports_percentiles_and_throughput():
+    summary = summarize([10.0] * 99 + [110.0], images_per_call=4)
+    assert summary['calls'] == 100
+    assert summary['p50_ms'] == 10.0
+    assert summary['p99_ms'] > summary['p95_ms']
+    assert summary['images_per_sec'] == round(400 / 1.1, 2)
+
+
+def test_preprocessing_stages_on_synthetic_images():
+    stages = bench_preprocessing(synthetic_images(4, size=(64, 64)), repeats=2)
+    assert set(stages) == {'decode', 'resize_normalize'}
+    assert stages['decode']['calls'] == 8
+
+
+def _run(decode_p50, forward_p50):
+    return {'runs': [{
+        'threads': {'intra_op': 2, 'inter_op': 1},
+        'stages': {'decode': {'p50_ms': decode_p50}, 'forward': {'8': {'p50_ms': forward_p50}}},
+    }]}
+
+
+def test_diff_matches_stages_and_batch_sizes():
+    rows = diff_results(_run(4.0, 20.0), _run(2.0, 25.0))
+    assert [(row['stage'], row['batch_size'], row['change_pct']) for row in rows] == [
+        ('decode', None, -50.0), ('forward', '8', 25.0)]
@@ -0,0 +1,167 @@
+import io
+import threading
+from datetime import date
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app import explanations
+from app.explanations import (EXPLANATION_DONE, EXPLANATION_FAILED, EXPLANATION_PENDING, EXPLANATION_UNAVAILABLE,
+                              ExplanationService, colorize, explanation_path, render_overlay)
+from app.models import User
+from app.operations import add_patient
+
+
+def _jpeg(size):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (40, 40, 40)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def test_explanation_is_stored_next_to_upload_per_model_version():
+    first = explanation_path('app/static/uploads/scan.jpg', 'ab' * 32, 'v1-0123456789abcdef')
+    second = explanation_path('app/static/uploads/scan.jpg', 'ab' * 32, 'v2-0123456789abcdef')
+    assert first.startswith('app/static/uploads/gradcam-abababab')
+    assert first != second
+    # Each explained class gets its own overlay
+    assert explanation_path('app/static/uploads/scan.jpg', 'ab' * 32, 'v1-0123456789abcdef', 2) != first
+
+
+def test_colorize_runs_from_blue_to_red():
+    cold, hot = colorize(np.array([0.0, 1.0]))
+    assert cold[2] > cold[0] and hot[0] > hot[2]
+
+
+def test_overlay_keeps_aspect_ratio_and_highlights_hot_region():
+    heatmap = np.zeros((7, 7))
+    heatmap[:, 4:] = 1.0
+    overlay = render_overlay(_jpeg((1200, 800)), heatmap, alpha=0.5, max_size=300)
+
+    assert overlay.size == (300, 200)
+    pixels = np.asarray(overlay, dtype=np.int16)
+    assert pixels[100, 280, 0] - pixels[100, 280, 2] > 50  # red where the heatmap is hot
+    assert pixels[100, 10, 2] > pixels[100, 10, 0]         # blue where it is cold
+
+
+class _FakeGradCam:
+    calls = 0
+    targets = []
+
+    def __init__(self, model):
+        if model == 'broken':
+            raise ValueError("Model has no Conv2D layer to explain")
+
+    def heatmap(self, array, target=None):
+        _FakeGradCam.calls += 1
+        _FakeGradCam.targets.append(target)
+        return np.ones((7, 7)), 0 if target is None else target
+
+
+@pytest.fixture
+def serving(monkeypatch):
+    """The served model, as seen by the explanation service; a backend without `model` is not Keras."""
+    model = SimpleNamespace(version='v1-0123456789abcdef', backend=SimpleNamespace(model='keras'))
+    monkeypatch.setattr('app.inference.get_serving_model', lambda: model)
+    monkeypatch.setattr(explanations, 'GradCam', _FakeGradCam)
+    monkeypatch.setattr(explanations, '_service', None)
+    return model
+
+
+@pytest.fixture
+def scan(tmp_path):
+    path = tmp_path / 'scan.jpg'
+    path.write_bytes(_jpeg((300, 200)))
+    return str(path)
+
+
+def _wait(service):
+    service._executor.submit(lambda: None).result()  # one worker: runs after the queued overlays
+
+
+def test_request_generates_overlay_once(app, serving, scan):
+    service = ExplanationService(app)
+    status, path = service.request(scan)
+    assert status == EXPLANATION_PENDING
+    _wait(service)
+
+    assert service.request(scan) == (EXPLANATION_DONE, path)
+    assert Image.open(path).size == (300, 200)
+    # Any worker serves the stored overlay, without recomputing it
+    calls = _FakeGradCam.calls
+    assert ExplanationService(app).request(scan) == (EXPLANATION_DONE, path)
+    assert _FakeGradCam.calls == calls
+
+
+def test_request_explains_the_recorded_class(app, serving, scan):
+    service = ExplanationService(app)
+    top = service.request(scan)[1]
+    _, path = service.request(scan, 'Meningioma')
+    _wait(service)
+
+    assert path != top
+    assert _FakeGradCam.targets[-2:] == [None, 1]
+    # An unknown category falls back to the top class
+    assert service.request(scan, 'Unknown') == (EXPLANATION_DONE, top)
+
+
+def test_request_reports_failures_and_forgets_the_oldest(app, serving, scan, tmp_path):
+    serving.backend.model = 'broken'
+    service = ExplanationService(app, max_failures=1)
+    assert service.request(scan)[0] == EXPLANATION_PENDING
+    _wait(service)
+    assert service.request(scan)[0] == EXPLANATION_FAILED
+
+    other = tmp_path / 'other.jpg'
+    other.write_bytes(_jpeg((200, 200)))
+    service.request(str(other))
+    _wait(service)
+    assert list(service._failures) == [service.request(str(other))[1]]
+
+
+def test_pending_overlays_are_bounded(app, serving, scan, tmp_path):
+    other = tmp_path / 'other.jpg'
+    other.write_bytes(_jpeg((200, 200)))
+    service = ExplanationService(app, max_pending=1)
+    busy = threading.Event()
+    service._executor.submit(busy.wait)
+
+    first = service.request(scan)
+    assert service.request(str(other))[0] == EXPLANATION_PENDING
+    assert service._pending == {first[1]}  # the second one was not queued
+    busy.set()
+    _wait(service)
+
+    assert service.request(scan) == (EXPLANATION_DONE, first[1])
+    assert service.request(str(other))[0] == EXPLANATION_PENDING  # queued now that there is room
+    _wait(service)
+    assert service.request(str(other))[0] == EXPLANATION_DONE
+
+
+def test_request_is_unavailable_without_keras(app, serving, scan):
+    serving.backend = SimpleNamespace()
+    assert ExplanationService(app).request(scan)[0] == EXPLANATION_UNAVAILABLE
+
+
+def test_explanation_endpoint(app, client, serving, scan):
+    patient = add_patient('P', 40, 'Male', 'Glioma', date(2024, 1, 1), scan, User.query.first().id)
+    url = f"/patients/{patient.id}/explanation"
+
+    response = client.get(url)
+    assert response.status_code == 202
+    assert response.get_json() == {'status': EXPLANATION_PENDING}
+    assert response.headers['Retry-After'] == '2'
+    _wait(explanations._service)
+
+    response = client.get(url)
+    assert response.status_code == 200 and response.mimetype == 'image/jpeg'
+    assert 'private' in response.headers['Cache-Control']
+    response.close()
+
+    serving.backend = SimpleNamespace()
+    serving.version = 'v2-0123456789abcdef'
+    assert client.get(url).status_code == 501
+
+    missing = add_patient('P', 40, 'Male', 'Glioma', date(2024, 1, 1), None, User.query.first().id)
+    assert client.get(f"/patients/{missing.id}/explanation").status_code == 404
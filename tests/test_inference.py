@@ -0,0 +1,72 @@
+import io
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app import backends, inference
+from app.inference import check_for_model_update, get_registry, get_serving_model, model_info
+
+
+class _StubBackend(backends.InferenceBackend):
+    name = 'stub'
+    loads = 0
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        _StubBackend.loads += 1
+        with open(self.model_path, 'rb') as f:
+            if f.read() != b'weights':
+                raise ValueError('corrupt artifact')
+
+    def predict(self, batch):
+        return np.tile(np.array([0.1, 0.1, 0.7, 0.1], dtype=np.float32), (len(batch), 1))
+
+
+@pytest.fixture
+def app_config(tmp_path, monkeypatch):
+    model_path = tmp_path / 'model.h5'
+    model_path.write_bytes(b'weights')
+    monkeypatch.setitem(backends.BACKENDS, 'stub', _StubBackend)
+    monkeypatch.setitem(backends.MODEL_PATH_KEYS, 'stub', 'MODEL_PATH')
+    for name in ('_serving', '_shadow', '_cache', '_failed_swap'):
+        monkeypatch.setattr(f"app.inference.{name}", None)
+    monkeypatch.setattr(_StubBackend, 'loads', 0)
+    return {'INFERENCE_BACKEND': 'stub', 'MODEL_PATH': str(model_path), 'INFERENCE_WARMUP': False,
+            'MODEL_REGISTRY_DIR': str(tmp_path / 'registry'), 'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+            'EXPLANATIONS_ENABLED': False, 'THUMBNAILS_AT_UPLOAD': False}
+
+
+def test_model_is_loaded_by_the_first_prediction(client):
+    # Creating the app (done by the fixture) leaves the runtime and model alone
+    assert not model_info()['loaded'] and _StubBackend.loads == 0
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (200, 200), (90, 90, 90)).save(buffer, 'JPEG')
+    response = client.post('/predict', data={'file': (io.BytesIO(buffer.getvalue()), 'scan.jpg'), 'name': 'Jane',
+                                             'age': '40', 'gender': 'Female', 'diagnosis_date': '2024-01-01'},
+                           content_type='multipart/form-data')
+
+    assert response.status_code == 200 and response.get_json()['prediction'] == 'No Tumor'
+    info = model_info()
+    assert info['loaded'] and info['backend'] == 'stub' and _StubBackend.loads == 1
+
+
+def test_corrupt_promoted_artifact_is_not_reloaded(app, tmp_path):
+    serving = get_serving_model()
+    corrupt = tmp_path / 'corrupt.h5'
+    corrupt.write_bytes(b'truncated')
+    registry = get_registry()
+    registry.promote(registry.register(str(corrupt), 'stub')['version'])
+
+    for _ in range(3):
+        check_for_model_update()
+        deadline = time.monotonic() + 5
+        while inference._swapping.is_set() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    # One failed load; the previous model keeps serving
+    assert _StubBackend.loads == 2
+    assert get_serving_model() is serving
+    assert model_info()['swap_error'] == 'corrupt artifact'
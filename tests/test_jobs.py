@@ -0,0 +1,74 @@
+import json
+from datetime import date
+
+import numpy as np
+import pytest
+
+from app.inference import CATEGORIES, prediction_result
+from app.jobs import JOB_DONE, JOB_FAILED, JOB_RUNNING, claim_next_job, enqueue_prediction, run_job
+from app.models import db, Patient, PredictionJob, User
+from app.stat_counters import PATIENTS, counter_value
+
+
+@pytest.fixture
+def app_config():
+    return {'EXPLANATIONS_ENABLED': False, 'THUMBNAILS_AT_UPLOAD': False}
+
+
+@pytest.fixture
+def job(app, monkeypatch):
+    probabilities = np.array([0.1, 0.1, 0.1, 0.7], dtype=np.float32)
+    monkeypatch.setattr('app.route.score_image', lambda path: prediction_result(probabilities, 'v1', 5.0))
+    enqueue_prediction(User.query.first().id, '/tmp/scan.jpg', 'Jane', 40, 'Female', date(2024, 1, 1))
+    return claim_next_job('worker-a', stale_after=60)
+
+
+def test_run_job_saves_the_record_with_the_result(job):
+    run_job(job)
+
+    assert job.status == JOB_DONE
+    patient = Patient.query.get(json.loads(job.result)['patient_id'])
+    assert (patient.name, patient.tumor_type, patient.model_version) == ('Jane', CATEGORIES[3], 'v1')
+    assert counter_value(PATIENTS) == 1
+
+
+def test_failed_job_leaves_no_record(job, monkeypatch):
+    def fail(tumor_type):
+        raise RuntimeError('treatment lookup failed')
+
+    monkeypatch.setattr('app.operations.get_treatment_data', fail)
+    run_job(job)
+
+    # The record was only flushed, so it went with the rollback
+    assert job.status == JOB_FAILED and job.error == 'treatment lookup failed'
+    assert Patient.query.count() == 0
+    assert counter_value(PATIENTS) == 0
+
+
+def test_reclaimed_job_is_finished_only_by_its_new_worker(job, monkeypatch):
+    probabilities = np.array([0.7, 0.1, 0.1, 0.1], dtype=np.float32)
+
+    def slow_score(path):
+        # Another worker takes the job over while this run is still scoring
+        PredictionJob.query.filter_by(id=job.id).update({'worker': 'worker-b', 'claim': 'b' * 32})
+        db.session.commit()
+        return prediction_result(probabilities, 'v1', 5.0)
+
+    monkeypatch.setattr('app.route.score_image', slow_score)
+    run_job(job)
+
+    assert (job.status, job.worker) == (JOB_RUNNING, 'worker-b')
+    assert Patient.query.count() == 0
+    assert counter_value(PATIENTS) == 0
+
+
+def test_long_worker_names_still_finish_their_jobs(app, monkeypatch):
+    probabilities = np.array([0.1, 0.1, 0.1, 0.7], dtype=np.float32)
+    monkeypatch.setattr('app.route.score_image', lambda path: prediction_result(probabilities, 'v1', 5.0))
+    enqueue_prediction(User.query.first().id, '/tmp/scan.jpg', 'Jane', 40, 'Female', date(2024, 1, 1))
+    # e.g. a 63-character pod name followed by :pid:thread
+    job = claim_next_job(f"{'pod' * 21}:123456:0", stale_after=60)
+    assert len(job.claim) == 32
+
+    run_job(job)
+    assert job.status == JOB_DONE and Patient.query.count() == 1
@@ -0,0 +1,42 @@
+import pytest
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from flask_migrate import downgrade, upgrade
+
+from app import create_app
+from app.models import db
+from app.query_plans import explain_hot_queries
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app('testing')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'migrations.db'}"
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+
+def test_migrations_build_the_model_schema(app):
+    # The baseline is the schema from before migrations; everything added since is a later revision
+    upgrade(revision='0001')
+    assert set(db.inspect(db.engine).get_table_names()) == {'alembic_version', 'admin', 'patient', 'treatment',
+                                                             'user', 'user_login'}
+
+    upgrade()
+    with db.engine.connect() as connection:
+        assert compare_metadata(MigrationContext.configure(connection), db.metadata) == []
+
+    downgrade(revision='base')
+    assert db.inspect(db.engine).get_table_names() == ['alembic_version']
+
+
+def test_hot_queries_use_their_indexes(app):
+    upgrade()
+    report = explain_hot_queries()
+    assert report['passed'], report
+
+    # Without the hot-path migration the treatment lookup and login log fall back to scans
+    downgrade(revision='0006')
+    failed = {entry['query'] for entry in explain_hot_queries()['queries'] if not entry['passed']}
+    assert failed == {'treatment_by_tumor_type', 'recent_logins', 'login_rollup_days'}
@@ -0,0 +1,35 @@
+from datetime import date
+
+import pytest
+
+from app.inference import CATEGORIES
+from app.models import User
+from app.operations import add_patient, generate_patient_statistics
+
+
+def test_prediction_result_keeps_full_output(make_prediction):
+    result = make_prediction('Pituitary', 0.7, 'abc', 3.14159)
+    assert (result.category, result.confidence, result.model_version, result.inference_ms) == \
+        ('Pituitary', 70.0, 'abc', 3.14)
+    assert set(result.probabilities) == set(CATEGORIES)
+    assert sum(result.probabilities.values()) == pytest.approx(1.0)
+
+
+def test_statistics_filter_and_aggregate_stored_predictions(app, make_prediction):
+    user_id = User.query.first().id
+    for category, probability, version, day in [('Glioma', 0.9, 'v1', 1), ('Glioma', 0.5, 'v2', 2),
+                                                ('No Tumor', 0.8, 'v2', 3)]:
+        result = make_prediction(category, probability, version)
+        add_patient('P', 40, 'Male', category, date(2024, 1, day), f"/tmp/{day}.jpg", user_id, result)
+    add_patient('Manual', 40, 'Male', 'Glioma', date(2024, 1, 4), '/tmp/4.jpg', user_id)
+
+    stats = generate_patient_statistics()
+    assert stats['total_patients'] == 4 and stats['unscored_patients'] == 1
+    assert stats['by_model_version'] == {'v1': 1, 'v2': 2, 'unknown': 1}
+    assert stats['by_tumor_type']['Glioma'] == {'count': 3, 'mean_confidence': 70.0, 'min_confidence': 50.0,
+                                                'mean_inference_ms': 12.0}
+
+    assert generate_patient_statistics(model_version='v2')['tumor_type_distribution'] == {'Glioma': 1, 'No Tumor': 1}
+    uncertain = generate_patient_statistics(max_confidence=60)
+    assert uncertain['total_patients'] == 1 and uncertain['by_model_version'] == {'v2': 1}
+    assert generate_patient_statistics(date_from=date(2024, 1, 3))['total_patients'] == 2
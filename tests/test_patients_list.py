@@ -0,0 +1,88 @@
+from contextlib import contextmanager
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+
+from app.models import db, Patient, User
+from app.operations import add_user, get_patients_page
+
+
+@pytest.fixture
+def app_config():
+    return {'PATIENTS_PAGE_SIZE': 4}
+
+
+@pytest.fixture(autouse=True)
+def patients(app):
+    users = [User.query.first()] + [add_user(f"doctor{i}", f"doctor{i}@test.com", 'password123') for i in (1, 2)]
+    # Several patients per diagnosis date, so pages split inside a date
+    db.session.add_all([
+        Patient(name=f"P{i}", age=30 + i, gender='Female', tumor_type='Glioma',
+                diagnosis_date=date(2024, 1, 1 + i // 3), image_path=f"/tmp/{i}.jpg",
+                user_id=users[i % 3].id)
+        for i in range(10)
+    ])
+    db.session.commit()
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def _assert_single_page_query(statements):
+    # One SELECT for the page, whatever the number of rows and users; at most Flask-Login's
+    # lookup of the current user besides it
+    assert len([s for s in statements if 'FROM patient' in s]) == 1
+    assert len(statements) <= 2
+
+
+def _expected_order():
+    return [p.id for p in Patient.query.order_by(Patient.diagnosis_date.desc(), Patient.id.desc())]
+
+
+def test_keyset_pages_cover_every_patient_once(app):
+    seen, cursor = [], None
+    while True:
+        rows, cursor = get_patients_page(cursor, limit=4)
+        seen.extend(row.id for row in rows)
+        if cursor is None:
+            break
+    assert seen == _expected_order()
+    with pytest.raises(ValueError):
+        get_patients_page('not-a-cursor')
+
+
+def test_json_pages_use_one_query_each(app, client):
+    seen, cursor = [], None
+    for _ in range(3):
+        with count_queries() as statements:
+            response = client.get('/patients/page', query_string={'after': cursor} if cursor else {})
+        assert response.status_code == 200
+        _assert_single_page_query(statements)
+        data = response.get_json()
+        assert all(row['username'].startswith('doctor') and row['thumb_url'] for row in data['patients'])
+        seen.extend(row['id'] for row in data['patients'])
+        cursor = data['next']
+    assert cursor is None and seen == _expected_order()
+    assert client.get('/patients/page?after=garbage').status_code == 400
+
+
+def test_html_page_renders_usernames_without_lazy_loads(app, client):
+    with count_queries() as statements:
+        response = client.get('/patients')
+    assert response.status_code == 200
+    _assert_single_page_query(statements)
+    html = response.get_data(as_text=True)
+    assert html.count('<tr>') == 1 + 4  # header + one page
+    assert 'doctor1' in html and 'Load more' in html
@@ -0,0 +1,117 @@
+import io
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from PIL import Image
+from sqlalchemy import event
+
+from app.inference import CATEGORIES
+from app.models import db, Patient, StoredFile
+from app.prediction_cache import PredictionCache
+from app.stat_counters import PATIENTS, counter_value
+
+FORM = {'name': 'Jane', 'age': '40', 'gender': 'Female', 'diagnosis_date': '2024-01-01'}
+
+
+class _StubBackend:
+    """Predicts the class from the brightness of the slice: black is Glioma, white is Pituitary."""
+    name = 'stub'
+    model_path = 'stub.h5'
+
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, batch):
+        self.batches.append(len(batch))
+        classes = np.rint(batch.reshape(len(batch), -1).mean(axis=1) * 3).astype(int)
+        return np.eye(len(CATEGORIES), dtype=np.float32)[classes]
+
+
+@pytest.fixture
+def app_config(tmp_path):
+    return {'UPLOAD_FOLDER': str(tmp_path / 'uploads'), 'EXPLANATIONS_ENABLED': False, 'THUMBNAILS_AT_UPLOAD': False}
+
+
+@pytest.fixture
+def backend(app, monkeypatch):
+    backend = _StubBackend()
+    monkeypatch.setattr('app.route.get_serving_model', lambda: SimpleNamespace(version='stub-v1', backend=backend))
+    monkeypatch.setattr('app.inference._cache', PredictionCache())
+    return backend
+
+
+def _jpeg(gray):
+    buffer = io.BytesIO()
+    Image.new('RGB', (200, 200), (gray, gray, gray)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def _truncated(data):
+    return data[:len(data) // 2]  # the header still passes the upload checks; decoding fails
+
+
+def _post(client, *images):
+    data = dict(FORM, files=[(io.BytesIO(content), name) for name, content in images])
+    return client.post('/predict/batch', data=data, content_type='multipart/form-data')
+
+
+def test_batch_scores_decodable_slices_in_one_pass(client, backend):
+    truncated = _truncated(_jpeg(128))
+    transactions = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('INSERT INTO patient'):
+            transactions.append(id(conn.get_transaction()))
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = _post(client, ('black.jpg', _jpeg(0)), ('broken.jpg', truncated), ('white.jpg', _jpeg(255)))
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+    assert response.status_code == 200
+    black, broken, white = response.get_json()['results']
+    assert (black['filename'], black['prediction']) == ('black.jpg', 'Glioma')
+    assert (white['filename'], white['prediction']) == ('white.jpg', 'Pituitary')
+    assert broken == {'filename': 'broken.jpg', 'error': 'Could not decode image.'}
+    assert backend.batches == [2]
+
+    patients = {patient.id: patient for patient in Patient.query}
+    assert sorted(patients) == sorted([black['patient_id'], white['patient_id']])
+    assert patients[white['patient_id']].model_version == 'stub-v1'
+    assert len(transactions) == 2 and len(set(transactions)) == 1  # both rows in one transaction
+    assert counter_value(PATIENTS) == 2
+    assert StoredFile.query.count() == 2
+
+
+def test_batch_answers_repeated_slices_from_the_cache(client, backend):
+    first = _post(client, ('black.jpg', _jpeg(0)), ('white.jpg', _jpeg(255))).get_json()['results']
+    second = _post(client, ('white.jpg', _jpeg(255)), ('gray.jpg', _jpeg(85)), ('black.jpg', _jpeg(0)))
+
+    assert second.status_code == 200
+    white, gray, black = second.get_json()['results']
+    assert backend.batches == [2, 1]  # only the new slice reached the model
+    assert (white['prediction'], gray['prediction'], black['prediction']) == ('Pituitary', 'Meningioma', 'Glioma')
+    assert white['probabilities'] == first[1]['probabilities']
+    assert len({white['patient_id'], gray['patient_id'], black['patient_id']}) == 3
+    assert Patient.query.count() == 5
+
+
+def test_batch_without_decodable_slices_is_rejected(client, backend):
+    response = _post(client, ('broken.jpg', _truncated(_jpeg(0))))
+
+    assert response.status_code == 400
+    assert response.get_json()['results'] == [{'filename': 'broken.jpg', 'error': 'Could not decode image.'}]
+    assert backend.batches == [] and Patient.query.count() == 0
+
+
+def test_batch_files_are_tracked_when_saving_fails(client, backend, monkeypatch):
+    def fail(records):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr('app.route.add_patients', fail)
+    response = _post(client, ('black.jpg', _jpeg(0)), ('white.jpg', _jpeg(255)))
+
+    assert response.status_code == 500
+    assert sorted(stored.ref_count for stored in StoredFile.query) == [0, 0]  # left to `flask storage gc`
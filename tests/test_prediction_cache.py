@@ -0,0 +1,50 @@
+import numpy as np
+
+from app.prediction_cache import PredictionCache, image_digest, model_version
+
+
+def test_lru_evicts_least_recently_used():
+    cache = PredictionCache(max_entries=2)
+    cache.put('a', 'v1', [1, 0, 0, 0])
+    cache.put('b', 'v1', [0, 1, 0, 0])
+    assert cache.get('a', 'v1') is not None  # 'a' is now most recently used
+    cache.put('c', 'v1', [0, 0, 1, 0])
+
+    assert cache.get('b', 'v1') is None
+    assert cache.get('a', 'v1') is not None
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['memory_hits'] == 2
+    assert stats['misses'] == 1
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    PredictionCache(disk_dir=str(tmp_path)).put('abc', 'v1', [0.1, 0.2, 0.3, 0.4])
+
+    cache = PredictionCache(disk_dir=str(tmp_path))
+    np.testing.assert_allclose(cache.get('abc', 'v1'), [0.1, 0.2, 0.3, 0.4], rtol=1e-6)
+    assert cache.stats()['disk_hits'] == 1
+    assert cache.get('abc', 'v2') is None  # another model version never sees it
+
+
+def test_model_version_follows_file_content(tmp_path):
+    first = tmp_path / 'first.h5'
+    second = tmp_path / 'second.h5'
+    first.write_bytes(b'weights-1')
+    second.write_bytes(b'weights-2')
+
+    assert model_version(str(first)) != model_version(str(second))
+    assert model_version(str(first)) == model_version(str(first))
+    assert image_digest(b'scan') == image_digest(b'scan')
+
+
+def test_versions_share_the_memory_tier():
+    cache = PredictionCache(max_entries=2)
+    cache.put('a', 'v1', [1, 0, 0, 0])
+    cache.put('a', 'v2', [0, 1, 0, 0])  # hot-swap: both versions are still serving
+
+    assert cache.get('a', 'v1')[0] == 1
+    assert cache.get('a', 'v2')[1] == 1
+    cache.put('b', 'v2', [0, 0, 1, 0])
+    assert cache.get('a', 'v1') is None  # the least recently used entry went, not the whole tier
+    assert cache.stats()['evictions'] == 1
@@ -0,0 +1,34 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from app.preprocessing import compare_with_reference, decode_image, decode_into, new_batch, reference_decode
+
+
+def _scan(width, height, fmt='JPEG', mode='RGB'):
+    y, x = np.mgrid[0:height, 0:width]
+    disc = np.clip(1.0 - np.hypot(x - width * 0.45, y - height * 0.55) / (width * 0.3), 0, 1)
+    pixels = (disc * 180 + x / width * 60).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels, 'L').convert(mode).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def test_png_and_small_jpeg_match_reference_exactly():
+    for data in (_scan(640, 480, 'PNG'), _scan(200, 200)):
+        np.testing.assert_array_equal(decode_image(data), reference_decode(data))
+
+
+def test_large_jpeg_is_within_tolerance_of_reference():
+    report = compare_with_reference([_scan(1600, 1600), _scan(2048, 1536, mode='L')])
+    assert report['mean_abs_delta'] < 0.01
+    assert report['p99_abs_delta'] < 0.05
+
+
+def test_decode_into_fills_batch_rows_in_place():
+    batch = new_batch(2)
+    row = decode_into(_scan(800, 600), batch[1])
+    assert np.shares_memory(row, batch)
+    assert batch.dtype == np.float32 and batch.shape == (2, 150, 150, 3)
+    assert 0.0 <= batch[1].min() and batch[1].max() <= 1.0
@@ -0,0 +1,33 @@
+from app.quantization import DATASET_CLASSES, accuracy_gate, labelled_images
+
+
+def _accuracy(overall, **per_class):
+    return {'overall': overall, 'per_class': {name: per_class.get(name) for name in DATASET_CLASSES}}
+
+
+def test_gate_rejects_a_single_class_regression():
+    float_acc = _accuracy(0.90, glioma=0.90, meningioma=0.80, notumor=1.0, pituitary=0.90)
+    quant_acc = _accuracy(0.895, glioma=0.85, meningioma=0.82, notumor=1.0, pituitary=0.91)
+
+    gate = accuracy_gate(float_acc, quant_acc, max_drop=0.02)
+    assert not gate['passed']  # overall is fine, but glioma dropped 5 points
+    assert round(gate['per_class_delta']['glioma'], 2) == -0.05
+
+
+def test_gate_accepts_small_drops():
+    float_acc = _accuracy(0.90, glioma=0.90, meningioma=0.80, notumor=1.0, pituitary=0.90)
+    quant_acc = _accuracy(0.895, glioma=0.89, meningioma=0.80, notumor=0.99, pituitary=0.90)
+    assert accuracy_gate(float_acc, quant_acc, max_drop=0.02)['passed']
+
+
+def test_labelled_images_follow_notebook_layout(tmp_path):
+    for name in DATASET_CLASSES:
+        (tmp_path / name).mkdir()
+        for i in range(2):
+            (tmp_path / name / f'{i}.jpg').write_bytes(b'')
+    (tmp_path / 'glioma' / 'notes.txt').write_text('ignored')
+
+    pairs = labelled_images(str(tmp_path))
+    assert len(pairs) == 8
+    assert [label for _, label in pairs[:4]] == [0, 1, 2, 3]  # classes interleaved for calibration
+    assert len(labelled_images(str(tmp_path), per_class_limit=1)) == 4
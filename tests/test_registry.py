@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from app import backends
+from app.registry import ModelRegistry, ShadowEvaluator
+
+
+class _ScaledBackend(backends.InferenceBackend):
+    name = 'scaled'
+
+    def predict(self, batch):
+        means = batch.reshape(len(batch), -1).mean(axis=1)
+        return np.stack([means, 1 - means, np.zeros_like(means), np.zeros_like(means)], axis=1)
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    monkeypatch.setitem(backends.BACKENDS, 'scaled', _ScaledBackend)
+    return ModelRegistry(str(tmp_path / 'registry'))
+
+
+def _artifact(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_register_and_promote(registry, tmp_path):
+    assert registry.active_version() is None and registry.versions() == []
+
+    metadata = registry.register(_artifact(tmp_path, 'brains.h5', b'weights'), 'scaled', notes='retrain')
+    version = metadata['version']
+    assert registry.get(version)['notes'] == 'retrain'
+    assert open(registry.artifact_path(version), 'rb').read() == b'weights'
+
+    registry.set_shadow(version)
+    registry.promote(version)
+    assert registry.active_version() == version
+    assert registry.shadow_version() is None  # a promoted candidate is no longer shadowed
+
+    with pytest.raises(ValueError):
+        registry.promote('missing')
+
+
+def test_shadow_evaluator_records_agreement(registry, tmp_path):
+    version = registry.register(_artifact(tmp_path, 'candidate.h5', b'candidate'), 'scaled')['version']
+    evaluator = ShadowEvaluator(registry, version, sample_rate=1.0)
+
+    batch = np.full((2, 150, 150, 3), 0.8, dtype=np.float32)
+    agreeing = np.array([[0.9, 0.1, 0, 0], [0.1, 0.9, 0, 0]], dtype=np.float32)
+    evaluator.observe(batch, agreeing, primary_ms=12.0)
+    evaluator.close()
+
+    stats = registry.shadow_stats(version)
+    assert stats['samples'] == 2 and stats['workers'] == 1
+    assert stats['agreement_rate'] == 0.5
+    assert stats['latency_ms']['primary']['p50'] == 12.0
+
+
+def test_shadow_evaluator_stops_after_a_failed_load(registry, tmp_path, monkeypatch, capsys):
+    loads = []
+
+    class _BrokenBackend(backends.InferenceBackend):
+        def __init__(self, *args):
+            loads.append(args)
+            raise OSError('corrupt artifact')
+
+    monkeypatch.setitem(backends.BACKENDS, 'broken', _BrokenBackend)
+    version = registry.register(_artifact(tmp_path, 'candidate.h5', b'candidate'), 'broken')['version']
+    evaluator = ShadowEvaluator(registry, version, sample_rate=1.0)
+
+    batch = np.zeros((1, 150, 150, 3), dtype=np.float32)
+    probabilities = np.array([[1, 0, 0, 0]], dtype=np.float32)
+    for _ in range(3):
+        evaluator.observe(batch, probabilities, primary_ms=1.0)
+    evaluator.close()
+
+    assert len(loads) == 1
+    assert evaluator.error == 'corrupt artifact'
+    assert 'corrupt artifact' in capsys.readouterr().out
+    assert registry.shadow_stats(version)['samples'] == 0
@@ -0,0 +1,82 @@
+import io
+import json
+from datetime import date
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.inference import CATEGORIES
+from app.models import db, Patient, User
+from app.operations import add_patient, generate_patient_statistics
+from app.rescoring import rescore_patients
+
+
+def _scan(tmp_path, name, brightness):
+    path = tmp_path / f"{name}.jpg"
+    out = io.BytesIO()
+    Image.new('RGB', (200, 200), (brightness,) * 3).save(out, 'JPEG')
+    path.write_bytes(out.getvalue())
+    return str(path)
+
+
+def _brightness_model(batch):
+    """Fake model: bright scans are 'Glioma', dark ones 'No Tumor'."""
+    bright = (batch.mean(axis=(1, 2, 3)) > 0.5).astype(np.float32)
+    probabilities = np.full((len(batch), len(CATEGORIES)), 0.05, dtype=np.float32)
+    probabilities[:, CATEGORIES.index('Glioma')] += 0.85 * bright
+    probabilities[:, CATEGORIES.index('No Tumor')] += 0.85 * (1 - bright)
+    return probabilities
+
+
+def _patients(tmp_path, brightness_and_labels):
+    user_id = User.query.first().id
+    return [add_patient(f"P{i}", 40, 'Female', label, date(2024, 1, 1),
+                        _scan(tmp_path, f"p{i}", brightness) if brightness is not None else str(tmp_path / 'gone.jpg'),
+                        user_id).id
+            for i, (brightness, label) in enumerate(brightness_and_labels)]
+
+
+def test_rescore_updates_changed_predictions(app, tmp_path):
+    ids = _patients(tmp_path, [(230, 'Glioma'), (230, 'No Tumor'), (20, 'Glioma'), (20, 'No Tumor'), (None, 'Glioma')])
+    report = rescore_patients(_brightness_model, 'v2', chunk_size=2, batch_size=2, workers=1)
+
+    assert (report['rows'], report['scored'], report['failed'], report['changed']) == (5, 4, 1, 2)
+    assert report['transitions'] == {'Glioma -> Glioma': 1, 'No Tumor -> Glioma': 1,
+                                     'Glioma -> No Tumor': 1, 'No Tumor -> No Tumor': 1}
+    assert {change['id'] for change in report['changes']} == {ids[1], ids[2]}
+    assert report['errors'] == [{'id': ids[4], 'error': 'missing'}]
+    assert report['throughput']['images'] == 4
+    db.session.expire_all()
+    assert [Patient.query.get(i).tumor_type for i in ids] == ['Glioma', 'Glioma', 'No Tumor', 'No Tumor', 'Glioma']
+    details = Patient.query.get(ids[1]).prediction_details()
+    assert details['model_version'] == 'v2' and details['confidence'] == 90.0
+    assert details['probabilities']['Glioma'] == pytest.approx(0.9)
+    assert Patient.query.get(ids[4]).model_version is None  # missing scan: untouched
+    # Counter-backed statistics moved with the rescored records
+    assert generate_patient_statistics() == generate_patient_statistics(date_from=date(2000, 1, 1))
+
+
+def test_dry_run_writes_nothing(app, tmp_path):
+    ids = _patients(tmp_path, [(230, 'No Tumor')])
+    checkpoint = tmp_path / 'progress.json'
+    report = rescore_patients(_brightness_model, 'v2', workers=1, checkpoint_path=str(checkpoint), dry_run=True)
+    assert report['changed'] == 1 and not checkpoint.exists()
+    db.session.expire_all()
+    assert Patient.query.get(ids[0]).tumor_type == 'No Tumor'
+
+
+def test_interrupted_run_resumes_from_checkpoint(app, tmp_path):
+    ids = _patients(tmp_path, [(230, 'No Tumor')] * 5)
+    checkpoint = tmp_path / 'progress.json'
+
+    first = rescore_patients(_brightness_model, 'v2', chunk_size=2, workers=1, checkpoint_path=str(checkpoint),
+                             limit=3)
+    assert first['rows'] == 3 and json.loads(checkpoint.read_text())['last_id'] == ids[2]
+
+    second = rescore_patients(_brightness_model, 'v2', chunk_size=2, workers=1, checkpoint_path=str(checkpoint))
+    assert second['resumed_from'] == ids[2]
+    assert (second['rows'], second['changed'], second['throughput']['images']) == (5, 5, 2)
+
+    with pytest.raises(ValueError):
+        rescore_patients(_brightness_model, 'v3', workers=1, checkpoint_path=str(checkpoint))
@@ -2,6 +2,7 @@ import unittest
 from flask_testing import TestCase
 from flask import url_for
 import io
+import shutil
 from datetime import datetime
 import os
 
@@ -62,11 +63,14 @@ class TestRoutes(TestCase):
             db.session.remove()
             db.drop_all()
             
-        # Clean up test upload directories
-        for filename in os.listdir(self.app.config['UPLOAD_FOLDER']):
-            os.remove(os.path.join(self.app.config['UPLOAD_FOLDER'], filename))
-        for filename in os.listdir(self.app.config['UPLOAD_FOLDERS']):
-            os.remove(os.path.join(self.app.config['UPLOAD_FOLDERS'], filename))
+        # Clean up test upload directories (uploads are stored in shard sub-directories)
+        for folder in (self.app.config['UPLOAD_FOLDER'], self.app.config['UPLOAD_FOLDERS']):
+            for filename in os.listdir(folder):
+                path = os.path.join(folder, filename)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
 
     def test_home_route(self):
         with self.app.app_context():
@@ -0,0 +1,42 @@
+import os
+import threading
+
+from app.runtime import claim_worker_slot, parse_cpu_list, pin_process, worker_cores
+
+
+def test_parse_cpu_list():
+    assert parse_cpu_list('0-3,8, 10-11') == [0, 1, 2, 3, 8, 10, 11]
+    assert parse_cpu_list('') == []
+
+
+def test_worker_cores_split_evenly_without_overlap():
+    cores = list(range(10))
+    slices = [worker_cores(cores, 3, index) for index in range(3)]
+    assert slices == [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    assert worker_cores(cores, 1, 0) == cores
+
+
+def test_more_workers_than_cores_share_round_robin():
+    assert [worker_cores([0, 1], 4, index) for index in range(4)] == [[0], [1], [0], [1]]
+
+
+def test_worker_slots_are_exclusive(tmp_path):
+    assert claim_worker_slot(2, str(tmp_path)) == 0
+    assert claim_worker_slot(2, str(tmp_path)) == 1
+    assert claim_worker_slot(2, str(tmp_path)) is None
+
+
+def test_pinning_covers_threads_already_running(monkeypatch):
+    pinned = {}
+    monkeypatch.setattr(os, 'sched_setaffinity', lambda tid, cores: pinned.setdefault(tid, cores), raising=False)
+    started, stop = threading.Event(), threading.Event()
+    thread = threading.Thread(target=lambda: (started.set(), stop.wait()))
+    thread.start()
+    started.wait()
+    try:
+        pin_process([0])
+    finally:
+        stop.set()
+        thread.join()
+
+    assert pinned[thread.native_id] == [0] and pinned[threading.get_native_id()] == [0]
@@ -0,0 +1,112 @@
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import event
+
+from app.jobs import enqueue_prediction
+from app.models import db, Patient, PredictionJob, RollupStaleDay, StatCounter, StoredFile, User, UserLogin, VolumeStudy
+from app.operations import (add_patient, add_patients, add_user, add_volume_study, delete_patient_record,
+                            generate_patient_statistics)
+from app.stat_counters import PATIENTS, USERS, counter_value, read_counters, reconcile_counters
+from app.storage import BlobStore
+
+
+def _records(user_id, make_prediction):
+    patients = [add_patient('P', 40, 'Male', category, date(2024, 1, 1), f"/tmp/{i}.jpg", user_id,
+                            make_prediction(category, probability, version, 10.0))
+                for i, (category, probability, version) in enumerate([('Glioma', 0.9, 'v1'), ('Glioma', 0.6, 'v2'),
+                                                                      ('Pituitary', 0.7, 'v2')])]
+    patients += add_patients([
+        {'name': 'Batch', 'age': 50, 'gender': 'Female', 'prediction': 'No Tumor', 'diagnosis_date': date(2024, 2, 1),
+         'filepath': '/tmp/b.jpg', 'user_id': user_id, 'result': make_prediction('No Tumor', 0.8, 'v2', 4.0)},
+        {'name': 'Manual', 'age': 50, 'gender': 'Female', 'prediction': 'Glioma', 'diagnosis_date': date(2024, 2, 1),
+         'filepath': '/tmp/m.jpg', 'user_id': user_id},
+    ])
+    return patients
+
+
+def test_counters_follow_every_write(app, make_prediction):
+    user_id = User.query.first().id
+    add_user('nurse', 'nurse@test.com', 'password123')
+    patients = _records(user_id, make_prediction)
+    assert delete_patient_record(patients[0].id, user_id)
+
+    counted = generate_patient_statistics()
+    # Any filter takes the aggregating path; this one matches every record
+    assert counted == generate_patient_statistics(date_from=date(2000, 1, 1))
+    assert counted['total_patients'] == 4 and counted['unscored_patients'] == 1
+    assert counted['by_tumor_type']['Glioma'] == {'count': 2, 'mean_confidence': 60.0, 'min_confidence': 60.0,
+                                                  'mean_inference_ms': 10.0}
+    assert counter_value(USERS) == 2
+    assert reconcile_counters(dry_run=True)['drifted'] == {}
+
+
+def test_unfiltered_statistics_do_not_scan_patients(app, make_prediction):
+    _records(User.query.first().id, make_prediction)
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        generate_patient_statistics()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert not any('FROM patient' in statement for statement in statements)  # counter rows only
+
+
+def test_min_confidence_follows_deletes(app, make_prediction):
+    user_id = User.query.first().id
+    patients = _records(user_id, make_prediction)
+    assert generate_patient_statistics()['by_tumor_type']['Glioma']['min_confidence'] == 60.0
+
+    assert delete_patient_record(patients[1].id, user_id)  # the 60% Glioma
+    assert generate_patient_statistics()['by_tumor_type']['Glioma']['min_confidence'] == 90.0
+    assert delete_patient_record(patients[0].id, user_id)  # only the unscored one is left
+    assert generate_patient_statistics()['by_tumor_type']['Glioma']['min_confidence'] is None
+    assert reconcile_counters(dry_run=True)['drifted'] == {}
+
+
+def test_reconcile_repairs_drift(app, make_prediction):
+    _records(User.query.first().id, make_prediction)
+    StatCounter.query.filter_by(name=PATIENTS).update({'count': 42})
+    StatCounter.query.filter_by(name='confidence:Glioma').delete()
+    db.session.commit()
+
+    report = reconcile_counters(dry_run=True)
+    assert set(report['drifted']) == {PATIENTS, 'confidence:Glioma'} and not report['repaired']
+    assert read_counters()[PATIENTS].count == 42
+
+    report = reconcile_counters()
+    assert report['drifted'][PATIENTS] == {'stored': [42, 0.0], 'actual': [5, 0.0]} and report['repaired']
+    assert read_counters()['confidence:Glioma'] == (2, pytest.approx(150.0))
+    assert reconcile_counters(dry_run=True)['drifted'] == {}
+
+
+def test_deleting_a_user_takes_their_records(app, admin_client, tmp_path, make_prediction):
+    keep = User.query.first()
+    user = add_user('nurse', 'nurse@test.com', 'password123')
+    store = BlobStore(str(tmp_path))
+    scan, volume = store.put(b'scan' * 16, 'scan.jpg'), store.put(b'volume' * 16, 'scan.nii')
+    _records(keep.id, make_prediction)
+    add_patient('P', 40, 'Male', 'Glioma', date(2024, 3, 1), scan, user.id, make_prediction('Glioma', 0.9, 'v2'))
+    study = {'prediction': 'Pituitary', 'probabilities': {'Pituitary': 0.7}, 'confidence': 70.0, 'key_slice': 0}
+    add_volume_study('V', 50, 'Female', date(2024, 3, 2), user.id, scan, volume,
+                     {'study': study, 'modality': 'nifti', 'slices': 1, 'scored_slices': 1, 'slice_predictions': []})
+    enqueue_prediction(user.id, scan, 'J', 30, 'Male', date(2024, 3, 3))
+    db.session.add(UserLogin(user_id=user.id, timestamp=datetime(2024, 3, 4, 9), success=True))
+    db.session.commit()
+    RollupStaleDay.query.delete()
+    db.session.commit()
+
+    response = admin_client.post(f"/admin/user/{user.id}/delete")
+    assert response.status_code == 302
+    assert User.query.get(user.id) is None
+    assert Patient.query.filter_by(user_id=user.id).count() == 0
+    assert VolumeStudy.query.count() == PredictionJob.query.count() == UserLogin.query.count() == 0
+    assert StoredFile.query.get(scan).ref_count == 0 and StoredFile.query.get(volume).ref_count == 0
+    assert sorted((row.rollup, row.day) for row in RollupStaleDay.query) == [
+        ('logins', date(2024, 3, 4)), ('predictions', date(2024, 3, 1)), ('predictions', date(2024, 3, 2))]
+    assert counter_value(USERS) == 1 and counter_value(PATIENTS) == 5
+    assert reconcile_counters(dry_run=True)['drifted'] == {}
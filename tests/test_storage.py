@@ -0,0 +1,117 @@
+import io
+import os
+from datetime import date
+
+import pytest
+from PIL import Image
+
+from app.models import db, Patient, StoredFile, User
+from app.operations import add_patient, add_patients, delete_patient_record
+from app.storage import BlobStore, collect_garbage, migrate_uploads, stored_digest, track_files
+
+JPEG = b'\xff\xd8\xff\xe0' + b'scan' * 16
+PNG = b'\x89PNG\r\n\x1a\n' + b'other' * 16
+
+
+@pytest.fixture
+def app_config(tmp_path):
+    return {'UPLOAD_FOLDER': str(tmp_path / 'uploads'), 'UPLOAD_FOLDERS': str(tmp_path / 'profiles')}
+
+
+def _patient(filepath, name='Jane'):
+    return add_patient(name, 40, 'Female', 'glioma', date(2024, 1, 1), filepath, User.query.first().id)
+
+
+def test_put_is_content_addressed_and_sharded(tmp_path):
+    store = BlobStore(str(tmp_path))
+    first = store.put(JPEG, 'scan.JPEG')
+    digest = stored_digest(first)
+
+    assert first == os.path.join(str(tmp_path), digest[:2], digest[2:4], digest + '.jpg')
+    assert store.put(JPEG, 'renamed.jpg') == first  # same bytes, one file
+    assert store.put(PNG, 'scan.jpg') != first
+    assert open(first, 'rb').read() == JPEG
+    assert [name for name in os.listdir(os.path.dirname(first)) if name.endswith('.tmp')] == []
+
+    assert store.file_path(store.url_path(first, 'profiles'), 'profiles') == first
+
+
+def test_reference_counts_follow_patient_rows(app):
+    path = BlobStore(app.config['UPLOAD_FOLDER']).put(JPEG, 'scan.jpg')
+    first = _patient(path)
+    add_patients([dict(name=name, age=30, gender='Male', prediction='pituitary', diagnosis_date=date(2024, 1, 2),
+                       filepath=path, user_id=first.user_id) for name in ('A', 'B')])
+    assert StoredFile.query.get(path).ref_count == 3
+
+    assert delete_patient_record(first.id, first.user_id)
+    assert StoredFile.query.get(path).ref_count == 2
+
+    # Still referenced: never collected
+    assert collect_garbage(grace_seconds=0) == {'files': 0, 'bytes': 0}
+    for patient in Patient.query.all():
+        delete_patient_record(patient.id, patient.user_id)
+    assert StoredFile.query.get(path).ref_count == 0
+
+    assert collect_garbage(grace_seconds=3600)['files'] == 0  # within the grace period
+    assert collect_garbage(grace_seconds=0) == {'files': 1, 'bytes': len(JPEG)}
+    assert not os.path.exists(path)
+    assert StoredFile.query.count() == 0
+
+
+def test_tracked_files_are_collected_unless_referenced(app):
+    store = BlobStore(app.config['UPLOAD_FOLDER'])
+    kept, orphan = store.put(JPEG, 'scan.jpg'), store.put(PNG, 'failed.png')
+    track_files([kept, orphan])
+    db.session.commit()
+    _patient(kept)
+
+    assert StoredFile.query.get(kept).ref_count == 1
+    assert collect_garbage(grace_seconds=0) == {'files': 1, 'bytes': len(PNG)}
+    assert os.path.exists(kept) and not os.path.exists(orphan)
+
+
+def test_upload_of_failed_prediction_is_collected(app, client, monkeypatch):
+    def fail(data, digest=None):
+        raise RuntimeError("model unavailable")
+
+    monkeypatch.setattr('app.route.score_image_bytes', fail)
+    image = io.BytesIO()
+    Image.new('RGB', (64, 64)).save(image, 'JPEG')
+    image.seek(0)
+    client.post('/predict', data={'file': (image, 'scan.jpg'), 'name': 'Jane', 'age': '40', 'gender': 'Female',
+                                  'diagnosis_date': '2024-01-01'}, content_type='multipart/form-data')
+
+    stored = StoredFile.query.one()
+    assert stored.ref_count == 0 and Patient.query.count() == 0
+    assert collect_garbage(grace_seconds=0)['files'] == 1
+    assert not os.path.exists(stored.path)
+
+
+def test_migrate_rewrites_rows_and_deduplicates(app):
+    uploads, profiles = app.config['UPLOAD_FOLDER'], app.config['UPLOAD_FOLDERS']
+    os.makedirs(uploads)
+    os.makedirs(profiles)
+    for name, data in (('a.jpg', JPEG), ('copy.jpg', JPEG), ('b.png', PNG)):
+        with open(os.path.join(uploads, name), 'wb') as f:
+            f.write(data)
+    with open(os.path.join(profiles, 'me.jpg'), 'wb') as f:
+        f.write(JPEG)
+    for name in ('a.jpg', 'copy.jpg', 'a.jpg', 'b.png', 'gone.jpg'):
+        _patient(os.path.join(uploads, name))
+    User.query.first().profile_image = 'profiles/me.jpg'
+    db.session.commit()
+
+    report = migrate_uploads(BlobStore(uploads), BlobStore(profiles), batch_size=2, workers=2)
+    assert report['rows'] == 5 and report['missing'] == 1
+    assert report['stored_files'] == 3  # JPEG and PNG scans, JPEG profile image
+    assert report['legacy_files_removed'] == 4
+
+    paths = [patient.image_path for patient in Patient.query.order_by(Patient.id)]
+    assert len(set(paths[:3])) == 1 and stored_digest(paths[0])
+    assert paths[4].endswith('gone.jpg')
+    assert StoredFile.query.get(paths[0]).ref_count == 3
+    assert User.query.first().profile_image.startswith('profiles/')
+    assert stored_digest(User.query.first().profile_image)
+
+    # Nothing left to do on a second run
+    assert migrate_uploads(BlobStore(uploads), BlobStore(profiles))['rows'] == 0
@@ -0,0 +1,72 @@
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+from app import thumbnails
+from app.storage import BlobStore, stored_digest
+from app.thumbnails import (DERIVATIVE_SIZES, ensure_derivative, generate_derivatives, preferred_format,
+                            schedule_derivatives)
+
+
+def _jpeg(size=(1200, 900)):
+    out = io.BytesIO()
+    Image.new('RGB', size, (90, 40, 160)).save(out, 'JPEG')
+    return out.getvalue()
+
+
+@pytest.mark.parametrize('fmt', ['jpeg', 'webp'])
+def test_derivatives_are_downscaled_and_keyed_by_content(tmp_path, fmt):
+    if fmt == 'webp' and not thumbnails.WEBP_SUPPORTED:
+        pytest.skip('Pillow built without WebP')
+    source = BlobStore(str(tmp_path)).put(_jpeg(), 'scan.jpg')
+
+    paths = generate_derivatives(source, fmt=fmt)
+    assert len(paths) == len(DERIVATIVE_SIZES)
+    for path, (name, longest) in zip(paths, DERIVATIVE_SIZES.items()):
+        assert os.path.basename(path).startswith(f"{stored_digest(source)}-{name}")
+        with Image.open(path) as img:
+            assert max(img.size) == longest and img.format == thumbnails.FORMATS[fmt][0]
+
+    # Cached: a second request does not re-encode
+    mtime = os.path.getmtime(paths[0])
+    assert ensure_derivative(source, 'thumb', fmt) == paths[0]
+    assert os.path.getmtime(paths[0]) == mtime
+
+
+def test_legacy_upload_is_hashed(tmp_path):
+    source = tmp_path / 'scan.jpg'
+    source.write_bytes(_jpeg((300, 300)))
+    path = ensure_derivative(str(source), 'thumb', 'jpeg')
+    assert os.path.dirname(path) == str(tmp_path) and os.path.exists(path)
+
+
+def test_preferred_format(monkeypatch):
+    monkeypatch.setattr(thumbnails, 'WEBP_SUPPORTED', True)
+    assert preferred_format('image/avif,image/webp,*/*') == 'webp'
+    assert preferred_format('image/png,*/*') == 'jpeg'
+    monkeypatch.setattr(thumbnails, 'WEBP_SUPPORTED', False)
+    assert preferred_format('image/webp') == 'jpeg'
+
+
+def test_scheduled_uploads_are_bounded(app, monkeypatch):
+    app.config.update(THUMBNAILS_AT_UPLOAD=True, THUMBNAILS_MAX_PENDING=1)
+    busy, generated = threading.Event(), []
+
+    def generate(source_path):
+        busy.wait()
+        generated.append(source_path)
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(thumbnails, '_executor', executor)
+    monkeypatch.setattr(thumbnails, '_pending', 0)
+    monkeypatch.setattr(thumbnails, 'generate_derivatives', generate)
+    schedule_derivatives(app, 'first.jpg')
+    schedule_derivatives(app, 'second.jpg')  # skipped: generated on first request instead
+    busy.set()
+    executor.shutdown(wait=True)
+
+    assert generated == ['first.jpg'] and thumbnails._pending == 0
@@ -0,0 +1,67 @@
+import pytest
+from sqlalchemy import event
+
+from app.models import db, CacheVersion, Treatment
+from app.operations import add_treatment, get_treatment_data
+from app.treatment_catalog import TREATMENTS, get_treatment_catalog, read_cache_version
+
+
+@pytest.fixture
+def app_config():
+    return {'TREATMENT_CACHE_CHECK_INTERVAL': 60}
+
+
+@pytest.fixture(autouse=True)
+def glioma_treatment(app):
+    add_treatment('Glioma', 'Surgery', 'Temozolomide', '6 weeks', 'Fatigue')
+
+
+def test_catalog_is_loaded_once(app):
+    assert get_treatment_data('Glioma')['description'] == 'Surgery'
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        for _ in range(5):
+            assert get_treatment_data('Glioma')['recommended_medication'] == 'Temozolomide'
+        assert get_treatment_data('Pituitary') is None
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert statements == []
+
+
+def test_writes_invalidate_the_catalog(app):
+    assert get_treatment_data('Meningioma') is None
+    add_treatment('Meningioma', 'Observation', 'None', '1 year', 'None')
+    assert get_treatment_data('Meningioma')['description'] == 'Observation'
+    assert read_cache_version(TREATMENTS) == 2
+
+
+def test_write_from_another_worker_is_seen_after_the_check_interval(app):
+    catalog = get_treatment_catalog()
+    assert catalog.get('Glioma').data['duration'] == '6 weeks'
+
+    # Another worker changes the row and bumps the stamp; this one still serves its copy
+    Treatment.query.filter_by(tumor_type='Glioma').update({'duration': '8 weeks'})
+    CacheVersion.query.filter_by(name=TREATMENTS).update({'version': CacheVersion.version + 1})
+    db.session.commit()
+    assert catalog.get('Glioma').data['duration'] == '6 weeks'
+
+    catalog._next_check = 0.0
+    assert catalog.get('Glioma').data['duration'] == '8 weeks'
+
+
+def test_treatment_endpoint_supports_etags(client):
+    response = client.get('/treatments/Glioma')
+    assert response.status_code == 200
+    assert response.get_json()['tumor_type'] == 'Glioma'
+    etag = response.headers['ETag']
+    assert 'max-age=' in response.headers['Cache-Control']
+
+    cached = client.get('/treatments/Glioma', headers={'If-None-Match': etag})
+    assert cached.status_code == 304 and cached.data == b''
+
+    assert client.get('/treatments/Unknown').status_code == 404
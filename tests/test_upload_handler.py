@@ -0,0 +1,59 @@
+import hashlib
+import io
+
+import pytest
+from PIL import Image
+
+from app.uploads import UploadRejected, read_upload, sniff_format
+
+
+def _encode(size, fmt):
+    out = io.BytesIO()
+    Image.new('RGB', size, (30, 60, 90)).save(out, fmt)
+    return out.getvalue()
+
+
+class _CountingStream(io.BytesIO):
+    """Records how many bytes were read, to check that rejection happens early."""
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.consumed = getattr(self, 'consumed', 0) + len(chunk)
+        return chunk
+
+
+@pytest.mark.parametrize('fmt', ['JPEG', 'PNG'])
+def test_accepts_image_and_hashes_in_one_pass(fmt):
+    data = _encode((320, 200), fmt)
+    upload = read_upload(io.BytesIO(data), max_bytes=1 << 20, max_pixels=1 << 20, chunk_size=7)
+    assert upload.data == data
+    assert upload.digest == hashlib.sha256(data).hexdigest()
+    assert (upload.format, upload.width, upload.height) == (fmt, 320, 200)
+
+
+def test_rejects_non_images_by_content():
+    with pytest.raises(UploadRejected) as rejected:
+        read_upload(io.BytesIO(b'GIF89a' + b'\0' * 100), 1 << 20, 1 << 20)
+    assert rejected.value.status == 415
+    assert sniff_format(b'%PDF-1.7\n') is None
+    with pytest.raises(UploadRejected) as rejected:
+        read_upload(io.BytesIO(b''), 1 << 20, 1 << 20)
+    assert rejected.value.status == 400
+
+
+def test_rejects_oversized_files_while_reading():
+    stream = _CountingStream(_encode((64, 64), 'PNG') + b'\0' * 100000)
+    with pytest.raises(UploadRejected) as rejected:
+        read_upload(stream, max_bytes=4096, max_pixels=1 << 20, chunk_size=1024)
+    assert rejected.value.status == 413
+    assert stream.consumed <= 4096 + 1024
+
+
+def test_rejects_decompression_bombs_from_the_header():
+    # Compresses to a few KB but declares 4000 x 4000 pixels
+    data = _encode((4000, 4000), 'PNG')
+    stream = _CountingStream(data)
+    with pytest.raises(UploadRejected) as rejected:
+        read_upload(stream, max_bytes=len(data), max_pixels=1000 * 1000, chunk_size=256)
+    assert rejected.value.status == 413
+    assert stream.consumed <= 512
@@ -0,0 +1,171 @@
+import gzip
+import io
+import os
+import struct
+import tempfile
+
+import numpy as np
+import pytest
+
+from app.inference import CATEGORIES
+from app.models import StoredFile
+from app.storage import collect_garbage
+from app.volumes import (VolumeUnsupported, aggregate_slices, open_volume, predict_volume, read_nifti_header,
+                         render_slice, window_slice)
+
+NO_TUMOR = CATEGORIES.index('No Tumor')
+GLIOMA = CATEGORIES.index('Glioma')
+
+
+@pytest.fixture
+def app_config(tmp_path):
+    return {'UPLOAD_FOLDER': str(tmp_path / 'uploads')}
+
+
+def _nifti(path, volume, endian='<', slope=0.0, intercept=0.0, compress=False, trailing=b''):
+    """Write a single-file NIfTI-1 volume (int16 voxels, x fastest), optionally followed by `trailing` bytes."""
+    header = bytearray(352)
+    struct.pack_into(endian + 'i', header, 0, 348)
+    struct.pack_into(endian + '8h', header, 40, 3, *volume.shape, 1, 1, 1, 1)
+    struct.pack_into(endian + '2h', header, 70, 4, 16)
+    struct.pack_into(endian + '8f', header, 76, 1.0, 1.0, 1.0, 2.5, 0, 0, 0, 0)
+    struct.pack_into(endian + '3f', header, 108, 352.0, slope, intercept)
+    header[344:348] = b'n+1\x00'
+    data = bytes(header) + volume.astype(endian + 'i2').tobytes(order='F') + trailing
+    if compress:
+        data = gzip.compress(data)
+    path.write_bytes(data)
+    return str(path)
+
+
+def _phantom(slices=20, tumor=range(8, 12)):
+    """Head-like phantom: blank slices at both ends, a bright 'lesion' on the tumor slices."""
+    volume = np.zeros((64, 48, slices), dtype=np.int16)
+    volume[8:56, 8:40, 2:slices - 2] = 400
+    for z in tumor:
+        volume[28:36, 20:28, z] = 1000
+    return volume
+
+
+def _lesion_classifier(batch):
+    """Fake model: 'Glioma' when the slice has a saturated lesion, else 'No Tumor'."""
+    lesion = (batch.max(axis=(1, 2, 3)) > 0.99).astype(np.float32)
+    probabilities = np.zeros((len(batch), len(CATEGORIES)), dtype=np.float32)
+    probabilities[:, GLIOMA] = 0.1 + 0.8 * lesion
+    probabilities[:, NO_TUMOR] = 0.9 - 0.8 * lesion
+    return probabilities
+
+
+@pytest.mark.parametrize('endian,compress', [('<', False), ('>', False), ('<', True)])
+def test_nifti_is_memory_mapped_slice_by_slice(tmp_path, endian, compress):
+    source = _phantom()
+    volume = open_volume(_nifti(tmp_path / 'scan.nii', source, endian, compress=compress))
+    try:
+        assert len(volume) == 20 and volume.shape == (64, 48, 20)
+        assert volume.spacing == (1.0, 1.0, 2.5)
+        axial = volume.slice(9)
+        assert axial.shape == (48, 64)  # rows = y, columns = x
+        np.testing.assert_array_equal(axial, np.flipud(source[:, :, 9].T).astype(np.float32))
+    finally:
+        volume.close()
+
+
+def test_header_scaling_and_rejections(tmp_path):
+    path = _nifti(tmp_path / 'scaled.nii', _phantom(), slope=2.0, intercept=-10.0)
+    volume = open_volume(path)
+    assert volume.slice(5).max() == 400 * 2.0 - 10.0
+    volume.close()
+
+    with open(path, 'rb') as f:
+        assert read_nifti_header(f.read(348))['offset'] == 352
+    (tmp_path / 'notes.txt').write_bytes(b'not a volume' * 40)
+    with pytest.raises(VolumeUnsupported):
+        open_volume(str(tmp_path / 'notes.txt'))
+
+
+@pytest.mark.parametrize('fmt,position,values', [
+    ('4h', 40, (3, 64, 64, 0)),   # no slices
+    ('4h', 40, (3, 64, -2, 4)),   # negative extent
+    ('f', 108, (0.0,)),           # voxels overlapping the header
+])
+def test_invalid_dimensions_and_offsets_are_rejected(tmp_path, fmt, position, values):
+    raw = bytearray(open(_nifti(tmp_path / 'scan.nii', _phantom()), 'rb').read(348))
+    struct.pack_into('<' + fmt, raw, position, *values)
+    with pytest.raises(VolumeUnsupported, match='Invalid NIfTI'):
+        read_nifti_header(bytes(raw))
+
+
+@pytest.fixture
+def temporary_dir(tmp_path, monkeypatch):
+    directory = tmp_path / 'tmp'
+    directory.mkdir()
+    monkeypatch.setattr(tempfile, 'tempdir', str(directory))
+    return directory
+
+
+def test_gzip_is_decompressed_only_as_far_as_the_header_needs(tmp_path, temporary_dir):
+    # A small volume followed by 64 MB of zeros that compress to almost nothing
+    path = _nifti(tmp_path / 'scan.nii.gz', _phantom(), compress=True, trailing=bytes(64 << 20))
+    volume = open_volume(path, max_bytes=1 << 20)
+    try:
+        assert os.path.getsize(volume._temporary) == 352 + 64 * 48 * 20 * 2
+    finally:
+        volume.close()
+    assert os.listdir(temporary_dir) == []
+
+    with pytest.raises(VolumeUnsupported, match='uncompressed'):
+        open_volume(path, max_bytes=64 * 1024)
+    truncated = tmp_path / 'truncated.nii.gz'
+    truncated.write_bytes(gzip.compress(open(path, 'rb').read()[:200]))
+    with pytest.raises(VolumeUnsupported):
+        open_volume(str(truncated))
+    assert os.listdir(temporary_dir) == []  # nothing is left behind by the failed opens
+
+
+def test_rejected_volume_is_collected(client, monkeypatch):
+    monkeypatch.setattr('app.route.get_serving_model', lambda: None)
+    response = client.post('/predict/volume', data={'file': (io.BytesIO(b'not a volume'), 'notes.nii'),
+                                                    'name': 'Jane', 'age': '40', 'gender': 'Female',
+                                                    'diagnosis_date': '2024-01-01'},
+                           content_type='multipart/form-data')
+
+    assert response.status_code == 415
+    stored = StoredFile.query.one()
+    assert stored.ref_count == 0 and os.path.exists(stored.path)
+    assert collect_garbage(grace_seconds=0)['files'] == 1
+    assert not os.path.exists(stored.path)
+
+
+def test_window_slice():
+    pixels = np.array([[-100.0, 0.0], [50.0, 1000.0]])
+    np.testing.assert_array_equal(window_slice(pixels, center=50, width=100), [[0, 0], [127, 255]])
+
+
+def test_predict_volume_batches_slices_and_aggregates(tmp_path):
+    volume = open_volume(_nifti(tmp_path / 'scan.nii', _phantom()))
+    calls = []
+
+    def predict(batch):
+        calls.append(len(batch))
+        return _lesion_classifier(batch)
+
+    try:
+        result = predict_volume(volume, predict, batch_size=6, window=(500, 1000), min_tumor_fraction=0.1)
+        png = render_slice(volume, result['study']['key_slice'], result['window'])
+    finally:
+        volume.close()
+
+    assert result['slices'] == 20 and result['scored_slices'] == 16  # 2 blank slices at each end
+    assert calls == [6, 6, 4]
+    assert result['study']['prediction'] == 'Glioma'
+    assert result['study']['key_slice'] in range(8, 12)
+    assert result['study']['tumor_slice_fraction'] == 0.25
+    assert png.startswith(b'\x89PNG')
+
+
+def test_aggregate_ignores_isolated_tumor_slices():
+    probabilities = np.tile(np.array([0.05, 0.05, 0.85, 0.05], dtype=np.float32), (40, 1))
+    probabilities[3] = [0.7, 0.1, 0.1, 0.1]
+    study = aggregate_slices(probabilities, min_tumor_fraction=0.1)
+    assert study['prediction'] == 'No Tumor'
+    assert aggregate_slices(probabilities, min_tumor_fraction=0.02)['prediction'] == 'Glioma'